@@ -2,12 +2,13 @@ import time
 
 from flask import Flask, g
 from config import Config
-from models.database import close_db, ensure_db_exists
-from routes import main_bp, people_bp, attendance_bp, face_bp
+from models.database import close_db, ensure_db_exists, PoolTimeoutError
+from routes import main_bp, people_bp, attendance_bp, face_bp, storage_bp
 from routes.tasks_routes import bp as tasks_bp
 from routes.health_routes import health_bp
 from services.async_task_service import AsyncTaskService
 from services.faiss_index_service import FaissIndexService
+from services.upload_service import UploadService
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -29,6 +30,7 @@ def create_app(config_class=Config):
     app.register_blueprint(face_bp)
     app.register_blueprint(tasks_bp)
     app.register_blueprint(health_bp)
+    app.register_blueprint(storage_bp)
 
     @app.errorhandler(400)
     def bad_request(e):
@@ -42,6 +44,10 @@ def create_app(config_class=Config):
     def conflict(e):
         return (str(e.description if hasattr(e, "description") else e)), 409
 
+    @app.errorhandler(PoolTimeoutError)
+    def database_busy(e):
+        return ("Database busy, please retry", 503, {"Retry-After": "1"})
+
     @app.errorhandler(500)
     def server_error(e):
         return ("Server Error", 500)
@@ -49,7 +55,8 @@ def create_app(config_class=Config):
     return app
 
 ensure_db_exists()
-AsyncTaskService.initialize(max_workers=3)
+AsyncTaskService.initialize(max_workers=Config.TASK_MAX_WORKERS)
+UploadService.initialize()
 
 app = create_app()
 
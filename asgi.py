@@ -0,0 +1,58 @@
+"""ASGI entry point for SERVER_MODE=asgi.
+
+Usage:
+    gunicorn -k uvicorn_worker.UvicornWorker --workers 2 asgi:app
+    uvicorn asgi:app --port 8080
+
+The routes in routes/async_routes.py (health, task status and long polls,
+people reads) run as coroutines on the event loop with an asyncpg pool, so
+a waiting request holds no thread. Every other request goes to the Flask
+app, unchanged, on one of two thread pools: face recognition (/api/face and
+people enrollment) gets its own ASGI_FACE_WORKERS threads, so a burst of
+embeddings cannot take the threads the other Flask routes run on.
+"""
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Match
+from app import app as flask_app
+from config import Config
+from models.async_database import close_async_pool, init_async_pool
+from routes.async_routes import async_routes
+
+_io_app = WSGIMiddleware(flask_app, workers=Config.ASGI_IO_WORKERS)
+_face_app = WSGIMiddleware(flask_app, workers=Config.ASGI_FACE_WORKERS)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    await init_async_pool()
+    try:
+        yield
+    finally:
+        await close_async_pool()
+
+
+_native_app = Starlette(routes=async_routes, lifespan=lifespan)
+
+
+def _is_native(scope) -> bool:
+    return any(route.matches(scope)[0] == Match.FULL for route in async_routes)
+
+
+def _is_face_work(scope) -> bool:
+    path = scope["path"]
+    if path.startswith("/api/face/"):
+        return True
+    # Creating or updating a person computes the embedding of the uploaded photo
+    return path.startswith("/api/people") and scope["method"] in ("POST", "PUT")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and not _is_native(scope):
+        wsgi_app = _face_app if _is_face_work(scope) else _io_app
+        await wsgi_app(scope, receive, send)
+    else:
+        # Lifespan events and the native routes
+        await _native_app(scope, receive, send)
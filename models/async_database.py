@@ -0,0 +1,87 @@
+import asyncio
+import asyncpg
+
+from contextlib import asynccontextmanager
+from typing import Optional
+from config import Config
+from models.database import mark_replica_down, replica_available, replica_status
+
+# asyncpg pools for the native routes of the ASGI app, one per worker process,
+# opened and closed by the app's lifespan. The replica pool exists only with
+# DATABASE_REPLICA_URL and is used while database.replica_available() says so
+_async_pool: Optional[asyncpg.Pool] = None
+_async_replica_pool: Optional[asyncpg.Pool] = None
+
+
+async def init_async_pool():
+    global _async_pool, _async_replica_pool
+    if _async_pool is None:
+        _async_pool = await asyncpg.create_pool(
+            Config.DATABASE_URL,
+            min_size=Config.ASYNC_DB_POOL_MIN_SIZE,
+            max_size=Config.ASYNC_DB_POOL_MAX_SIZE,
+            server_settings={"statement_timeout": str(Config.DB_STATEMENT_TIMEOUT_MS)}
+        )
+    if Config.DATABASE_REPLICA_URL and _async_replica_pool is None:
+        # min_size=0: an unreachable replica must not fail startup
+        _async_replica_pool = await asyncpg.create_pool(
+            Config.DATABASE_REPLICA_URL,
+            min_size=0,
+            max_size=Config.ASYNC_DB_POOL_MAX_SIZE,
+            timeout=Config.DB_REPLICA_CONNECT_TIMEOUT_SECONDS,
+            server_settings={
+                "statement_timeout": str(Config.DB_READONLY_STATEMENT_TIMEOUT_MS),
+                "default_transaction_read_only": "on",
+            }
+        )
+
+
+async def close_async_pool():
+    global _async_pool, _async_replica_pool
+    for pool in (_async_pool, _async_replica_pool):
+        if pool is not None:
+            await pool.close()
+    _async_pool = None
+    _async_replica_pool = None
+
+
+def get_async_pool() -> asyncpg.Pool:
+    if _async_pool is None:
+        raise RuntimeError("Async database pool is not initialized; it is opened by the ASGI lifespan")
+    return _async_pool
+
+
+async def _replica_usable() -> bool:
+    if _async_replica_pool is None:
+        return False
+    usable = replica_status()
+    if usable is None:
+        # Due for a check, which connects to the replica: not on the event loop
+        usable = await asyncio.to_thread(replica_available)
+    return usable
+
+
+@asynccontextmanager
+async def acquire_async(replica: bool = False):
+    """Check out a connection, waiting at most DB_POOL_TIMEOUT_SECONDS (raises asyncio.TimeoutError)
+
+    replica=True is for reads that tolerate replica lag, as in @readonly_db
+    routes: they go to the replica while it is usable, else to the primary.
+    """
+    pool = get_async_pool()
+    conn = None
+    if replica and await _replica_usable():
+        try:
+            conn = await _async_replica_pool.acquire(timeout=Config.DB_POOL_TIMEOUT_SECONDS)
+            pool = _async_replica_pool
+        except asyncio.TimeoutError:
+            # Busy rather than down
+            pass
+        except (OSError, asyncpg.PostgresError) as e:
+            mark_replica_down(e)
+    if conn is None:
+        conn = await pool.acquire(timeout=Config.DB_POOL_TIMEOUT_SECONDS)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
@@ -1,68 +1,450 @@
+import re
+import time
+import functools
+import threading
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 import psycopg2.pool
 
+from collections import deque
+from datetime import datetime, timedelta
 from flask import g, current_app
-from typing import Optional
+from typing import List, Optional, Tuple
 from config import Config
+from utils.helpers import TAIPEI_TZ
+from utils.metrics import LatencyHistogram
 
-# Connection pool for PostgreSQL
+# Connection pool for PostgreSQL, created lazily in each worker process
 _connection_pool = None
+_pool_lock = threading.Lock()
 
-def init_pool(database_url: str, minconn: int = 1, maxconn: int = 20):
+# Pool for DATABASE_REPLICA_URL and the result of the last lag check, shared
+# by the threads of a worker process
+_replica_pool = None
+_replica_state = {"checked_at": None, "usable": False, "lag_seconds": None, "error": None}
+_replica_check_lock = threading.Lock()
+
+# Seconds the replica is behind: 0 once it has replayed everything it has
+# received (after a restart the receive position restarts at a segment
+# boundary behind replay), else the age of the last replayed transaction.
+# NULL (not usable) when nothing was replayed yet. A server not in recovery
+# is not lagging.
+REPLICA_LAG_SQL = (
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8 END"
+)
+
+# Hot statements prepared once per connection and run with EXECUTE, so the
+# server skips parse/plan on every call. Parameters use $n placeholders.
+PREPARED_STATEMENTS = {
+    "insert_punch": (
+        "INSERT INTO attendance (ident, punch_time, image_url, created_at) "
+        "VALUES ($1, $2, $3, $4) RETURNING id"
+    ),
+    # Inserts unless the ident punched within the last $3 seconds; returns
+    # the new row (inserted = true) or the earlier one (inserted = false)
+    "insert_punch_debounced": (
+        "WITH recent AS ("
+        " SELECT id, punch_time FROM attendance"
+        " WHERE ident = $1::varchar AND punch_time > $2::timestamptz - $3::int * INTERVAL '1 second'"
+        " ORDER BY punch_time DESC LIMIT 1"
+        "), inserted AS ("
+        " INSERT INTO attendance (ident, punch_time, image_url, created_at)"
+        " SELECT $1::varchar, $2::timestamptz, NULL, $2::timestamptz"
+        " WHERE NOT EXISTS (SELECT 1 FROM recent)"
+        " RETURNING id, punch_time"
+        ") "
+        "SELECT id, punch_time, TRUE AS inserted FROM inserted "
+        "UNION ALL SELECT id, punch_time, FALSE AS inserted FROM recent"
+    ),
+    # Columns are listed: with SELECT * any ALTER TABLE people would fail every
+    # pooled connection's prepared plan with "cached plan must not change result type"
+    "get_person": (
+        "SELECT ident, face_embedding, time_zone, created_at, updated_at "
+        "FROM people WHERE ident = $1"
+    ),
+    "get_person_metadata": (
+        "SELECT ident, time_zone, created_at, updated_at, face_embedding IS NOT NULL AS has_embedding "
+        "FROM people WHERE ident = $1"
+    ),
+}
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers its prepared statements and session mode"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.readonly_session = False
+        self.statement_timeout_ms = Config.DB_STATEMENT_TIMEOUT_MS
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Raised when no connection frees up within DB_POOL_TIMEOUT_SECONDS"""
+
+class ConnectionPool:
+    """Bounded, thread-safe connection pool with blocking checkout and validation"""
+    # Connections idle for longer than validate_after_seconds are pinged on
+    # checkout, and broken or mid-transaction connections are discarded or
+    # rolled back when returned, so a server restart does not poison the pool
+    def __init__(self, dsn: str, minconn: int, maxconn: int, timeout: float,
+                 validate_after_seconds: float, **connect_kwargs):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validate_after_seconds = validate_after_seconds
+        self.connect_kwargs = connect_kwargs
+        
+        self._idle = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._wait_time = LatencyHistogram()
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connect_errors": 0,
+            "validation_failures": 0,
+            "discarded": 0
+        }
+        
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+    
+    def _connect(self):
+        return psycopg2.connect(self.dsn, connection_factory=PreparingConnection, **self.connect_kwargs)
+    
+    def _is_usable(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.validate_after_seconds:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._counters["discarded"] += 1
+            self._available.notify()
+    
+    def getconn(self):
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._available:
+                while not self._idle and self._size >= self.maxconn:
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.timeout}s "
+                            f"({self._size} in use)"
+                        )
+                    self._available.wait(remaining)
+                
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    self._size += 1
+            
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._lock:
+                        self._size -= 1
+                        self._counters["connect_errors"] += 1
+                        self._available.notify()
+                    raise
+            elif not self._is_usable(conn, idle_since):
+                with self._lock:
+                    self._counters["validation_failures"] += 1
+                self._discard(conn)
+                continue
+            
+            wait_ms = (time.monotonic() - started) * 1000
+            self._wait_time.observe(wait_ms)
+            with self._lock:
+                self._counters["checkouts"] += 1
+                self._counters["waits"] += 1 if waited else 0
+            return conn
+    
+    def putconn(self, conn):
+        if not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                conn.close()
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.close()
+        
+        if conn.closed:
+            self._discard(conn)
+            return
+        
+        with self._available:
+            # LIFO keeps hot connections hot and lets spares go idle
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+    
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._size -= 1
+    
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+        stats["max_size"] = self.maxconn
+        stats["wait_ms"] = self._wait_time.to_dict()
+        return stats
+
+def pool_size_for_process() -> int:
+    """Threads in this process that can hold a connection at once"""
+    if Config.DB_POOL_MAX_SIZE > 0:
+        return Config.DB_POOL_MAX_SIZE
+    # Request threads plus background task and upload workers, plus one
+    # spare for health checks. In asgi mode Flask runs on the two WSGI pools
+    if Config.SERVER_MODE == "asgi":
+        request_threads = Config.ASGI_IO_WORKERS + Config.ASGI_FACE_WORKERS
+    else:
+        request_threads = Config.GUNICORN_THREADS
+    wanted = request_threads + Config.TASK_MAX_WORKERS + Config.UPLOAD_MAX_WORKERS + 1
+    if Config.DB_MAX_CONNECTIONS <= 0:
+        return wanted
+    
+    # The process's share of DB_MAX_CONNECTIONS, less the connections it
+    # holds outside this pool
+    budget = Config.DB_MAX_CONNECTIONS // max(1, Config.WEB_CONCURRENCY)
+    if Config.PEOPLE_CACHE_LISTEN:
+        budget -= 1
+    if Config.SERVER_MODE == "asgi":
+        budget -= Config.ASYNC_DB_POOL_MAX_SIZE
+    if budget < wanted:
+        print(f"[DB] Pool capped at {max(budget, 2)} of {wanted} threads by DB_MAX_CONNECTIONS")
+    return max(2, min(wanted, budget))
+
+def init_pool(database_url: str, minconn: int = 1, maxconn: Optional[int] = None):
     """Initialize the PostgreSQL connection pool"""
     global _connection_pool
     if _connection_pool is None:
-        try:
-            _connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=minconn,
-                maxconn=maxconn,
-                dsn=database_url
-            )
-        except Exception as e:
-            raise
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = ConnectionPool(
+                    database_url,
+                    minconn=minconn,
+                    maxconn=maxconn or pool_size_for_process(),
+                    timeout=Config.DB_POOL_TIMEOUT_SECONDS,
+                    validate_after_seconds=Config.DB_POOL_VALIDATE_AFTER_SECONDS,
+                    options=f"-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}"
+                )
 
-class DatabaseCursor:
-    """Cursor wrapper for database operations"""
-    def __init__(self, cursor):
-        self.cursor = cursor
-        self.rowcount = 0
+def get_pool_stats() -> Optional[dict]:
+    if _connection_pool is None:
+        return None
+    return _connection_pool.get_stats()
+
+def _get_replica_pool() -> ConnectionPool:
+    global _replica_pool
+    if _replica_pool is None:
+        with _pool_lock:
+            if _replica_pool is None:
+                # minconn=0: an unreachable replica must not fail startup
+                _replica_pool = ConnectionPool(
+                    Config.DATABASE_REPLICA_URL,
+                    minconn=0,
+                    maxconn=pool_size_for_process(),
+                    timeout=Config.DB_POOL_TIMEOUT_SECONDS,
+                    validate_after_seconds=Config.DB_POOL_VALIDATE_AFTER_SECONDS,
+                    connect_timeout=Config.DB_REPLICA_CONNECT_TIMEOUT_SECONDS,
+                    options=f"-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}"
+                )
+    return _replica_pool
+
+def mark_replica_down(error: Exception):
+    message = (str(error).strip().splitlines() or [type(error).__name__])[0]
+    if _replica_state["usable"] or _replica_state["error"] is None:
+        print(f"[DB] Replica unavailable, reading from the primary: {message}")
+    _replica_state.update(checked_at=time.monotonic(), usable=False, lag_seconds=None, error=message)
+
+def _check_replica():
+    pool = _get_replica_pool()
+    try:
+        conn = pool.getconn()
+    except PoolTimeoutError:
+        # Busy rather than down; keep the last result and check again next time
+        return
+    except psycopg2.Error as e:
+        mark_replica_down(e)
+        return
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+        if not conn.autocommit:
+            conn.rollback()
+    except psycopg2.Error as e:
+        conn.close()
+        mark_replica_down(e)
+        return
+    finally:
+        pool.putconn(conn)
+
+    usable = lag is not None and lag <= Config.DB_REPLICA_MAX_LAG_SECONDS
+    if usable != _replica_state["usable"]:
+        state = "within" if usable else "over"
+        print(f"[DB] Replica lag {lag}s is {state} {Config.DB_REPLICA_MAX_LAG_SECONDS}s")
+    _replica_state.update(checked_at=time.monotonic(), usable=usable, lag_seconds=lag, error=None)
+
+def replica_available() -> bool:
+    """Whether reads may go to the replica, rechecked every DB_REPLICA_CHECK_SECONDS"""
+    if not Config.DATABASE_REPLICA_URL:
+        return False
+    checked_at = _replica_state["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at >= Config.DB_REPLICA_CHECK_SECONDS:
+        # One thread checks; the others go by the previous result meanwhile
+        if _replica_check_lock.acquire(blocking=checked_at is None):
+            try:
+                checked_at = _replica_state["checked_at"]
+                if checked_at is None or time.monotonic() - checked_at >= Config.DB_REPLICA_CHECK_SECONDS:
+                    _check_replica()
+            finally:
+                _replica_check_lock.release()
+    return _replica_state["usable"]
+
+def replica_status() -> Optional[bool]:
+    """replica_available() while its last check is fresh; None when a check is due (never checks)"""
+    if not Config.DATABASE_REPLICA_URL:
+        return False
+    checked_at = _replica_state["checked_at"]
+    if checked_at is None or time.monotonic() - checked_at >= Config.DB_REPLICA_CHECK_SECONDS:
+        return None
+    return _replica_state["usable"]
+
+def get_replica_stats() -> Optional[dict]:
+    """Replica routing state for readiness; None when no replica is configured"""
+    if not Config.DATABASE_REPLICA_URL:
+        return None
+    replica_available()
+    stats = {
+        "usable": _replica_state["usable"],
+        "lag_seconds": _replica_state["lag_seconds"],
+        "max_lag_seconds": Config.DB_REPLICA_MAX_LAG_SECONDS,
+        "error": _replica_state["error"],
+    }
+    if _replica_pool is not None:
+        stats["pool"] = _replica_pool.get_stats()
+    return stats
+
+@functools.lru_cache(maxsize=1024)
+def translate_query(query: str) -> str:
+    """Convert ? placeholders to %s outside quoted literals, identifiers and comments (cached)"""
+    if '?' not in query and 'last_insert_rowid' not in query.lower():
+        return query
     
-    def fetchone(self):
-        """Fetch one result"""
-        return self.cursor.fetchone()
+    # Handle last_insert_rowid() - PostgreSQL uses RETURNING or currval
+    if 'last_insert_rowid()' in query.lower():
+        return 'SELECT lastval()'
     
-    def fetchall(self):
-        """Fetch all results"""
-        return self.cursor.fetchall()
+    parts = []
+    i = 0
+    length = len(query)
+    while i < length:
+        ch = query[i]
+        if ch in ("'", '"'):
+            end = i + 1
+            while end < length:
+                if query[end] == ch:
+                    # A doubled quote is an escaped quote inside the literal
+                    if end + 1 < length and query[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            parts.append(query[i:end + 1])
+            i = end + 1
+        elif query.startswith('--', i):
+            end = query.find('\n', i)
+            end = length if end == -1 else end
+            parts.append(query[i:end])
+            i = end
+        elif query.startswith('/*', i):
+            end = query.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            parts.append(query[i:end])
+            i = end
+        elif ch == '?':
+            parts.append('%s')
+            i += 1
+        else:
+            parts.append(ch)
+            i += 1
+    return ''.join(parts)
 
 class DatabaseConnection:
     """Wrapper for PostgreSQL database operations"""
-    def __init__(self, conn, cursor):
+    def __init__(self, conn, cursor, pool=None):
         self.conn = conn
         self.cursor = cursor
-        self._last_cursor = None
+        self.pool = pool
+        self._tuple_cursor = None
     
     def execute(self, query: str, params=None):
-        """Execute query with parameter placeholders"""
-        # Convert ? placeholders to PostgreSQL %s format
-        pg_query = query.replace('?', '%s')
-        
-        # Handle last_insert_rowid() - PostgreSQL uses RETURNING or currval
-        if 'last_insert_rowid()' in pg_query.lower():
-            # Return the last inserted ID from the previous INSERT
-            pg_query = 'SELECT lastval()'
-        
+        """Execute query with parameter placeholders; returns the cursor"""
         if params:
-            self.cursor.execute(pg_query, params)
+            self.cursor.execute(translate_query(query), params)
         else:
-            self.cursor.execute(pg_query)
+            self.cursor.execute(translate_query(query))
+        return self.cursor
+    
+    def execute_tuples(self, query: str, params=None):
+        """Execute query on a plain cursor whose rows are tuples, for bulk reads"""
+        if self._tuple_cursor is None:
+            self._tuple_cursor = self.conn.cursor()
+        self._tuple_cursor.execute(translate_query(query), params or None)
+        return self._tuple_cursor
+    
+    def execute_prepared(self, name: str, params=(), advisory_lock: Optional[str] = None):
+        """Execute one of PREPARED_STATEMENTS, preparing it on first use per connection"""
+        prepared = self.conn.prepared
+        if name not in prepared:
+            self.cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+            prepared.add(name)
         
-        # Wrap cursor for compatibility
-        wrapped_cursor = DatabaseCursor(self.cursor)
-        wrapped_cursor.rowcount = self.cursor.rowcount
-        self._last_cursor = wrapped_cursor
-        return wrapped_cursor
+        query = f"EXECUTE {name}"
+        params = list(params)
+        if params:
+            query += " (" + ", ".join(["%s"] * len(params)) + ")"
+        if advisory_lock is not None:
+            # Sent in the same round trip; as a separate statement the EXECUTE
+            # gets a fresh snapshot taken after the lock is granted
+            query = f"SELECT pg_advisory_xact_lock(hashtext(%s)); {query}"
+            params.insert(0, advisory_lock)
+        self.cursor.execute(query, params or None)
+        return self.cursor
     
     def commit(self):
         """Commit the transaction"""
@@ -75,12 +457,81 @@ class DatabaseConnection:
     def close(self):
         """Close cursor and return connection to pool"""
         self.cursor.close()
-        if _connection_pool is not None:
-            _connection_pool.putconn(self.conn)
+        if self._tuple_cursor is not None:
+            self._tuple_cursor.close()
+        pool = self.pool or _connection_pool
+        if pool is not None:
+            pool.putconn(self.conn)
 
-def get_db():
-    """Get a PostgreSQL connection from the pool with dict-like row factory"""
+def readonly_db(view):
+    """Mark a route as read-only: its connection runs in autocommit, read-only mode, on the replica if usable"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_readonly = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def _set_session_mode(conn, readonly: bool, statement_timeout_ms: int):
+    # Session settings survive in the pool, so only switch when the mode changes
+    if conn.readonly_session == readonly and conn.statement_timeout_ms == statement_timeout_ms:
+        return
+    if readonly:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY; "
+                f"SET statement_timeout = {statement_timeout_ms}"
+            )
+    else:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SET SESSION CHARACTERISTICS AS TRANSACTION READ WRITE; "
+                f"SET statement_timeout = {statement_timeout_ms}"
+            )
+        conn.autocommit = False
+    conn.readonly_session = readonly
+    conn.statement_timeout_ms = statement_timeout_ms
+
+def _checkout(pool: ConnectionPool, readonly: bool, statement_timeout_ms: int) -> DatabaseConnection:
+    # Get connection from pool, waiting up to DB_POOL_TIMEOUT_SECONDS
+    conn = pool.getconn()
+    try:
+        # Read-only connections run in autocommit; everything else needs explicit commits
+        _set_session_mode(conn, readonly, statement_timeout_ms)
+    except psycopg2.Error:
+        pool.putconn(conn)
+        raise
+    
+    # Use RealDictCursor for dict-like row access
+    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    return DatabaseConnection(conn, cursor, pool)
+
+def _checkout_replica(statement_timeout_ms: int) -> Optional[DatabaseConnection]:
+    """A read-only replica connection, or None when reads should go to the primary"""
+    if not replica_available():
+        return None
+    try:
+        return _checkout(_get_replica_pool(), True, statement_timeout_ms)
+    except PoolTimeoutError:
+        return None
+    except psycopg2.Error as e:
+        mark_replica_down(e)
+        return None
+
+def get_db(replica: bool = True):
+    """Get a PostgreSQL connection from the pool with dict-like row factory
+
+    In @readonly_db routes this is a replica connection when one is usable;
+    replica=False keeps the request on the primary.
+    """
     if "db" not in g:
+        readonly = g.get("db_readonly", False)
+        if readonly and replica:
+            db = _checkout_replica(Config.DB_READONLY_STATEMENT_TIMEOUT_MS)
+            if db is not None:
+                g.db = db
+                return g.db
+        
         try:
             database_url = current_app.config.get("DATABASE_URL", Config.DATABASE_URL)
         except RuntimeError:
@@ -90,56 +541,224 @@ def get_db():
         if _connection_pool is None:
             init_pool(database_url)
         
-        # Get connection from pool
-        conn = _connection_pool.getconn()
-        # Use RealDictCursor for dict-like row access
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        
-        # Set autocommit off (explicit commits required)
-        conn.autocommit = False
-        
-        # Wrap in DatabaseConnection
-        g.db = DatabaseConnection(conn, cursor)
+        timeout_ms = Config.DB_READONLY_STATEMENT_TIMEOUT_MS if readonly else Config.DB_STATEMENT_TIMEOUT_MS
+        g.db = _checkout(_connection_pool, readonly, timeout_ms)
         
     return g.db
 
+def get_read_db():
+    """Connection for short reads that tolerate replica lag: index builds, reports
+
+    Runs on the replica when one is usable, with the regular statement
+    timeout. Once the request holds its get_db() connection, reads use that
+    one, so they see the request's own writes.
+    """
+    if "db" in g:
+        return g.db
+    if "read_db" not in g:
+        db = _checkout_replica(Config.DB_STATEMENT_TIMEOUT_MS)
+        if db is None:
+            return get_db()
+        g.read_db = db
+    return g.read_db
+
 def close_db(_exc):
-    """Return connection to pool and close cursor"""
-    db = g.pop("db", None)
-    
-    if db is not None:
-        db.close()
+    """Return connections to their pools and close cursors"""
+    for key in ("db", "read_db"):
+        db = g.pop(key, None)
+        
+        if db is not None:
+            db.close()
+
+ATTENDANCE_DEFAULT_PARTITION = "attendance_default"
+
+def _acquire_schema_lock(conn):
+    # Workers start together; poll for the lock rather than block on it,
+    # because a waiting statement would hold a snapshot the other
+    # worker's concurrent index build has to wait out
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            while True:
+                cursor.execute("SELECT pg_try_advisory_lock(hashtext('attendance_schema'))")
+                if cursor.fetchone()[0]:
+                    return
+                time.sleep(1)
+    finally:
+        conn.autocommit = False
+
+def _release_schema_lock(conn):
+    conn.rollback()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(hashtext('attendance_schema'))")
+    conn.commit()
+
+def _relkind(cursor, name: str) -> Optional[str]:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
 
-def _create_schema(cursor):
-    """Create database schema"""
-    SCHEMA_SQL = """
-    -- PostgreSQL Schema for Attendance System
+def _index_is_valid(cursor, name: str) -> Optional[bool]:
+    cursor.execute(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %s",
+        (name,)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _run_ddl(conn, statements, attempts: int = 5) -> bool:
+    """Run DDL in one transaction under ATTENDANCE_DDL_LOCK_TIMEOUT_MS, retrying on lock timeouts"""
+    # A DDL statement queued behind a long query blocks every punch queued
+    # behind it, so give up quickly and retry instead of waiting
+    for attempt in range(attempts):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL lock_timeout = %s", (f"{Config.ATTENDANCE_DDL_LOCK_TIMEOUT_MS}ms",))
+                for statement in statements:
+                    if isinstance(statement, tuple):
+                        cursor.execute(*statement)
+                    else:
+                        cursor.execute(statement)
+            conn.commit()
+            return True
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            time.sleep(attempt + 1)
+    return False
+
+def _month_start(value) -> datetime:
+    return datetime(value.year, value.month, 1, tzinfo=TAIPEI_TZ)
+
+def _next_month(value: datetime) -> datetime:
+    return _month_start(value.replace(day=28) + timedelta(days=4))
+
+def _parse_bound(value: str) -> Optional[datetime]:
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+def list_attendance_partitions(cursor) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """(name, lower, upper) per attendance partition; None means unbounded or the default partition"""
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('attendance') ORDER BY c.relname"
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = re.match(r"FOR VALUES FROM \((.+)\) TO \((.+)\)", bound)
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+        else:
+            partitions.append((name, None, None))
+    return partitions
+
+def _partition_ddl(conn, name: str, bounds: Tuple[str, str], has_default: bool) -> list:
+    # CREATE ... PARTITION OF would lock the parent against punches;
+    # attaching an empty table only needs SHARE UPDATE EXCLUSIVE
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {name} (LIKE attendance INCLUDING DEFAULTS)",
+        (f"ALTER TABLE attendance ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds),
+    ]
+    if has_default:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {ATTENDANCE_DEFAULT_PARTITION} "
+                "WHERE punch_time >= %s AND punch_time < %s)",
+                bounds
+            )
+            overlaps = cursor.fetchone()[0]
+        conn.commit()
+        if overlaps:
+            # The attach would fail its check against rows the default
+            # partition caught for this month; move them over first, with the
+            # default detached so the new range can be attached at all
+            move = (
+                f"WITH moved AS (DELETE FROM {ATTENDANCE_DEFAULT_PARTITION} "
+                "WHERE punch_time >= %s AND punch_time < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            )
+            statements = [
+                f"ALTER TABLE attendance DETACH PARTITION {ATTENDANCE_DEFAULT_PARTITION}",
+                statements[0],
+                (move, bounds),
+                statements[1],
+                f"ALTER TABLE attendance ATTACH PARTITION {ATTENDANCE_DEFAULT_PARTITION} DEFAULT",
+            ]
+    return statements
+
+def ensure_attendance_partitions(conn, months_ahead: Optional[int] = None) -> List[str]:
+    """Create monthly attendance partitions through months_ahead and the default partition"""
+    months_ahead = Config.ATTENDANCE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    with conn.cursor() as cursor:
+        partitions = list_attendance_partitions(cursor)
+    conn.commit()
     
-    CREATE TABLE IF NOT EXISTS people (
-        ident               VARCHAR(255) PRIMARY KEY,
-        face_embedding      BYTEA,
-        time_zone           VARCHAR(100) DEFAULT 'Asia/Taipei',
-        created_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-        updated_at          TIMESTAMPTZ NOT NULL DEFAULT NOW()
-    );
+    ranges = [(lower, upper) for name, lower, upper in partitions if name != ATTENDANCE_DEFAULT_PARTITION]
+    has_default = any(name == ATTENDANCE_DEFAULT_PARTITION for name, _, _ in partitions)
+    created = []
+    month = _month_start(datetime.now(TAIPEI_TZ))
+    for _ in range(months_ahead + 1):
+        end = _next_month(month)
+        covered = any(
+            (lower is None or lower < end) and (upper is None or upper > month)
+            for lower, upper in ranges
+        )
+        if not covered:
+            name = f"attendance_p{month:%Y%m}"
+            bounds = (month.isoformat(), end.isoformat())
+            try:
+                if _run_ddl(conn, _partition_ddl(conn, name, bounds, has_default)):
+                    created.append(name)
+                else:
+                    print(f"[DB] Could not attach partition {name}: lock timeout")
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"[DB] Could not attach partition {name}: {e}")
+        month = end
     
-    CREATE TABLE IF NOT EXISTS attendance (
-        id                  SERIAL PRIMARY KEY,
-        ident               VARCHAR(255) NOT NULL,
-        punch_time          TIMESTAMPTZ NOT NULL,
-        image_url           TEXT,
-        created_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-        FOREIGN KEY (ident) REFERENCES people(ident) ON DELETE CASCADE
-    );
+    if not has_default:
+        # Catches punches outside every monthly range (e.g. late offline syncs)
+        # instead of failing them; it should stay empty
+        if _run_ddl(conn, [f"CREATE TABLE IF NOT EXISTS {ATTENDANCE_DEFAULT_PARTITION} PARTITION OF attendance DEFAULT"]):
+            created.append(ATTENDANCE_DEFAULT_PARTITION)
     
-    CREATE INDEX IF NOT EXISTS idx_attendance_ident ON attendance(ident);
-    CREATE INDEX IF NOT EXISTS idx_attendance_punch_time ON attendance(punch_time);
-    """
+    if created:
+        print(f"[DB] Created attendance partitions: {', '.join(created)}")
+    return created
+
+def detach_attendance_partitions(conn, before: datetime, drop: bool = False) -> List[str]:
+    """Detach (and archive or drop) attendance partitions whose range ends by `before`"""
+    with conn.cursor() as cursor:
+        partitions = list_attendance_partitions(cursor)
+    conn.commit()
     
-    cursor.execute(SCHEMA_SQL)
+    expired = []
+    for name, _, upper in partitions:
+        if name == ATTENDANCE_DEFAULT_PARTITION or upper is None or upper > before:
+            continue
+        # DETACH ... CONCURRENTLY is not allowed while a default partition
+        # exists; a plain detach holds its lock only briefly
+        statements = [f"ALTER TABLE attendance DETACH PARTITION {name}"]
+        if drop:
+            statements.append(f"DROP TABLE {name}")
+        else:
+            # Kept for archiving under a name partition creation never reuses
+            statements.append(f"ALTER TABLE {name} RENAME TO attendance_archived_{name[len('attendance_'):]}")
+        if _run_ddl(conn, statements):
+            expired.append(name)
+        else:
+            print(f"[DB] Could not detach partition {name}: lock timeout")
+    return expired
+
+# Row changes to people are announced on this channel (payload: the ident,
+# or '' after a TRUNCATE) so each worker can drop its cached copy
+PEOPLE_CHANGED_CHANNEL = "people_changed"
 
 def ensure_db_exists():
-    """Validate PostgreSQL database connection and schema, auto-create if needed"""
+    """Connect to the PostgreSQL database, creating it if needed, and apply pending migrations"""
     database_url = Config.DATABASE_URL
     
     # Try to connect, if database doesn't exist, try to create it
@@ -179,8 +798,12 @@ def ensure_db_exists():
                 admin_conn.autocommit = True
                 admin_cursor = admin_conn.cursor()
                 
-                # Create database
-                admin_cursor.execute(f'CREATE DATABASE "{db_name}"')
+                # Create database; another worker starting at the same
+                # time may get there first
+                try:
+                    admin_cursor.execute(f'CREATE DATABASE "{db_name}"')
+                except (psycopg2.errors.DuplicateDatabase, psycopg2.errors.UniqueViolation):
+                    pass
                 
                 admin_cursor.close()
                 admin_conn.close()
@@ -199,71 +822,21 @@ def ensure_db_exists():
             raise RuntimeError(f"Database connection error: {e}")
     
     try:
+        # Everything else about the schema is recorded by the migrations, so
+        # an up-to-date database costs this one query per process start
+        from models.migrations import LATEST_VERSION, current_version, migrate
         
-        # Check for required tables
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-        """)
-        tables = {row[0] for row in cursor.fetchall()}
-        
-        required_tables = {'people', 'attendance'}
-        missing_tables = required_tables - tables
+        version = current_version(conn)
+        if version < LATEST_VERSION:
+            migrate(conn)
+        elif version > LATEST_VERSION:
+            print(f"[DB] Schema version {version} is newer than this release ({LATEST_VERSION}); continuing")
         
-        if missing_tables:
-            # Auto-create tables
-            _create_schema(cursor)
+        # Upcoming months are not a schema change, so every start checks
+        # them: one catalog query, and DDL only when a month is missing
+        if Config.ATTENDANCE_PARTITIONING and _relkind(cursor, "attendance") == "p":
             conn.commit()
-            
-            # Re-check tables
-            cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-            """)
-            tables = {row[0] for row in cursor.fetchall()}
-            
-            if not required_tables.issubset(tables):
-                cursor.close()
-                conn.close()
-                raise RuntimeError(f"Failed to create tables: {required_tables - tables}")
-        
-        # Validate people table columns
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_schema = 'public' AND table_name = 'people'
-        """)
-        people_columns = {row[0] for row in cursor.fetchall()}
-        required_people_cols = {'ident', 'face_embedding', 'time_zone', 'created_at', 'updated_at'}
-        
-        if not required_people_cols.issubset(people_columns):
-            missing_cols = required_people_cols - people_columns
-            cursor.close()
-            conn.close()
-            raise RuntimeError(
-                f"People table schema incomplete. Missing columns: {missing_cols}\n"
-                f"Please run: python database/init_db.py"
-            )
-        
-        # Validate attendance table columns
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_schema = 'public' AND table_name = 'attendance'
-        """)
-        attendance_columns = {row[0] for row in cursor.fetchall()}
-        required_attendance_cols = {'id', 'ident', 'punch_time', 'image_url', 'created_at'}
-        
-        if not required_attendance_cols.issubset(attendance_columns):
-            missing_cols = required_attendance_cols - attendance_columns
-            cursor.close()
-            conn.close()
-            raise RuntimeError(
-                f"Attendance table schema incomplete. Missing columns: {missing_cols}\n"
-                f"Please run: python database/init_db.py"
-            )
+            ensure_attendance_partitions(conn)
         
         cursor.close()
         conn.close()
@@ -0,0 +1,34 @@
+"""people and attendance"""
+from config import Config
+
+
+def upgrade(conn):
+    if Config.ATTENDANCE_PARTITIONING:
+        # Monthly range partitions on punch_time; the key must be part of the primary key
+        attendance_key = "PRIMARY KEY (id, punch_time),"
+        attendance_options = "PARTITION BY RANGE (punch_time)"
+    else:
+        attendance_key = "PRIMARY KEY (id),"
+        attendance_options = ""
+    
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS people (
+            ident               VARCHAR(255) PRIMARY KEY,
+            face_embedding      BYTEA,
+            time_zone           VARCHAR(100) DEFAULT 'Asia/Taipei',
+            created_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at          TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        
+        CREATE TABLE IF NOT EXISTS attendance (
+            id                  SERIAL,
+            ident               VARCHAR(255) NOT NULL,
+            punch_time          TIMESTAMPTZ NOT NULL,
+            image_url           TEXT,
+            created_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            {attendance_key}
+            FOREIGN KEY (ident) REFERENCES people(ident) ON DELETE CASCADE
+        ) {attendance_options};
+        """)
+    conn.commit()
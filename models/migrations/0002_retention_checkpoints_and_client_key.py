@@ -0,0 +1,16 @@
+"""Image sweeper checkpoints and the offline punch idempotency key"""
+
+
+def upgrade(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS storage_retention_checkpoints (
+            job_name            VARCHAR(100) PRIMARY KEY,
+            swept_through       DATE NOT NULL,
+            updated_at          TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        
+        -- Idempotency key sent by kiosks when syncing offline punches
+        ALTER TABLE attendance ADD COLUMN IF NOT EXISTS client_key VARCHAR(100);
+        """)
+    conn.commit()
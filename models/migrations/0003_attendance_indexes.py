@@ -0,0 +1,69 @@
+"""Composite attendance indexes for keyset reads, built concurrently"""
+from models.database import _index_is_valid, _relkind
+
+# Attendance indexes, built with CREATE INDEX CONCURRENTLY so that adding
+# one to a large table does not block punches
+ATTENDANCE_INDEXES = [
+    # Per-person history and keyset pages: WHERE ident = ? ORDER BY punch_time, id
+    ("idx_attendance_ident_time",
+     "(ident, punch_time, id)"),
+    # Time-range scans and keyset pages across everyone, answered from the index alone
+    ("idx_attendance_time_covering",
+     "(punch_time, id) INCLUDE (ident, image_url)"),
+    ("idx_attendance_client_key",
+     "(client_key, punch_time) WHERE client_key IS NOT NULL",
+     "UNIQUE"),
+]
+
+# Single-column indexes made redundant by the composite ones above
+REDUNDANT_ATTENDANCE_INDEXES = ["idx_attendance_ident", "idx_attendance_punch_time"]
+
+
+def upgrade(conn):
+    _build_attendance_indexes(conn)
+
+
+def _build_attendance_indexes(conn):
+    """Create missing attendance indexes concurrently and drop redundant ones"""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        partitioned = _relkind(cursor, "attendance") == "p"
+        for name, columns, *kind in ATTENDANCE_INDEXES:
+            unique = kind[0] + " " if kind else ""
+            valid = _index_is_valid(cursor, name)
+            if valid:
+                continue
+            
+            if not partitioned:
+                # A failed concurrent build leaves an invalid index behind that
+                # IF NOT EXISTS would skip, so rebuild it
+                if valid is not None:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cursor.execute(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON attendance {columns}")
+                continue
+            
+            # CONCURRENTLY is not supported on a partitioned table: create the
+            # parent index ON ONLY (invalid until complete), build each
+            # partition's index concurrently and attach it
+            cursor.execute(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY attendance {columns}")
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('attendance') AND NOT EXISTS ("
+                "  SELECT 1 FROM pg_inherits ii JOIN pg_index x ON x.indexrelid = ii.inhrelid "
+                "  WHERE ii.inhparent = to_regclass(%s) AND x.indrelid = c.oid)",
+                (name,)
+            )
+            for (partition,) in cursor.fetchall():
+                child = f"{name}__{partition[len('attendance_'):]}"
+                if _index_is_valid(cursor, child) is False:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {child}")
+                cursor.execute(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} {columns}")
+                cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+        
+        for name in REDUNDANT_ATTENDANCE_INDEXES:
+            if _relkind(cursor, name) == "i":
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    finally:
+        cursor.close()
+        conn.autocommit = False
@@ -0,0 +1,138 @@
+"""Monthly range partitions of attendance on punch_time"""
+import re
+import importlib
+
+from datetime import datetime, timedelta
+from config import Config
+from models.database import (
+    _index_is_valid,
+    _next_month,
+    _parse_bound,
+    _relkind,
+    _run_ddl,
+    ensure_attendance_partitions,
+)
+from models.migrations import MigrationDeferred
+from utils.helpers import TAIPEI_TZ
+
+# The indexes of migration 0003, built again on the partitioned table
+_indexes = importlib.import_module("models.migrations.0003_attendance_indexes")
+
+ATTENDANCE_LEGACY_PARTITION = "attendance_legacy"
+
+# The daily rollup trigger as migration 0005 creates it; a redo of this
+# migration on a database that has it moves it to the partitioned table
+DAILY_ROLLUP_TRIGGER_SQL = (
+    "CREATE TRIGGER attendance_daily_rollup AFTER INSERT ON attendance "
+    "REFERENCING NEW TABLE AS new_punches "
+    "FOR EACH STATEMENT EXECUTE FUNCTION attendance_rollup_daily()"
+)
+
+
+def upgrade(conn):
+    if not Config.ATTENDANCE_PARTITIONING:
+        print("[DB] ATTENDANCE_PARTITIONING is off; attendance stays unpartitioned. "
+              "To partition it later, turn it on and run: python -m models.migrations --redo 4")
+        return
+    if not _partition_attendance(conn):
+        raise MigrationDeferred("lock timeout while partitioning attendance")
+    ensure_attendance_partitions(conn)
+    _indexes.upgrade(conn)
+
+
+def _partition_attendance(conn) -> bool:
+    """Convert an unpartitioned attendance table into the first partition of a partitioned one
+
+    Returns whether attendance is partitioned afterwards; False means a
+    lock timeout got in the way and the conversion should be retried
+    """
+    cursor = conn.cursor()
+    try:
+        if _relkind(cursor, "attendance") != "r":
+            return True
+        
+        # Everything up to the end of this month stays in the legacy table;
+        # monthly partitions take over from there
+        boundary = _next_month(datetime.now(TAIPEI_TZ) + timedelta(days=1))
+        print(f"[DB] Partitioning attendance; existing rows become {ATTENDANCE_LEGACY_PARTITION} (< {boundary.date()})")
+        
+        # Prove the range without a long lock: NOT VALID is instant and
+        # VALIDATE scans under SHARE UPDATE EXCLUSIVE, which allows punches.
+        # ATTACH PARTITION then skips its own scan under the heavier lock
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'attendance_legacy_range' "
+            "AND conrelid = to_regclass('attendance')"
+        )
+        if cursor.fetchone() is None:
+            conn.commit()
+            if not _run_ddl(conn, [(
+                "ALTER TABLE attendance ADD CONSTRAINT attendance_legacy_range "
+                "CHECK (punch_time < %s) NOT VALID",
+                (boundary.isoformat(),)
+            )]):
+                print("[DB] Could not add the legacy range constraint: lock timeout; attendance stays unpartitioned")
+                return False
+        cursor.execute(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conname = 'attendance_legacy_range' AND conrelid = to_regclass('attendance')"
+        )
+        boundary = _parse_bound(re.search(r"< (.+?)::timestamp", cursor.fetchone()[0]).group(1))
+        conn.commit()
+        
+        # The partitioned primary key has to include punch_time; build its
+        # index on the live table so the swap only swaps constraints
+        conn.autocommit = True
+        cursor.execute("ALTER TABLE attendance VALIDATE CONSTRAINT attendance_legacy_range")
+        if _index_is_valid(cursor, "attendance_legacy_pkey") is False:
+            cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS attendance_legacy_pkey")
+        cursor.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS attendance_legacy_pkey "
+            "ON attendance (id, punch_time)"
+        )
+        cursor.execute("SELECT pg_get_serial_sequence('attendance', 'id')")
+        sequence = cursor.fetchone()[0]
+        conn.autocommit = False
+        
+        # Indexes already built on the legacy table are attached to the
+        # partitioned ones later instead of being rebuilt
+        cursor.execute(
+            "SELECT 1 FROM pg_trigger WHERE tgname = 'attendance_daily_rollup' "
+            "AND tgrelid = to_regclass('attendance')"
+        )
+        has_rollup = cursor.fetchone() is not None
+        renames = []
+        for name, *_ in _indexes.ATTENDANCE_INDEXES:
+            if _index_is_valid(cursor, name):
+                renames.append(f"ALTER INDEX {name} RENAME TO {name}__legacy")
+        conn.commit()
+        
+        swapped = _run_ddl(conn, [
+            f"ALTER TABLE attendance RENAME TO {ATTENDANCE_LEGACY_PARTITION}",
+            f"ALTER TABLE {ATTENDANCE_LEGACY_PARTITION} DROP CONSTRAINT attendance_pkey",
+            f"ALTER TABLE {ATTENDANCE_LEGACY_PARTITION} ADD CONSTRAINT attendance_legacy_pkey "
+            "PRIMARY KEY USING INDEX attendance_legacy_pkey",
+            *renames,
+            # A partition cannot carry a trigger with a transition table
+            f"DROP TRIGGER IF EXISTS attendance_daily_rollup ON {ATTENDANCE_LEGACY_PARTITION}",
+            f"CREATE TABLE attendance (LIKE {ATTENDANCE_LEGACY_PARTITION} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (punch_time)",
+            "ALTER TABLE attendance ADD PRIMARY KEY (id, punch_time)",
+            # Matches the legacy foreign key, which ATTACH then reuses unchecked
+            "ALTER TABLE attendance ADD CONSTRAINT attendance_ident_fkey "
+            "FOREIGN KEY (ident) REFERENCES people(ident) ON DELETE CASCADE",
+            # The sequence must outlive the legacy partition once it is dropped
+            f"ALTER SEQUENCE {sequence} OWNED BY attendance.id",
+            (f"ALTER TABLE attendance ATTACH PARTITION {ATTENDANCE_LEGACY_PARTITION} "
+             "FOR VALUES FROM (MINVALUE) TO (%s)", (boundary.isoformat(),)),
+            f"ALTER TABLE {ATTENDANCE_LEGACY_PARTITION} DROP CONSTRAINT attendance_legacy_range",
+            *([DAILY_ROLLUP_TRIGGER_SQL] if has_rollup else []),
+        ])
+        if swapped:
+            print("[DB] attendance is now partitioned by month")
+        else:
+            print("[DB] Could not swap in the partitioned table: lock timeout; will retry on next start")
+        return swapped
+    finally:
+        cursor.close()
+        conn.rollback()
+        conn.autocommit = False
@@ -0,0 +1,83 @@
+"""daily_attendance, kept current by a statement trigger on attendance"""
+from models.database import _run_ddl
+from models.migrations import MigrationDeferred
+
+DAILY_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS daily_attendance (
+    ident               VARCHAR(255) NOT NULL REFERENCES people(ident) ON DELETE CASCADE,
+    local_date          DATE NOT NULL,
+    first_in            TIMESTAMPTZ NOT NULL,
+    last_out            TIMESTAMPTZ NOT NULL,
+    punch_count         INTEGER NOT NULL,
+    updated_at          TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (ident, local_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_attendance_date ON daily_attendance (local_date, ident);
+
+-- The person's zone, or Asia/Taipei if it is missing or not a zone Postgres knows
+CREATE OR REPLACE FUNCTION attendance_time_zone(tz TEXT) RETURNS TEXT
+LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    IF tz IS NULL OR tz = '' THEN
+        RETURN 'Asia/Taipei';
+    END IF;
+    PERFORM NOW() AT TIME ZONE tz;
+    RETURN tz;
+EXCEPTION WHEN invalid_parameter_value THEN
+    RETURN 'Asia/Taipei';
+END $$;
+
+-- One upsert per (ident, local day) per INSERT statement, so a batch sync
+-- costs one statement rather than one per punch
+CREATE OR REPLACE FUNCTION attendance_rollup_daily() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO daily_attendance AS d (ident, local_date, first_in, last_out, punch_count, updated_at)
+    SELECT n.ident, (n.punch_time AT TIME ZONE attendance_time_zone(p.time_zone))::date,
+           MIN(n.punch_time), MAX(n.punch_time), COUNT(*), NOW()
+    FROM new_punches n JOIN people p ON p.ident = n.ident
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (ident, local_date) DO UPDATE SET
+        first_in = LEAST(d.first_in, EXCLUDED.first_in),
+        last_out = GREATEST(d.last_out, EXCLUDED.last_out),
+        punch_count = d.punch_count + EXCLUDED.punch_count,
+        updated_at = NOW();
+    RETURN NULL;
+END $$;
+"""
+
+DAILY_ROLLUP_TRIGGER_SQL = (
+    "CREATE TRIGGER attendance_daily_rollup AFTER INSERT ON attendance "
+    "REFERENCING NEW TABLE AS new_punches "
+    "FOR EACH STATEMENT EXECUTE FUNCTION attendance_rollup_daily()"
+)
+
+def _install_daily_rollup(conn) -> bool:
+    """Create daily_attendance and the trigger that keeps it current with each punch
+
+    Returns False if the trigger could not be created for a lock timeout
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('daily_attendance') IS NULL")
+        created = cursor.fetchone()[0]
+        cursor.execute(DAILY_ROLLUP_SQL)
+        cursor.execute(
+            "SELECT 1 FROM pg_trigger WHERE tgname = 'attendance_daily_rollup' "
+            "AND tgrelid = to_regclass('attendance')"
+        )
+        has_trigger = cursor.fetchone() is not None
+    conn.commit()
+    
+    if not has_trigger and not _run_ddl(conn, [DAILY_ROLLUP_TRIGGER_SQL]):
+        print("[DB] Could not create the daily_attendance trigger: lock timeout; will retry on next start")
+        return False
+    if created:
+        print("[DB] Created daily_attendance; load history with: python -m services.daily_attendance_service --from YYYY-MM-DD")
+    return True
+
+
+def upgrade(conn):
+    if not _install_daily_rollup(conn):
+        raise MigrationDeferred("lock timeout while creating the daily_attendance trigger")
@@ -0,0 +1,105 @@
+"""People listing indexes, the people_version counter and change notifications"""
+from models.database import _index_is_valid, _run_ddl
+from models.migrations import MigrationDeferred
+
+# People listing: keyset pages by (updated_at, ident) and ident prefix search;
+# varchar_pattern_ops lets LIKE 'prefix%' use the index under any collation
+PEOPLE_INDEXES = [
+    ("idx_people_updated_at", "(updated_at, ident)"),
+    ("idx_people_ident_pattern", "(ident varchar_pattern_ops)"),
+]
+
+# A counter bumped by every statement that writes people, so list responses
+# can be tagged and revalidated without reading the table. It starts from
+# the clock so a restored or recreated database does not reuse old values
+PEOPLE_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS people_version (
+    id                  BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version             BIGINT NOT NULL
+);
+
+INSERT INTO people_version (id, version)
+VALUES (TRUE, (EXTRACT(EPOCH FROM clock_timestamp()) * 1000)::BIGINT)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION people_bump_version() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE people_version SET version = version + 1 WHERE id;
+    RETURN NULL;
+END;
+$$;
+"""
+
+# Row changes to people are announced on the people_changed channel
+# (payload: the ident, or '' after a TRUNCATE), which database.PEOPLE_CHANGED_CHANNEL names
+PEOPLE_NOTIFY_SQL = """
+CREATE OR REPLACE FUNCTION people_notify_change() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('people_changed', '');
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM pg_notify('people_changed', OLD.ident);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM pg_notify('people_changed', NEW.ident);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+PEOPLE_TRIGGERS = [
+    ("people_version_bump",
+     "CREATE TRIGGER people_version_bump AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON people "
+     "FOR EACH STATEMENT EXECUTE FUNCTION people_bump_version()"),
+    ("people_notify_change",
+     "CREATE TRIGGER people_notify_change AFTER INSERT OR UPDATE OR DELETE ON people "
+     "FOR EACH ROW EXECUTE FUNCTION people_notify_change()"),
+    ("people_notify_truncate",
+     "CREATE TRIGGER people_notify_truncate AFTER TRUNCATE ON people "
+     "FOR EACH STATEMENT EXECUTE FUNCTION people_notify_change()"),
+]
+
+def _install_people_triggers(conn) -> bool:
+    """Create people_version and the triggers that bump it and announce people changes
+
+    Returns False if a trigger could not be created for a lock timeout
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(PEOPLE_VERSION_SQL)
+        cursor.execute(PEOPLE_NOTIFY_SQL)
+        cursor.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = to_regclass('people')")
+        existing = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    
+    missing = [sql for name, sql in PEOPLE_TRIGGERS if name not in existing]
+    if missing and not _run_ddl(conn, missing):
+        print("[DB] Could not create the people triggers: lock timeout; will retry on next start")
+        return False
+    return True
+
+def _build_people_indexes(conn):
+    """Create missing people indexes concurrently"""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        for name, columns in PEOPLE_INDEXES:
+            valid = _index_is_valid(cursor, name)
+            if valid:
+                continue
+            if valid is not None:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON people {columns}")
+    finally:
+        cursor.close()
+        conn.autocommit = False
+
+
+def upgrade(conn):
+    _build_people_indexes(conn)
+    if not _install_people_triggers(conn):
+        raise MigrationDeferred("lock timeout while creating the people triggers")
@@ -0,0 +1,38 @@
+"""Per-day advisory locks between the daily rollup trigger and backfills"""
+
+# The trigger takes a shared lock on each local day its statement touches,
+# and DailyAttendanceService.backfill the exclusive one for the day it
+# recounts: a recount waits only for that day's punches in flight, and only
+# that day's punches wait for the recount
+DAILY_ROLLUP_SQL = """
+CREATE OR REPLACE FUNCTION attendance_rollup_daily() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock_shared(hashtext('daily_attendance'), days.local_date - DATE '2000-01-01')
+    FROM (
+        SELECT DISTINCT (n.punch_time AT TIME ZONE attendance_time_zone(p.time_zone))::date AS local_date
+        FROM new_punches n JOIN people p ON p.ident = n.ident
+        ORDER BY 1
+    ) days;
+
+    INSERT INTO daily_attendance AS d (ident, local_date, first_in, last_out, punch_count, updated_at)
+    SELECT n.ident, (n.punch_time AT TIME ZONE attendance_time_zone(p.time_zone))::date,
+           MIN(n.punch_time), MAX(n.punch_time), COUNT(*), NOW()
+    FROM new_punches n JOIN people p ON p.ident = n.ident
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (ident, local_date) DO UPDATE SET
+        first_in = LEAST(d.first_in, EXCLUDED.first_in),
+        last_out = GREATEST(d.last_out, EXCLUDED.last_out),
+        punch_count = d.punch_count + EXCLUDED.punch_count,
+        updated_at = NOW();
+    RETURN NULL;
+END $$;
+"""
+
+
+def upgrade(conn):
+    # Replacing the function takes no lock on attendance
+    with conn.cursor() as cursor:
+        cursor.execute(DAILY_ROLLUP_SQL)
+    conn.commit()
@@ -0,0 +1,98 @@
+"""Versioned schema migrations
+
+Each module here named NNNN_description.py defines upgrade(conn); they run
+once each, in order, and every applied version is recorded in
+schema_version. An upgrade may commit as it goes (concurrent index builds
+need autocommit), so it must be safe to run again after failing part-way.
+
+A migration carries its own DDL and never changes once released: a
+database that recorded its version has exactly the schema it built, so a
+later schema change is a new migration. Only generic helpers (lock
+timeouts, catalog lookups) come from models.database.
+"""
+import re
+import pkgutil
+import importlib
+import psycopg2
+import psycopg2.errors
+
+from typing import List, Optional, Tuple
+from models.database import _acquire_schema_lock, _release_schema_lock
+
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version             INTEGER PRIMARY KEY,
+    name                VARCHAR(200) NOT NULL,
+    applied_at          TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+
+class MigrationDeferred(Exception):
+    """Raised by an upgrade that cannot finish now, e.g. after a lock timeout
+
+    Its version is not recorded, later migrations wait for it, and the
+    application starts anyway; the next start tries again.
+    """
+
+
+def _discover() -> List[Tuple[int, str]]:
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        match = re.match(r"^(\d{4})_\w+$", module.name)
+        if match:
+            found.append((int(match.group(1)), module.name))
+    return sorted(found)
+
+
+MIGRATIONS = _discover()
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn) -> int:
+    """Highest applied migration; 0 for a database that has none"""
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            version = cursor.fetchone()[0] or 0
+        except psycopg2.errors.UndefinedTable:
+            version = 0
+    conn.rollback()
+    return version
+
+
+def migrate(conn, redo: Optional[int] = None) -> List[int]:
+    """Apply pending migrations, plus redo if given, under the schema lock; returns the versions applied"""
+    applied = []
+    _acquire_schema_lock(conn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA_VERSION_SQL)
+        conn.commit()
+        # Another worker may have migrated while this one waited for the lock
+        version = current_version(conn)
+        
+        for number, name in MIGRATIONS:
+            if number <= version and number != redo:
+                continue
+            print(f"[DB] Applying migration {name}")
+            try:
+                importlib.import_module(f"{__name__}.{name}").upgrade(conn)
+            except MigrationDeferred as e:
+                conn.rollback()
+                print(f"[DB] Migration {name} deferred: {e}; it and later migrations run on next start")
+                break
+            
+            conn.rollback()
+            conn.autocommit = False
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (%s, %s) "
+                    "ON CONFLICT (version) DO UPDATE SET applied_at = NOW()",
+                    (number, name)
+                )
+            conn.commit()
+            applied.append(number)
+    finally:
+        _release_schema_lock(conn)
+    return applied
@@ -0,0 +1,34 @@
+"""Apply or inspect schema migrations.
+
+Usage:
+    python -m models.migrations            # apply pending migrations
+    python -m models.migrations --status
+    python -m models.migrations --redo 4   # run migration 0004 again (they are idempotent)
+"""
+import sys
+import argparse
+import psycopg2
+
+from config import Config
+from models.migrations import LATEST_VERSION, MIGRATIONS, current_version, migrate
+
+parser = argparse.ArgumentParser(description="Apply versioned schema migrations to DATABASE_URL")
+parser.add_argument("--status", action="store_true", help="show applied and pending migrations only")
+parser.add_argument("--redo", type=int, default=None, help="run this migration again, e.g. after changing config")
+args = parser.parse_args()
+
+if args.redo is not None and args.redo not in {number for number, _ in MIGRATIONS}:
+    sys.exit(f"No migration {args.redo:04d}")
+
+conn = psycopg2.connect(Config.DATABASE_URL)
+try:
+    version = current_version(conn)
+    if args.status:
+        for number, name in MIGRATIONS:
+            print(f"{'applied' if number <= version else 'pending':<8} {name}")
+        print(f"schema version {version}, latest {LATEST_VERSION}")
+    else:
+        applied = migrate(conn, redo=args.redo)
+        print(f"Applied: {', '.join(f'{n:04d}' for n in applied) or 'nothing'}; schema version {current_version(conn)}")
+finally:
+    conn.close()
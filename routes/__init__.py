@@ -3,5 +3,6 @@ from .attendance_routes import attendance_bp
 from .face_routes import face_bp
 from .main_routes import main_bp
 from .health_routes import health_bp
+from .storage_routes import storage_bp
 
-__all__ = ["people_bp", "attendance_bp", "face_bp", "main_bp", "health_bp"]
+__all__ = ["people_bp", "attendance_bp", "face_bp", "main_bp", "health_bp", "storage_bp"]
@@ -0,0 +1,203 @@
+import json
+import asyncio
+
+from typing import Any, Dict, List, Optional
+from flask.json.provider import DefaultJSONProvider
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+from werkzeug.http import parse_etags
+from config import Config
+from models.async_database import acquire_async
+from routes.tasks_routes import (
+    SSE_KEEP_ALIVE,
+    SSE_RETRY,
+    end_event,
+    initial_task_events,
+    update_events,
+    wait_timeout,
+)
+from services.async_people_service import AsyncPeopleService
+from services.async_task_service import AsyncTaskService
+from utils.helpers import row_to_dict
+
+# Native coroutine routes of the ASGI app (asgi.py). Each mirrors the Flask
+# route with the same path, which keeps serving it in wsgi mode, and answers
+# with the same status codes, headers and JSON.
+
+
+def _json(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    # Encoded as jsonify encodes it (compact), dates as HTTP dates included
+    body = json.dumps(data, default=DefaultJSONProvider.default, sort_keys=True, separators=(",", ":"))
+    return Response(body + "\n", status_code=status, media_type="application/json", headers=headers)
+
+
+def _endpoint(handler):
+    # Errors answered as app.py's Flask error handlers answer them
+    async def endpoint(request: Request) -> Response:
+        try:
+            return await handler(request)
+        except HTTPException as e:
+            return Response(str(e.description), status_code=e.code)
+        except asyncio.TimeoutError:
+            # No asyncpg connection within DB_POOL_TIMEOUT_SECONDS
+            return Response("Database busy, please retry", status_code=503, headers={"Retry-After": "1"})
+    return endpoint
+
+
+def _requested_task_ids(request: Request) -> List[str]:
+    task_ids = request.query_params.getlist("id")
+    for value in request.query_params.getlist("ids"):
+        task_ids.extend(t for t in value.split(",") if t)
+    return list(dict.fromkeys(task_ids))[:Config.TASK_STREAM_MAX_IDS]
+
+
+async def _wait_for_updates(task_ids, since: int, timeout: float):
+    """AsyncTaskService.wait_for_updates without holding a thread while it waits"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake():
+        # Runs on the thread that changed the task, under the task lock
+        loop.call_soon_threadsafe(changed.set)
+
+    AsyncTaskService.add_listener(wake)
+    try:
+        deadline = loop.time() + timeout
+        while True:
+            changed.clear()
+            cursor, updates = AsyncTaskService.get_updates(task_ids, since)
+            remaining = deadline - loop.time()
+            if updates or remaining <= 0:
+                return cursor, updates
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        AsyncTaskService.remove_listener(wake)
+
+
+async def health_check(request: Request) -> Response:
+    return _json({"status": "healthy", "service": "attendance-system"})
+
+
+async def liveness_check(request: Request) -> Response:
+    return _json({"status": "alive", "service": "attendance-system"})
+
+
+async def get_task_stats(request: Request) -> Response:
+    return _json({"success": True, "stats": AsyncTaskService.get_stats()})
+
+
+async def stream_task_status(request: Request) -> Response:
+    task_ids = _requested_task_ids(request)
+    if not task_ids:
+        return _json({"success": False, "error": "ids is required"}, 400)
+
+    try:
+        since = int(request.headers.get("last-event-id") or request.query_params.get("since", 0))
+    except ValueError:
+        raise BadRequest("since must be an integer")
+
+    async def generate():
+        loop = asyncio.get_running_loop()
+        cursor = since
+        deadline = loop.time() + Config.TASK_STREAM_MAX_SECONDS
+
+        yield SSE_RETRY
+
+        events, watching = initial_task_events(task_ids)
+        for event in events:
+            yield event
+
+        while watching:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+
+            cursor, updates = await _wait_for_updates(
+                watching, cursor, min(remaining, Config.TASK_STREAM_HEARTBEAT_SECONDS)
+            )
+            if not updates:
+                yield SSE_KEEP_ALIVE
+                continue
+
+            for event in update_events(updates, cursor, watching):
+                yield event
+
+        yield end_event(watching)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def wait_for_task_updates(request: Request) -> Response:
+    task_ids = _requested_task_ids(request)
+    if not task_ids:
+        return _json({"success": False, "error": "ids is required"}, 400)
+
+    try:
+        since = int(request.query_params.get("since", 0))
+        timeout = wait_timeout(request.query_params.get("timeout", 25))
+    except ValueError:
+        raise BadRequest("since must be an integer and timeout a non-negative number")
+
+    cursor, updates = await _wait_for_updates(task_ids, since, timeout)
+    return _json({"success": True, "cursor": cursor, "tasks": updates})
+
+
+async def get_task_status(request: Request) -> Response:
+    status = AsyncTaskService.get_task_status(request.path_params["task_id"])
+
+    if status is None:
+        return _json({"success": False, "error": "Task not found"}, 404)
+
+    return _json({"success": True, "task": status})
+
+
+async def list_people(request: Request) -> Response:
+    # One connection for the version and the rows, as in the Flask route, so
+    # both come from the same server when reads move to or from the replica
+    async with acquire_async(replica=True) as conn:
+        # Same ETag as the Flask route, read before the rows for the same reason
+        etag = f"people-{await AsyncPeopleService.list_version(conn)}"
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if parse_etags(request.headers.get("if-none-match")).contains(etag):
+            return Response(status_code=304, headers=headers)
+
+        args = request.query_params
+        if any(key in args for key in ("limit", "cursor", "prefix")):
+            try:
+                limit = int(args.get("limit", 100))
+            except ValueError:
+                raise BadRequest("limit must be an integer")
+            prefix = (args.get("prefix") or "").strip() or None
+            page = await AsyncPeopleService.list_page(conn, prefix, limit, args.get("cursor"))
+            return _json(page, headers=headers)
+
+        return _json(await AsyncPeopleService.list_all(conn), headers=headers)
+
+
+async def get_person(request: Request) -> Response:
+    async with acquire_async(replica=True) as conn:
+        person = await AsyncPeopleService.get_by_ident(conn, request.path_params["ident"])
+    if not person:
+        raise NotFound("Person not found")
+    return _json(row_to_dict(person))
+
+
+async_routes = [
+    Route("/health", _endpoint(health_check), methods=["GET"]),
+    Route("/liveness", _endpoint(liveness_check), methods=["GET"]),
+    Route("/api/tasks/stats", _endpoint(get_task_stats), methods=["GET"]),
+    Route("/api/tasks/stream", _endpoint(stream_task_status), methods=["GET"]),
+    Route("/api/tasks/wait", _endpoint(wait_for_task_updates), methods=["GET"]),
+    Route("/api/tasks/{task_id}", _endpoint(get_task_status), methods=["GET"]),
+    Route("/api/people", _endpoint(list_people), methods=["GET"]),
+    Route("/api/people/{ident}", _endpoint(get_person), methods=["GET"]),
+]
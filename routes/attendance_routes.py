@@ -1,10 +1,29 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, request, jsonify, redirect, abort, stream_with_context
+from models.database import readonly_db
 from services.attendance_service import AttendanceService
-from utils.image_processing import read_image_from_request
+from services.attendance_query_service import AttendanceQueryService
+from services.daily_attendance_service import DailyAttendanceService
+from services.export_service import EXPORT_FORMATS, ExportService
+from utils.image_processing import read_image_bytes_from_request, decode_image
 
 attendance_bp = Blueprint("attendance", __name__, url_prefix="/api")
 
 
+def _parse_face_box(value):
+    # Accepts the facial_area object returned by /api/face/verify, as a dict or JSON string
+    try:
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, dict):
+            return None
+        box = tuple(int(value[k]) for k in ("x", "y", "w", "h"))
+        return box if box[2] > 0 and box[3] > 0 else None
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
 @attendance_bp.route("/punch", methods=["POST"])
 def punch():
     data = request.get_json(silent=True) or request.form.to_dict()
@@ -16,14 +35,107 @@ def punch():
         abort(400, "ident is required (in practice, obtained from face recognition)")
 
     face_image = None
+    image_bytes = None
     try:
         image_file = request.files.get("image")
         image_b64 = data.get("image_base64")
 
         if image_file or image_b64:
-            face_image = read_image_from_request(image_file, image_b64)
+            image_bytes = read_image_bytes_from_request(image_file, image_b64)
+            face_image = decode_image(image_bytes)
     except Exception as e:
         print(f"Failed to read face image: {e}")
+        image_bytes = None
 
-    result = AttendanceService.punch(ident, face_image)
+    result = AttendanceService.punch(ident, face_image, image_bytes, _parse_face_box(data.get("face_box")))
     return jsonify(result)
+
+
+@attendance_bp.route("/punch/batch", methods=["POST"])
+def punch_batch():
+    # JSON: {"punches": [{client_key, ident, punch_time, image_base64?}]}
+    # multipart: "punches" JSON field plus one "image:<client_key>" file per image
+    images = {}
+    if request.is_json:
+        records = (request.get_json(silent=True) or {}).get("punches")
+        for record in records if isinstance(records, list) else []:
+            if isinstance(record, dict) and record.get("image_base64") and record.get("client_key"):
+                try:
+                    images[record["client_key"]] = read_image_bytes_from_request(None, record["image_base64"])
+                except Exception as e:
+                    print(f"Failed to read batch image for {record['client_key']}: {e}")
+    else:
+        try:
+            records = json.loads(request.form.get("punches", ""))
+        except ValueError:
+            abort(400, "punches must be a JSON list")
+        for name, image_file in request.files.items():
+            if name.startswith("image:"):
+                images[name[len("image:"):]] = image_file.read()
+
+    if not isinstance(records, list):
+        abort(400, "punches must be a list")
+
+    return jsonify(AttendanceService.punch_batch(records, images))
+
+
+@attendance_bp.route("/attendance", methods=["GET"])
+@readonly_db
+def list_attendance():
+    filters = AttendanceQueryService.parse_filters(request.args)
+    try:
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        abort(400, "limit must be an integer")
+    return jsonify(AttendanceQueryService.list_page(filters, limit, request.args.get("cursor")))
+
+
+@attendance_bp.route("/attendance/export", methods=["GET"])
+def export_attendance():
+    # Not @readonly_db: the named cursor behind the stream needs a transaction
+    filters = AttendanceQueryService.parse_filters(request.args)
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f"format must be one of: {', '.join(sorted(EXPORT_FORMATS))}")
+    if fmt == "parquet" and not ExportService.parquet_available():
+        abort(400, "Parquet export is not available on this server (pyarrow is not installed)")
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(ExportService.stream(filters, fmt)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=attendance.{extension}"}
+    )
+
+
+@attendance_bp.route("/attendance/daily", methods=["GET"])
+@readonly_db
+def list_daily_attendance():
+    filters = AttendanceQueryService.parse_filters(request.args)
+    try:
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        abort(400, "limit must be an integer")
+    return jsonify(DailyAttendanceService.list_days(filters, limit, request.args.get("cursor")))
+
+
+@attendance_bp.route("/attendance/<int:attendance_id>/image", methods=["GET"])
+@readonly_db
+def attendance_image(attendance_id: int):
+    url = AttendanceService.get_image_urls([attendance_id]).get(attendance_id)
+    if not url:
+        abort(404, "No image for this attendance record")
+    return redirect(url, code=302)
+
+
+@attendance_bp.route("/attendance/images", methods=["POST"])
+@readonly_db
+def attendance_image_urls():
+    payload = request.get_json(silent=True) or {}
+    try:
+        ids = [int(i) for i in payload.get("ids", [])][:500]
+    except (TypeError, ValueError):
+        abort(400, "ids must be a list of attendance ids")
+
+    urls = AttendanceService.get_image_urls(ids)
+    return jsonify({"urls": {str(k): v for k, v in urls.items()}})
@@ -1,6 +1,9 @@
 from flask import Blueprint, jsonify
-from models.database import get_db
+from config import Config
+from models.database import get_db, get_pool_stats, get_replica_stats, readonly_db
+from services.async_task_service import AsyncTaskService
 from services.faiss_index_service import FaissIndexService
+from services.people_service import PeopleService
 
 health_bp = Blueprint("health", __name__)
 
@@ -12,6 +15,7 @@ def health_check():
     }), 200
 
 @health_bp.route("/readiness", methods=["GET"])
+@readonly_db
 def readiness_check():
     health_status = {
         "status": "ready",
@@ -20,9 +24,9 @@ def readiness_check():
     
     all_healthy = True
     
-    # Check database connectivity
+    # Check database connectivity (the primary, even when a replica is usable)
     try:
-        db = get_db()
+        db = get_db(replica=False)
         db.execute("SELECT 1")
         health_status["checks"]["database"] = {
             "status": "healthy",
@@ -35,6 +39,32 @@ def readiness_check():
             "message": f"Database error: {str(e)}"
         }
     
+    # Report connection pool usage; exhaustion shows up as waits and timeouts
+    pool_stats = get_pool_stats()
+    if pool_stats is not None:
+        pool_saturated = pool_stats["in_use"] >= pool_stats["max_size"]
+        health_status["checks"]["database_pool"] = {
+            "status": "warning" if pool_saturated else "healthy",
+            **pool_stats
+        }
+
+    # Read replica; reads fall back to the primary while it is down or lagging
+    replica_stats = get_replica_stats()
+    if replica_stats is not None:
+        health_status["checks"]["database_replica"] = {
+            "status": "healthy" if replica_stats["usable"] else "warning",
+            **replica_stats
+        }
+
+    # People metadata cache; a listener that lost its connection means other
+    # workers' changes only show up here once entries expire
+    cache_stats = PeopleService.get_cache_stats()
+    listener_down = cache_stats["listener_started"] and not cache_stats["listening"]
+    health_status["checks"]["people_cache"] = {
+        "status": "warning" if listener_down else "healthy",
+        **cache_stats
+    }
+
     # Check FAISS index
     try:
         faiss_stats = FaissIndexService.get_stats()
@@ -49,6 +79,19 @@ def readiness_check():
             "message": f"FAISS index check failed: {str(e)}"
         }
     
+    # Check background task backlog
+    queue_status = AsyncTaskService.get_queue_status()
+    queue_healthy = queue_status["queue_depth"] <= Config.TASK_QUEUE_READINESS_THRESHOLD
+    if not queue_healthy:
+        all_healthy = False
+    health_status["checks"]["task_queue"] = {
+        "status": "healthy" if queue_healthy else "unhealthy",
+        "queue_depth": queue_status["queue_depth"],
+        "oldest_task_age_seconds": queue_status["oldest_task_age_seconds"],
+        "threshold": Config.TASK_QUEUE_READINESS_THRESHOLD,
+        "message": "Task backlog within limits" if queue_healthy else "Task backlog over threshold"
+    }
+    
     # Set overall status
     if not all_healthy:
         health_status["status"] = "unhealthy"
@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify, abort
+from flask import Blueprint, Response, request, jsonify, abort
+from models.database import readonly_db
 from services.people_service import PeopleService
 from utils.helpers import ok, row_to_dict
 
@@ -6,9 +7,27 @@ people_bp = Blueprint("people", __name__, url_prefix="/api/people")
 
 
 @people_bp.route("", methods=["GET"])
+@readonly_db
 def list_people():
-    people = PeopleService.list_all()
-    return jsonify(people)
+    # The version is read before the rows: a write in between leaves this
+    # response with an older tag, so the next request refetches it
+    etag = f"people-{PeopleService.list_version()}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif any(key in request.args for key in ("limit", "cursor", "prefix")):
+        try:
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            abort(400, "limit must be an integer")
+        prefix = (request.args.get("prefix") or "").strip() or None
+        response = jsonify(PeopleService.list_page(prefix, limit, request.args.get("cursor")))
+    else:
+        # Without paging parameters, the whole list as before
+        response = jsonify(PeopleService.list_all())
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @people_bp.route("", methods=["POST"])
@@ -20,6 +39,7 @@ def create_person():
 
 
 @people_bp.route("/<ident>", methods=["GET"])
+@readonly_db
 def get_person(ident):
     person = PeopleService.get_by_ident(ident)
     if not person:
@@ -32,8 +52,7 @@ def update_person(ident):
     payload_json = request.get_json(silent=True)
     data = PeopleService.parse_people_payload(request.files, payload_json)
 
-    existing = PeopleService.get_by_ident(ident)
-    if existing:
+    if PeopleService.exists(ident):
         PeopleService.update(ident, data)
     else:
         PeopleService.create(data)
@@ -0,0 +1,71 @@
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+from services.async_task_service import AsyncTaskService
+from services.storage_service import StorageService
+from services.upload_service import UploadService
+
+storage_bp = Blueprint("storage", __name__, url_prefix="/api/storage")
+
+
+@storage_bp.route("/stats", methods=["GET"])
+def get_storage_stats():
+    return jsonify({"success": True, "stats": StorageService.get_stats()})
+
+
+@storage_bp.route("/retention", methods=["POST"])
+def run_retention_sweep():
+    payload = request.get_json(silent=True) or {}
+    days_old = payload.get("days_old")
+    if days_old is not None and (not isinstance(days_old, int) or days_old < 0):
+        abort(400, "days_old must be a non-negative integer")
+
+    app = current_app._get_current_object()
+
+    def retention_task():
+        from services.retention_service import RetentionService
+
+        with app.app_context():
+            return RetentionService.sweep(days_old)
+
+    task_id = AsyncTaskService.submit_task(retention_task, "storage_retention")
+    return jsonify({"success": True, "task_id": task_id}), 202
+
+
+@storage_bp.route("/pending/flush", methods=["POST"])
+def flush_pending_uploads():
+    payload = request.get_json(silent=True) or {}
+    limit = payload.get("limit")
+    if limit is not None and (not isinstance(limit, int) or limit <= 0):
+        abort(400, "limit must be a positive integer")
+
+    app = current_app._get_current_object()
+
+    def flush_task():
+        with app.app_context():
+            return UploadService.flush_pending(limit=limit)
+
+    task_id = UploadService.submit(flush_task, "storage_pending_flush")
+    return jsonify({
+        "success": True,
+        "task_id": task_id,
+        "pending": len(UploadService.list_pending())
+    }), 202
+
+
+@storage_bp.route("/objects/<path:key>", methods=["GET"])
+def get_object(key: str):
+    # Only the local and in-memory backends hand out URLs to this route
+    backend = StorageService.get_backend()
+    if backend.name == "gcs":
+        abort(404, "Object not found")
+
+    try:
+        obj = backend.get(key)
+    except ValueError:
+        obj = None
+    if obj is None:
+        abort(404, "Object not found")
+
+    data, content_type = obj
+    response = Response(data, mimetype=content_type)
+    response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    return response
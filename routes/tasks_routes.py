@@ -1,8 +1,84 @@
-from flask import Blueprint, jsonify
+import json
+import math
+import time
+import threading
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+from config import Config
 from services.async_task_service import AsyncTaskService
 
 bp = Blueprint("tasks", __name__, url_prefix="/api/tasks")
 
+TERMINAL_STATUSES = ("completed", "failed")
+
+# The stream events below are shared with the ASGI app's native stream
+# (routes/async_routes.py), so both modes send the same events
+SSE_RETRY = "retry: 3000\n\n"
+SSE_KEEP_ALIVE = ": keep-alive\n\n"
+
+# Each stream or long poll holds a request thread for its whole duration;
+# past this many per process they get 503 so the other routes keep threads
+_stream_slots = threading.BoundedSemaphore(max(1, Config.TASK_STREAM_MAX_CONCURRENT))
+
+
+def _busy():
+    return ("Too many open task streams, please retry", 503, {"Retry-After": "5"})
+
+
+def sse_event(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def initial_task_events(task_ids: List[str]) -> Tuple[List[str], Set[str]]:
+    """Events for tasks that are unknown or already finished, and the ids left to watch
+
+    A reconnect's cursor can be past a task's last change, so a finished
+    task would never show up as an update; its current state is sent now.
+    """
+    events = []
+    watching = set(task_ids)
+    for task_id in task_ids:
+        status = AsyncTaskService.get_task_status(task_id)
+        if status is None:
+            watching.discard(task_id)
+            events.append(sse_event("task", {"task_id": task_id, "status": "not_found"}))
+        elif status["status"] in TERMINAL_STATUSES:
+            watching.discard(task_id)
+            events.append(sse_event("task", status))
+    return events, watching
+
+
+def update_events(updates: Iterable[Dict[str, Any]], cursor: int, watching: Set[str]) -> List[str]:
+    """Events for changed tasks; finished ones are dropped from watching"""
+    events = []
+    for task in updates:
+        if task["status"] in TERMINAL_STATUSES:
+            watching.discard(task["task_id"])
+        events.append(sse_event("task", task, cursor))
+    return events
+
+
+def end_event(watching: Set[str]) -> str:
+    return sse_event("end", {"pending": sorted(watching)})
+
+
+def wait_timeout(value) -> float:
+    """A long poll's timeout in seconds, capped at TASK_STREAM_MAX_SECONDS; ValueError unless finite and >= 0"""
+    timeout = float(value)
+    if not math.isfinite(timeout) or timeout < 0:
+        raise ValueError(f"invalid timeout: {value}")
+    return min(timeout, Config.TASK_STREAM_MAX_SECONDS)
+
+
+def _requested_task_ids():
+    task_ids = request.args.getlist("id")
+    for value in request.args.getlist("ids"):
+        task_ids.extend(t for t in value.split(",") if t)
+    # Preserve order while dropping duplicates
+    return list(dict.fromkeys(task_ids))[:Config.TASK_STREAM_MAX_IDS]
+
 
 @bp.route("/stats", methods=["GET"])
 def get_task_stats():
@@ -10,6 +86,77 @@ def get_task_stats():
     return jsonify({"success": True, "stats": stats})
 
 
+@bp.route("/stream", methods=["GET"])
+def stream_task_status():
+    task_ids = _requested_task_ids()
+    if not task_ids:
+        return jsonify({"success": False, "error": "ids is required"}), 400
+
+    # EventSource sends Last-Event-ID on reconnect, so only newer changes are replayed
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.args.get("since", 0))
+    except ValueError:
+        abort(400, "since must be an integer")
+
+    if not _stream_slots.acquire(blocking=False):
+        return _busy()
+
+    def generate():
+        cursor = since
+        deadline = time.monotonic() + Config.TASK_STREAM_MAX_SECONDS
+
+        yield SSE_RETRY
+
+        events, watching = initial_task_events(task_ids)
+        yield from events
+
+        while watching:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            cursor, updates = AsyncTaskService.wait_for_updates(
+                watching, cursor, timeout=min(remaining, Config.TASK_STREAM_HEARTBEAT_SECONDS)
+            )
+            if not updates:
+                yield SSE_KEEP_ALIVE
+                continue
+
+            yield from update_events(updates, cursor, watching)
+
+        yield end_event(watching)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Released when the server closes the response, even if the stream never started
+    response.call_on_close(_stream_slots.release)
+    return response
+
+
+@bp.route("/wait", methods=["GET"])
+def wait_for_task_updates():
+    task_ids = _requested_task_ids()
+    if not task_ids:
+        return jsonify({"success": False, "error": "ids is required"}), 400
+
+    try:
+        since = int(request.args.get("since", 0))
+        timeout = wait_timeout(request.args.get("timeout", 25))
+    except ValueError:
+        abort(400, "since must be an integer and timeout a non-negative number")
+
+    if not _stream_slots.acquire(blocking=False):
+        return _busy()
+    try:
+        cursor, updates = AsyncTaskService.wait_for_updates(task_ids, since, timeout=timeout)
+    finally:
+        _stream_slots.release()
+    return jsonify({"success": True, "cursor": cursor, "tasks": updates})
+
+
 @bp.route("/<task_id>", methods=["GET"])
 def get_task_status(task_id: str):
     status = AsyncTaskService.get_task_status(task_id)
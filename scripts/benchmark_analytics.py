@@ -0,0 +1,190 @@
+"""Time the NumPy attendance analytics against a per-row Python loop.
+
+Usage:
+    python scripts/benchmark_analytics.py [--people 15000 --days 365] [--naive-people 1500]
+    DATABASE_URL=... python scripts/benchmark_analytics.py --db --from 2026-01-01 --to 2026-02-01
+
+The synthetic section generates about 10M punches (an arrival and a
+departure per present person-day, plus a few extra punches) straight into
+PunchColumns and times each AnalyticsService step. The same steps written
+as a loop over dict rows, as a RealDictCursor would return them, run on the
+first --naive-people people and their results are checked against the
+vectorized ones. --db times AnalyticsService.load (one binary COPY) against
+fetching the same punches as RealDictCursor rows.
+"""
+import os
+import sys
+import time
+import argparse
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.analytics_service import SECONDS_PER_DAY, AnalyticsService, PunchColumns  # noqa: E402
+
+COHORTS = ["NTU2024", "NTU2025", "NCKU2025", "TEACHER", "STAFF"]
+START = datetime(2025, 1, 1)
+SCHEDULES = {"default": "09:00", "TEACHER": "08:30", "STAFF": "08:30"}
+GRACE_MINUTES = 5
+WORKDAYS = [0, 1, 2, 3, 4]
+
+
+def synthetic(people: int, days: int, seed: int = 7) -> PunchColumns:
+    rng = np.random.default_rng(seed)
+    idents = [f"{COHORTS[i % len(COHORTS)]} Person {i}" for i in range(people)]
+    start_day = (START - datetime(1970, 1, 1)).days
+    join_days = start_day + rng.integers(-30, days // 4, people)
+
+    person, day = np.nonzero(rng.random((people, days)) < 0.93)
+    arrive = np.clip(rng.normal(8 * 3600 + 50 * 60, 15 * 60, len(person)), 0, SECONDS_PER_DAY - 1)
+    leave = np.clip(rng.normal(17 * 3600 + 30 * 60, 40 * 60, len(person)), 0, SECONDS_PER_DAY - 1)
+    extra = rng.random(len(person)) < 0.05
+    midday = rng.integers(11 * 3600, 14 * 3600, int(extra.sum()))
+
+    base = (start_day + day.astype(np.int64)) * SECONDS_PER_DAY
+    local_seconds = np.concatenate([base + arrive.astype(np.int64), base + leave.astype(np.int64), base[extra] + midday])
+    order = rng.permutation(len(local_seconds))
+    return PunchColumns(
+        idents, join_days,
+        np.concatenate([person, person, person[extra]]).astype(np.int32)[order],
+        local_seconds[order], start_day, start_day + days
+    )
+
+
+def as_rows(cols: PunchColumns, people: int):
+    epoch = datetime(1970, 1, 1)
+    keep = np.flatnonzero(cols.person < people)
+    return [
+        {"ident": cols.idents[p], "local_time": epoch + timedelta(seconds=int(s))}
+        for p, s in zip(cols.person[keep].tolist(), cols.local_seconds[keep].tolist())
+    ]
+
+
+def naive(rows, idents, join_dates, start, end):
+    """The same numbers computed one row at a time"""
+    first = {}
+    last = {}
+    for row in rows:
+        key = (row["ident"], row["local_time"].date())
+        if key not in first or row["local_time"] < first[key]:
+            first[key] = row["local_time"]
+        if key not in last or row["local_time"] > last[key]:
+            last[key] = row["local_time"]
+
+    late_days = defaultdict(int)
+    for (ident, day), punch in first.items():
+        cohort = ident.split(" ", 1)[0]
+        hours, minutes = (SCHEDULES.get(cohort) or SCHEDULES["default"]).split(":")
+        scheduled = punch.replace(hour=int(hours), minute=int(minutes), second=0)
+        if day.weekday() in WORKDAYS and punch - scheduled > timedelta(minutes=GRACE_MINUTES):
+            late_days[ident] += 1
+
+    longest = {}
+    for ident in idents:
+        run = best = 0
+        day = start
+        while day < end:
+            if day.weekday() in WORKDAYS:
+                if (ident, day) in first or day < join_dates[ident]:
+                    run = 0
+                else:
+                    run += 1
+                    best = max(best, run)
+            day += timedelta(days=1)
+        longest[ident] = best
+    return first, late_days, longest
+
+
+def timed(label: str, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"  {label:<28} {time.perf_counter() - started:>8.3f}s")
+    return result
+
+
+def run_synthetic(args):
+    cols = synthetic(args.people, args.days)
+    print(f"{len(cols.person):,} punches, {cols.num_people:,} people, {cols.num_days} days\n")
+
+    print("vectorized")
+    started = time.perf_counter()
+    daily = timed("daily first/last", AnalyticsService.daily, cols)
+    late = timed("lateness", AnalyticsService.lateness, cols, daily, SCHEDULES, GRACE_MINUTES)
+    streaks = timed("absence streaks", AnalyticsService.absence_streaks, cols, daily)
+    timed("histograms", AnalyticsService.histograms, cols)
+    timed("first/last per person", AnalyticsService.first_last, cols, daily)
+    vector_total = time.perf_counter() - started
+    print(f"  {'total':<28} {vector_total:>8.3f}s")
+
+    subset = min(args.naive_people, args.people)
+    rows = as_rows(cols, subset)
+    idents = cols.idents[:subset]
+    join_dates = {ident: datetime(1970, 1, 1).date() + timedelta(days=int(d))
+                  for ident, d in zip(idents, cols.join_days[:subset])}
+    start = START.date()
+    print(f"\nper-row loop over {len(rows):,} dict rows ({subset:,} people)")
+    started = time.perf_counter()
+    first, late_days, longest = naive(rows, idents, join_dates, start, start + timedelta(days=args.days))
+    naive_total = time.perf_counter() - started
+    print(f"  {'total':<28} {naive_total:>8.3f}s")
+    per_punch = naive_total / max(len(rows), 1) * len(cols.person)
+    print(f"  {'projected to all punches':<28} {per_punch:>8.3f}s ({per_punch / vector_total:.0f}x the vectorized total)")
+
+    mismatches = 0
+    in_subset = daily.person < subset
+    if int(in_subset.sum()) != len(first):
+        mismatches += 1
+    for i, ident in enumerate(idents):
+        mismatches += int(late["late_days"][i]) != late_days.get(ident, 0)
+        mismatches += int(streaks["longest"][i]) != longest[ident]
+    print(f"\nresults {'match' if not mismatches else f'differ ({mismatches} mismatches)'}")
+    return 1 if mismatches else 0
+
+
+def run_db(args):
+    from flask import Flask
+    from models.database import close_db, get_db
+    from services.attendance_query_service import AttendanceQueryService
+    from config import Config
+
+    cli_app = Flask(__name__)
+    cli_app.config.from_object(Config)
+    cli_app.teardown_appcontext(close_db)
+    with cli_app.app_context():
+        filters = AttendanceQueryService.parse_filters({"from": args.start, "to": args.end, "prefix": args.prefix})
+        print("loading punches")
+        cols = timed("binary COPY to columns", AnalyticsService.load, filters)
+
+        db = get_db()
+        where, params = AttendanceQueryService.build_where(filters)
+        started = time.perf_counter()
+        rows = db.execute(
+            "SELECT a.ident, a.punch_time, p.time_zone FROM attendance a "
+            f"JOIN people p ON p.ident = a.ident WHERE {where}",
+            params
+        ).fetchall()
+        db.commit()
+        print(f"  {'RealDictCursor rows':<28} {time.perf_counter() - started:>8.3f}s")
+        print(f"\n{len(cols.person):,} punches in columns, {len(rows):,} rows fetched")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized attendance analytics")
+    parser.add_argument("--people", type=int, default=15000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--naive-people", type=int, default=1500, help="people in the per-row comparison")
+    parser.add_argument("--db", action="store_true", help="time loading from DATABASE_URL instead")
+    parser.add_argument("--from", dest="start", default=None)
+    parser.add_argument("--to", dest="end", default=None)
+    parser.add_argument("--prefix", default=None)
+    args = parser.parse_args()
+    return run_db(args) if args.db else run_synthetic(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
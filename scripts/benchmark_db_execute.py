@@ -0,0 +1,116 @@
+"""Micro-benchmark of per-query overhead in DatabaseConnection.
+
+Usage:
+    python scripts/benchmark_db_execute.py [--iterations 20000] [--ident SOME_IDENT]
+
+The first section times only the Python side (placeholder translation and
+result wrapping) against a no-op cursor. If DATABASE_URL points at a
+reachable database, the second section times real round trips for the
+person lookup as plain, prepared and tuple-row queries, and a bulk read of
+all embeddings with dict rows versus tuple rows.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import DatabaseConnection, translate_query  # noqa: E402
+
+PERSON_QUERY = "SELECT * FROM people WHERE ident = %s"
+
+
+class _NoopCursor:
+    rowcount = 1
+
+    def execute(self, query, params=None):
+        pass
+
+
+class _LegacyCursorWrapper:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.rowcount = 0
+
+
+def legacy_execute(cursor, query, params=None):
+    # The execute() body as it was before templates were cached
+    pg_query = query.replace('?', '%s')
+    if 'last_insert_rowid()' in pg_query.lower():
+        pg_query = 'SELECT lastval()'
+    if params:
+        cursor.execute(pg_query, params)
+    else:
+        cursor.execute(pg_query)
+    wrapped = _LegacyCursorWrapper(cursor)
+    wrapped.rowcount = cursor.rowcount
+    return wrapped
+
+
+def timed(label, iterations, func):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<34} {elapsed / iterations * 1e6:>9.2f} us/query")
+
+
+def python_overhead(iterations):
+    print("Python overhead (no-op cursor)")
+    cursor = _NoopCursor()
+    db = DatabaseConnection(None, cursor)
+    params = ("someone",)
+    translate_query.cache_clear()
+    timed("legacy replace/lower/wrap", iterations, lambda: legacy_execute(cursor, PERSON_QUERY, params))
+    timed("cached template", iterations, lambda: db.execute(PERSON_QUERY, params))
+
+
+def database_round_trips(iterations, ident):
+    import psycopg2
+    import psycopg2.extras
+    from models.database import PreparingConnection
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"], connection_factory=PreparingConnection)
+    db = DatabaseConnection(conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor))
+    if ident is None:
+        row = db.execute("SELECT ident FROM people LIMIT 1").fetchone()
+        if row is None:
+            print("No people rows, skipping database benchmark")
+            return
+        ident = row["ident"]
+
+    print(f"Database round trips (ident={ident!r})")
+    params = (ident,)
+    timed("legacy execute, dict rows", iterations,
+          lambda: legacy_execute(db.cursor, PERSON_QUERY, params).cursor.fetchone())
+    timed("execute, dict rows", iterations, lambda: db.execute(PERSON_QUERY, params).fetchone())
+    timed("execute_prepared, dict rows", iterations, lambda: db.execute_prepared("get_person", params).fetchone())
+    timed("execute_tuples", iterations, lambda: db.execute_tuples(PERSON_QUERY, params).fetchone())
+
+    bulk = "SELECT ident, face_embedding FROM people WHERE face_embedding IS NOT NULL"
+    count = len(db.execute_tuples(bulk).fetchall())
+    bulk_iterations = max(iterations // 100, 5)
+    print(f"Bulk embedding read ({count} rows)")
+    timed("execute, dict rows", bulk_iterations, lambda: db.execute(bulk).fetchall())
+    timed("execute_tuples", bulk_iterations, lambda: db.execute_tuples(bulk).fetchall())
+
+    conn.rollback()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseConnection per-query overhead")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--ident", default=None, help="person to look up (default: any existing row)")
+    args = parser.parse_args()
+
+    python_overhead(args.iterations * 10)
+    if os.environ.get("DATABASE_URL"):
+        database_round_trips(args.iterations, args.ident)
+    else:
+        print("DATABASE_URL not set, skipping database benchmark")
+
+
+if __name__ == "__main__":
+    main()
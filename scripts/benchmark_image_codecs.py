@@ -0,0 +1,96 @@
+"""Compare stored-image codecs on a sample of kiosk frames.
+
+Usage:
+    python scripts/benchmark_image_codecs.py SAMPLE_DIR [--max-dimension 1024] [--repeat 3]
+
+SAMPLE_DIR holds captured frames (.jpg/.png/.webp). Each frame is resized the
+same way StorageService does, then encoded with every codec/quality pair;
+the report shows median encode time, mean size and mean PSNR against the
+resized frame.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_processing import codec_supported, encode_image, resize_to_fit  # noqa: E402
+
+DEFAULT_QUALITIES = {
+    "jpeg": [75, 85, 95],
+    "webp": [70, 80, 90],
+    "avif": [40, 60, 80],
+}
+
+
+def load_frames(sample_dir: str, max_dimension: int, limit: int):
+    paths = []
+    for pattern in ("*.jpg", "*.jpeg", "*.png", "*.webp"):
+        paths.extend(glob.glob(os.path.join(sample_dir, pattern)))
+    frames = []
+    for path in sorted(paths)[:limit]:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            frames.append(resize_to_fit(image, max_dimension, max_dimension))
+    return frames
+
+
+def benchmark(frames, codec: str, quality: int, repeat: int):
+    encode_ms = []
+    sizes = []
+    psnrs = []
+    for frame in frames:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data, size = encode_image(frame, codec=codec, quality=quality)
+            timings.append((time.perf_counter() - start) * 1000)
+        encode_ms.append(min(timings))
+        sizes.append(size)
+
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        psnrs.append(cv2.PSNR(frame, decoded))
+
+    return {
+        "encode_ms": statistics.median(encode_ms),
+        "bytes": statistics.mean(sizes),
+        "psnr": statistics.mean(psnrs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image codecs for stored attendance frames")
+    parser.add_argument("sample_dir")
+    parser.add_argument("--max-dimension", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=200, help="maximum number of frames to load")
+    args = parser.parse_args()
+
+    frames = load_frames(args.sample_dir, args.max_dimension, args.limit)
+    if not frames:
+        parser.error(f"No readable frames found in {args.sample_dir}")
+    print(f"{len(frames)} frames, max dimension {args.max_dimension}px\n")
+
+    baseline = benchmark(frames, "jpeg", 85, 1)["bytes"]
+    print(f"{'codec':<6} {'quality':>7} {'encode ms':>10} {'KiB':>8} {'vs jpeg85':>10} {'PSNR dB':>8}")
+    for codec, qualities in DEFAULT_QUALITIES.items():
+        if not codec_supported(codec):
+            print(f"{codec:<6} not supported by this OpenCV build ({cv2.__version__})")
+            continue
+        for quality in qualities:
+            result = benchmark(frames, codec, quality, args.repeat)
+            ratio = f"{result['bytes'] / baseline:.0%}"
+            print(
+                f"{codec:<6} {quality:>7} {result['encode_ms']:>10.2f} "
+                f"{result['bytes'] / 1024:>8.1f} {ratio:>10} {result['psnr']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
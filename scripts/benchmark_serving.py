@@ -0,0 +1,110 @@
+"""Measure how many requests a running server answers while long polls are open.
+
+Usage:
+    python scripts/benchmark_serving.py --url http://localhost:8080 [--pollers 40 --clients 8 --duration 20]
+
+Start the server in each mode and run this against it:
+    SERVER_MODE=wsgi gunicorn --workers 2 --threads 4 app:app
+    SERVER_MODE=asgi gunicorn -k uvicorn_worker.UvicornWorker --workers 2 asgi:app
+
+--pollers clients sit in /api/tasks/wait for a task id that never changes,
+as the admin UI's task watchers do, each reconnecting when its poll times
+out. Meanwhile --clients clients request a people page and /health back to
+back for --duration seconds. The report is what the fast clients got: the
+request rate, latency percentiles and errors.
+"""
+import sys
+import time
+import argparse
+import threading
+import http.client
+
+from urllib.parse import urlsplit
+
+FAST_PATHS = ["/api/people?limit=20", "/health"]
+
+
+def _connect(url, timeout: float) -> http.client.HTTPConnection:
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+
+
+def poller(url, poll_seconds: float, stop: threading.Event):
+    path = f"/api/tasks/wait?ids=benchmark-missing&timeout={poll_seconds}"
+    while not stop.is_set():
+        conn = _connect(url, poll_seconds + 30)
+        try:
+            conn.request("GET", path)
+            conn.getresponse().read()
+        except OSError:
+            time.sleep(0.5)
+        finally:
+            conn.close()
+
+
+def client(url, deadline: float, latencies, errors):
+    conn = _connect(url, 30)
+    i = 0
+    while time.monotonic() < deadline:
+        path = FAST_PATHS[i % len(FAST_PATHS)]
+        i += 1
+        started = time.monotonic()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            else:
+                latencies.append(time.monotonic() - started)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = _connect(url, 30)
+    conn.close()
+
+
+def percentile(values, fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request capacity under open long polls")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--pollers", type=int, default=40, help="concurrent /api/tasks/wait long polls")
+    parser.add_argument("--poll-seconds", type=float, default=25)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients of the fast routes")
+    parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    for _ in range(args.pollers):
+        threading.Thread(target=poller, args=(args.url, args.poll_seconds, stop), daemon=True).start()
+    # Let the long polls reach the server before timing anything
+    time.sleep(2)
+
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(args.url, deadline, latencies, errors))
+        for _ in range(args.clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+
+    latencies.sort()
+    print(f"{args.pollers} long polls open, {args.clients} clients for {args.duration:.0f}s")
+    print(f"  requests   {len(latencies):>8} ({len(latencies) / args.duration:.1f}/s)")
+    print(f"  p50        {percentile(latencies, 0.50) * 1000:>8.1f} ms")
+    print(f"  p95        {percentile(latencies, 0.95) * 1000:>8.1f} ms")
+    print(f"  max        {(latencies[-1] if latencies else float('nan')) * 1000:>8.1f} ms")
+    print(f"  errors     {len(errors):>8}" + (f" ({', '.join(map(str, sorted(set(errors), key=str)))})" if errors else ""))
+    return 1 if errors or not latencies else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Check that attendance read queries use the intended indexes.
+
+Usage:
+    DATABASE_URL=... python scripts/check_attendance_plans.py [--seed-people 2000 --seed-days 365]
+
+Runs EXPLAIN on the exact SQL AttendanceQueryService.page_query builds and
+fails (exit 1) if a query scans the attendance heap sequentially, sorts
+instead of walking an index, or misses its expected index. --seed-* fills
+an empty scratch database with synthetic punches first, so the planner sees
+realistic table sizes; never use it against production.
+"""
+import os
+import sys
+import json
+import argparse
+
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2  # noqa: E402
+
+from services.attendance_query_service import AttendanceQueryService  # noqa: E402
+from utils.helpers import TAIPEI_TZ  # noqa: E402
+
+
+def seed(cursor, people: int, days: int):
+    cursor.execute(
+        "INSERT INTO people (ident, time_zone) "
+        "SELECT 'SEED' || (2000 + g %% 10) || ' Person ' || g, 'Asia/Taipei' "
+        "FROM generate_series(1, %s) g ON CONFLICT DO NOTHING",
+        (people,)
+    )
+    cursor.execute(
+        "INSERT INTO attendance (ident, punch_time, created_at) "
+        "SELECT p.ident, d + interval '8 hours' + (random() * interval '10 hours'), NOW() "
+        "FROM people p CROSS JOIN generate_series(NOW() - %s * interval '1 day', NOW(), interval '1 day') d "
+        "WHERE p.ident LIKE 'SEED%%'",
+        (days,)
+    )
+    cursor.execute("ANALYZE attendance")
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN-check attendance read queries")
+    parser.add_argument("--seed-people", type=int, default=0)
+    parser.add_argument("--seed-days", type=int, default=365)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    conn.autocommit = True
+    cursor = conn.cursor()
+    if args.seed_people:
+        seed(cursor, args.seed_people, args.seed_days)
+
+    cursor.execute("SELECT ident FROM attendance ORDER BY punch_time DESC LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        print("attendance is empty; run with --seed-people on a scratch database")
+        return 1
+    ident = row[0]
+    prefix = ident.split(" ", 1)[0]
+
+    now = datetime.now(TAIPEI_TZ)
+    week = {"start": now - timedelta(days=7), "end": now}
+    page_one_sql, page_one_params = AttendanceQueryService.page_query(week, 100)
+    cursor.execute(page_one_sql, page_one_params)
+    rows = cursor.fetchall()
+    page_cursor = AttendanceQueryService.encode_cursor(rows[-1][2], rows[-1][0]) if rows else None
+
+    # (name, filters, cursor, expected index, sort allowed). A bounded range
+    # for one person may bitmap-scan the composite index and sort the few
+    # matching rows; unbounded reads must walk the index in order
+    cases = [
+        ("person history", {"ident": ident}, None, "idx_attendance_ident_time", False),
+        ("person in range", dict(week, ident=ident), None, "idx_attendance_ident_time", True),
+        ("everyone in range", week, None, "idx_attendance_time_covering", False),
+        ("everyone, next page", week, page_cursor, "idx_attendance_time_covering", False),
+        ("cohort in range", dict(week, prefix=prefix), None, "idx_attendance_time_covering", False),
+    ]
+
+    failures = 0
+    for name, filters, page, expected_index, sort_allowed in cases:
+        sql, params = AttendanceQueryService.page_query(filters, 101, page)
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0][0]["Plan"]
+        nodes = list(plan_nodes(plan))
+
+        problems = []
+        if any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "attendance" for n in nodes):
+            problems.append("sequential scan on attendance")
+        if not sort_allowed and any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes):
+            problems.append("explicit sort")
+        # On a partitioned table the plan names each partition's index
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            (expected_index,)
+        )
+        accepted = {expected_index} | {r[0] for r in cursor.fetchall()}
+        if not any(n.get("Index Name") in accepted for n in nodes):
+            used = sorted({n["Index Name"] for n in nodes if "Index Name" in n})
+            problems.append(f"expected {expected_index}, used {used or 'no index'}")
+
+        status = "FAIL" if problems else "ok"
+        print(f"[{status}] {name}: " + ("; ".join(problems) if problems else json.dumps(
+            [n["Node Type"] + (f" using {n['Index Name']}" if "Index Name" in n else "") for n in nodes]
+        )))
+        failures += bool(problems)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import io
+import json
+import struct
+
+import numpy as np
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from models.database import get_read_db
+from services.attendance_query_service import AttendanceQueryService
+from services.daily_attendance_service import DAY_WINDOW_AFTER, DAY_WINDOW_BEFORE
+from utils.helpers import TAIPEI_TZ, parse_ident
+from config import Config
+
+SECONDS_PER_DAY = 86400
+EPOCH_DATE = date(1970, 1, 1)
+
+# One row of COPY ... (FORMAT binary) for (int4, int8): field count, then
+# length-prefixed big-endian values. Fixed width, so it maps straight onto numpy
+COPY_ROW_DTYPE = np.dtype([
+    ("fields", ">i2"),
+    ("person_len", ">i4"), ("person", ">i4"),
+    ("seconds_len", ">i4"), ("seconds", ">i8"),
+])
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def _day_number(value: date) -> int:
+    return (value - EPOCH_DATE).days
+
+
+def _day_date(day: int) -> date:
+    return EPOCH_DATE + timedelta(days=int(day))
+
+
+def _clock(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class PunchColumns:
+    """Punches in a date range as parallel arrays, one entry per punch
+
+    person indexes into idents; local_seconds is the punch's wall-clock
+    time in the person's zone, counted in seconds from 1970-01-01 00:00
+    """
+
+    def __init__(
+        self,
+        idents: List[str],
+        join_days: np.ndarray,
+        person: np.ndarray,
+        local_seconds: np.ndarray,
+        start_day: int,
+        end_day: int
+    ):
+        self.idents = idents
+        self.cohorts, self.person_cohort = AnalyticsService.cohort_codes(idents)
+        self.join_days = join_days
+        self.person = person
+        self.local_seconds = local_seconds
+        self.start_day = start_day
+        self.end_day = end_day
+
+    @property
+    def num_people(self) -> int:
+        return len(self.idents)
+
+    @property
+    def num_days(self) -> int:
+        return self.end_day - self.start_day
+
+
+class DailyColumns:
+    """One entry per person and local day with at least one punch, sorted by (person, day)"""
+
+    def __init__(self, person: np.ndarray, day: np.ndarray, first: np.ndarray, last: np.ndarray, count: np.ndarray):
+        self.person = person
+        self.day = day
+        self.first = first
+        self.last = last
+        self.count = count
+
+
+class AnalyticsService:
+    @staticmethod
+    def cohort_codes(idents: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Cohort names and each person's index into them"""
+        cohorts, codes = np.unique(
+            np.array([parse_ident(ident)[0] for ident in idents], dtype=object),
+            return_inverse=True
+        )
+        return list(cohorts), codes.astype(np.int32)
+
+    @staticmethod
+    def load(filters: Dict[str, Any]) -> PunchColumns:
+        """Read punches for the filters into columns with one binary COPY"""
+        db = get_read_db()
+        people_filters = {"ident": filters.get("ident"), "prefix": filters.get("prefix")}
+        where, params = AttendanceQueryService.build_where(people_filters, alias="pe")
+        people = db.execute_tuples(
+            "SELECT pe.ident, (pe.created_at AT TIME ZONE attendance_time_zone(pe.time_zone))::date "
+            f"FROM people pe WHERE {where} ORDER BY pe.ident",
+            params
+        ).fetchall()
+        idents = [row[0] for row in people]
+        join_days = np.array([_day_number(row[1]) for row in people], dtype=np.int64)
+
+        if filters.get("start"):
+            start_day = _day_number(filters["start"].astimezone(TAIPEI_TZ).date())
+        if filters.get("end"):
+            end_day = _day_number(filters["end"].astimezone(TAIPEI_TZ).date())
+
+        # The range is in each person's local dates, so read a window wide
+        # enough for any UTC offset and trim by local day below
+        window = dict(filters)
+        if filters.get("start"):
+            window["start"] = filters["start"] - DAY_WINDOW_BEFORE
+        if filters.get("end"):
+            window["end"] = filters["end"] + DAY_WINDOW_AFTER
+
+        # Each person's zone is resolved once; COPY takes no bind parameters,
+        # so the query is rendered with mogrify
+        where, params = AttendanceQueryService.build_where(window)
+        query = db.cursor.mogrify(
+            "WITH p AS MATERIALIZED ("
+            "  SELECT u.ident, u.code - 1 AS code, attendance_time_zone(pe.time_zone) AS zone "
+            "  FROM unnest(%s::text[]) WITH ORDINALITY AS u(ident, code) JOIN people pe ON pe.ident = u.ident"
+            ") "
+            "SELECT p.code::int4, floor(EXTRACT(EPOCH FROM a.punch_time AT TIME ZONE p.zone))::int8 "
+            f"FROM attendance a JOIN p ON p.ident = a.ident WHERE {where}",
+            [idents] + params
+        ).decode()
+        buffer = io.BytesIO()
+        db.cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+        db.commit()
+
+        data = buffer.getbuffer()
+        if bytes(data[:11]) != COPY_SIGNATURE:
+            raise ValueError("Unexpected COPY BINARY header")
+        header_length = 19 + struct.unpack(">i", data[15:19])[0]
+        rows = np.frombuffer(data, dtype=COPY_ROW_DTYPE, offset=header_length,
+                             count=(len(data) - header_length - 2) // COPY_ROW_DTYPE.itemsize)
+        person = rows["person"].astype(np.int32)
+        local_seconds = rows["seconds"].astype(np.int64)
+
+        day = local_seconds // SECONDS_PER_DAY
+        if not filters.get("start"):
+            start_day = int(day.min()) if len(day) else 0
+        if not filters.get("end"):
+            end_day = int(day.max()) + 1 if len(day) else start_day
+        keep = (day >= start_day) & (day < end_day)
+        return PunchColumns(idents, join_days, person[keep], local_seconds[keep], start_day, end_day)
+
+    @staticmethod
+    def daily(cols: PunchColumns) -> DailyColumns:
+        """First punch, last punch and punch count per person per local day"""
+        day = cols.local_seconds // SECONDS_PER_DAY - cols.start_day
+        # One sort key orders by person, then day of the range, then time of day
+        key = np.sort((cols.person.astype(np.int64) * (1 << 20) + day) * SECONDS_PER_DAY
+                      + cols.local_seconds % SECONDS_PER_DAY)
+        if len(key) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return DailyColumns(empty.astype(np.int32), empty, empty, empty, empty)
+
+        group = key // SECONDS_PER_DAY
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        ends = np.r_[starts[1:], len(key)] - 1
+        seconds_of_day = key % SECONDS_PER_DAY
+        return DailyColumns(
+            person=(group[starts] >> 20).astype(np.int32),
+            day=(group[starts] & ((1 << 20) - 1)) + cols.start_day,
+            first=seconds_of_day[starts],
+            last=seconds_of_day[ends],
+            count=ends - starts + 1
+        )
+
+    @staticmethod
+    def workday_mask(cols: PunchColumns, workdays: Optional[List[int]] = None) -> np.ndarray:
+        """Boolean per day of the range; 1970-01-01 was a Thursday (weekday 3)"""
+        workdays = Config.ANALYTICS_WORKDAYS if workdays is None else workdays
+        weekday = (np.arange(cols.start_day, cols.end_day) + 3) % 7
+        return np.isin(weekday, workdays)
+
+    @staticmethod
+    def schedule_starts(cols: PunchColumns, schedules: Optional[Dict[str, str]] = None) -> np.ndarray:
+        """Scheduled start (seconds after local midnight) per cohort
+
+        A cohort's start comes from its own entry, then its school (the
+        letters of e.g. NTU2025), then "default"
+        """
+        schedules = Config.ANALYTICS_SCHEDULES if schedules is None else schedules
+        starts = np.empty(len(cols.cohorts), dtype=np.int64)
+        for i, cohort in enumerate(cols.cohorts):
+            school = cohort.rstrip("0123456789")
+            value = schedules.get(cohort) or schedules.get(school) or schedules.get("default", "09:00")
+            hours, minutes = value.split(":")
+            starts[i] = int(hours) * 3600 + int(minutes) * 60
+        return starts
+
+    @staticmethod
+    def lateness(
+        cols: PunchColumns,
+        daily: DailyColumns,
+        schedules: Optional[Dict[str, str]] = None,
+        grace_minutes: Optional[int] = None
+    ) -> Dict[str, np.ndarray]:
+        """Per person: workdays late and mean minutes late on those days"""
+        grace = (Config.ANALYTICS_LATE_GRACE_MINUTES if grace_minutes is None else grace_minutes) * 60
+        starts = AnalyticsService.schedule_starts(cols, schedules)
+        scheduled = starts[cols.person_cohort[daily.person]]
+        late_seconds = daily.first - scheduled
+        is_late = (late_seconds > grace) & AnalyticsService.workday_mask(cols)[daily.day - cols.start_day]
+
+        late_days = np.bincount(daily.person, weights=is_late, minlength=cols.num_people).astype(np.int64)
+        late_total = np.bincount(daily.person, weights=np.where(is_late, late_seconds, 0), minlength=cols.num_people)
+        mean_minutes = late_total / np.maximum(late_days, 1) / 60
+        return {"late_days": late_days, "mean_late_minutes": mean_minutes}
+
+    @staticmethod
+    def presence_matrix(cols: PunchColumns, daily: DailyColumns) -> np.ndarray:
+        present = np.zeros((cols.num_people, cols.num_days), dtype=bool)
+        present[daily.person, daily.day - cols.start_day] = True
+        return present
+
+    @staticmethod
+    def absence_streaks(cols: PunchColumns, daily: DailyColumns) -> Dict[str, np.ndarray]:
+        """Per person: longest and current run of workdays without a punch
+
+        Days before the person was created do not count as absences
+        """
+        present = AnalyticsService.presence_matrix(cols, daily)
+        days = np.arange(cols.start_day, cols.end_day)
+        absent = ~present & (days[None, :] >= cols.join_days[:, None])
+        absent = absent[:, AnalyticsService.workday_mask(cols)]
+        if absent.shape[1] == 0:
+            zeros = np.zeros(cols.num_people, dtype=np.int64)
+            return {"longest": zeros, "current": zeros}
+
+        # Run length at each day: absences so far minus the count at the
+        # last present day
+        total = np.cumsum(absent, axis=1)
+        at_reset = np.maximum.accumulate(np.where(absent, 0, total), axis=1)
+        runs = total - at_reset
+        return {"longest": runs.max(axis=1), "current": runs[:, -1]}
+
+    @staticmethod
+    def histograms(cols: PunchColumns) -> Dict[str, np.ndarray]:
+        """Punch counts per day of the range, per local hour, and per cohort and hour"""
+        day = cols.local_seconds // SECONDS_PER_DAY - cols.start_day
+        hour = cols.local_seconds % SECONDS_PER_DAY // 3600
+        cohort = cols.person_cohort[cols.person]
+        return {
+            "per_day": np.bincount(day, minlength=cols.num_days),
+            "per_hour": np.bincount(hour, minlength=24),
+            "per_cohort_hour": np.bincount(cohort * 24 + hour, minlength=len(cols.cohorts) * 24)
+                                 .reshape(len(cols.cohorts), 24),
+        }
+
+    @staticmethod
+    def first_last(cols: PunchColumns, daily: DailyColumns) -> Tuple[np.ndarray, np.ndarray]:
+        """Earliest and latest local punch per person in the range; -1 if none"""
+        first = np.full(cols.num_people, -1, dtype=np.int64)
+        last = np.full(cols.num_people, -1, dtype=np.int64)
+        if len(daily.person):
+            # daily is sorted by (person, day): take each person's first and last group
+            boundaries = np.flatnonzero(np.r_[True, daily.person[1:] != daily.person[:-1]])
+            ends = np.r_[boundaries[1:], len(daily.person)] - 1
+            people = daily.person[boundaries]
+            first[people] = daily.day[boundaries] * SECONDS_PER_DAY + daily.first[boundaries]
+            last[people] = daily.day[ends] * SECONDS_PER_DAY + daily.last[ends]
+        return first, last
+
+    @staticmethod
+    def report(filters: Dict[str, Any]) -> Dict[str, Any]:
+        cols = AnalyticsService.load(filters)
+        daily = AnalyticsService.daily(cols)
+        late = AnalyticsService.lateness(cols, daily)
+        streaks = AnalyticsService.absence_streaks(cols, daily)
+        hist = AnalyticsService.histograms(cols)
+        first, last = AnalyticsService.first_last(cols, daily)
+        days_present = np.bincount(daily.person, minlength=cols.num_people)
+
+        def local_iso(seconds: int) -> Optional[str]:
+            if seconds < 0:
+                return None
+            return f"{_day_date(seconds // SECONDS_PER_DAY).isoformat()}T{_clock(int(seconds % SECONDS_PER_DAY))}"
+
+        people = [
+            {
+                "ident": ident,
+                "cohort": cols.cohorts[cols.person_cohort[i]],
+                "days_present": int(days_present[i]),
+                "late_days": int(late["late_days"][i]),
+                "mean_late_minutes": round(float(late["mean_late_minutes"][i]), 1),
+                "longest_absence_streak": int(streaks["longest"][i]),
+                "current_absence_streak": int(streaks["current"][i]),
+                "first_punch": local_iso(int(first[i])),
+                "last_punch": local_iso(int(last[i])),
+            }
+            for i, ident in enumerate(cols.idents)
+        ]
+        return {
+            "from": _day_date(cols.start_day).isoformat(),
+            "to": _day_date(cols.end_day).isoformat(),
+            "punches": int(len(cols.person)),
+            "people": people,
+            "per_day": {
+                _day_date(cols.start_day + i).isoformat(): int(n) for i, n in enumerate(hist["per_day"])
+            },
+            "per_hour": hist["per_hour"].tolist(),
+            "per_cohort_hour": {
+                cohort: hist["per_cohort_hour"][i].tolist() for i, cohort in enumerate(cols.cohorts)
+            },
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    from flask import Flask
+    from models.database import close_db
+
+    parser = argparse.ArgumentParser(description="Attendance report: lateness, absence streaks, histograms")
+    parser.add_argument("--from", dest="start", required=True, help="first local date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", default=None, help="local date to stop before (default: tomorrow)")
+    parser.add_argument("--ident", default=None)
+    parser.add_argument("--prefix", default=None, help="ident prefix, e.g. a cohort")
+    args = parser.parse_args()
+
+    end = args.end or (datetime.now(TAIPEI_TZ).date() + timedelta(days=1)).isoformat()
+    cli_app = Flask(__name__)
+    cli_app.config.from_object(Config)
+    cli_app.teardown_appcontext(close_db)
+    with cli_app.app_context():
+        filters = AttendanceQueryService.parse_filters({
+            "ident": args.ident, "prefix": args.prefix, "from": args.start, "to": end
+        })
+        print(json.dumps(AnalyticsService.report(filters), indent=2))
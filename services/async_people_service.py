@@ -0,0 +1,30 @@
+from typing import Any, Dict, List, Optional
+from models.database import PREPARED_STATEMENTS
+from services.people_service import PeopleService
+
+
+class AsyncPeopleService:
+    """PeopleService reads for the ASGI app's native routes, on a connection from acquire_async"""
+
+    @staticmethod
+    async def list_version(conn) -> int:
+        version = await conn.fetchval("SELECT version FROM people_version")
+        return version or 0
+
+    @staticmethod
+    async def list_all(conn) -> List[Dict[str, Any]]:
+        rows = await conn.fetch(PeopleService.LIST_ALL_QUERY)
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    async def list_page(conn, prefix: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Same pages and cursors as PeopleService.list_page"""
+        limit = PeopleService.page_limit(limit)
+        sql, params = PeopleService.page_query(prefix, limit, cursor, placeholder="${}")
+        rows = await conn.fetch(sql, *params)
+        return PeopleService.page_result([dict(r) for r in rows], limit)
+
+    @staticmethod
+    async def get_by_ident(conn, ident: str) -> Optional[Dict[str, Any]]:
+        row = await conn.fetchrow(PREPARED_STATEMENTS["get_person"], ident)
+        return dict(row) if row is not None else None
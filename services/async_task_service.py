@@ -1,39 +1,161 @@
+import os
 import time
+import pickle
+import threading
 import traceback
 import atexit
 
-from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Callable, Dict, Any, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Any, Iterable, List, Optional, Tuple
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from config import Config
 
 TAIPEI_TZ = ZoneInfo("Asia/Taipei")
 
 
+class TaskQueueFullError(RuntimeError):
+    pass
+
+
+class TaskRecord:
+    __slots__ = (
+        "task_id",
+        "task_name",
+        "status",
+        "created_at",
+        "start_time",
+        "end_time",
+        "duration_ms",
+        "result",
+        "error",
+        "version",
+        "submitted_at",
+        "finished_at",
+    )
+
+    def __init__(self, task_id: str, task_name: str, created_at: str):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.status = "pending"
+        self.created_at = created_at
+        self.start_time = None
+        self.end_time = None
+        self.duration_ms = None
+        self.result = None
+        self.error = None
+        # Sequence number of the last state change, for update subscribers
+        self.version = 0
+        # Monotonic timestamps, used for queue age and TTL eviction only
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "task_name": self.task_name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": self.duration_ms,
+            "success": self.status == "completed",
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class TaskLane:
+    __slots__ = ("name", "executor", "max_workers", "pending", "running", "spilled_tasks")
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f'{name}-task-'
+        )
+        self.pending = 0
+        self.running = 0
+        self.spilled_tasks: Deque[Tuple[TaskRecord, Callable, str]] = deque()
+
+
 class AsyncTaskService:
-    _executor: Optional[ThreadPoolExecutor] = None
+    DEFAULT_LANE = "default"
+    
+    # Each lane is a separate executor with its own concurrency limit, so
+    # e.g. image uploads do not compete with Sheets calls for threads
+    _lanes: Dict[str, TaskLane] = {}
     _max_workers: int = 20
+    _lock = threading.Lock()
     
-    _active_tasks: Dict[str, Future] = {}
-    _task_results: Dict[str, Dict[str, Any]] = {}
-    _task_metadata: Dict[str, Dict[str, Any]] = {}
-    _max_results_history: int = 1000
+    # Pending/running tasks, and finished tasks in completion order
+    _active_tasks: Dict[str, TaskRecord] = {}
+    _task_results: "OrderedDict[str, TaskRecord]" = OrderedDict()
+    _max_results_history: int = Config.TASK_HISTORY_MAX
+    _results_ttl_seconds: int = Config.TASK_HISTORY_TTL_SECONDS
+    
+    # Admission control: per lane, at most max_workers running plus
+    # _max_queue_size waiting; overflow is rejected, blocked or spilled
+    _capacity_available = threading.Condition(_lock)
+    _max_queue_size: int = Config.TASK_QUEUE_MAX_SIZE
+    _queue_policy: str = Config.TASK_QUEUE_POLICY
+    _block_timeout_seconds: float = Config.TASK_QUEUE_BLOCK_TIMEOUT_SECONDS
+    _spill_dir: str = Config.TASK_QUEUE_SPILL_DIR
+    
+    # Every state transition bumps _event_seq and wakes update subscribers:
+    # threads waiting on _state_changed, and listener callbacks, which the
+    # ASGI routes use to wake coroutines without holding a thread
+    _state_changed = threading.Condition(_lock)
+    _event_seq: int = 0
+    _listeners: List[Callable[[], None]] = []
+    
+    _counters: Dict[str, int] = {
+        "submitted": 0,
+        "pending": 0,
+        "spilled": 0,
+        "running": 0,
+        "completed": 0,
+        "failed": 0,
+        "rejected": 0,
+        "total_duration_ms": 0
+    }
     
     @staticmethod
     def initialize(max_workers: int = 20):
-        if AsyncTaskService._executor is None:
+        if AsyncTaskService.DEFAULT_LANE not in AsyncTaskService._lanes:
             AsyncTaskService._max_workers = max_workers
-            AsyncTaskService._executor = ThreadPoolExecutor(
-                max_workers=max_workers,
-                thread_name_prefix='async-task-'
-            )
+            AsyncTaskService.register_lane(AsyncTaskService.DEFAULT_LANE, max_workers)
+            if AsyncTaskService._queue_policy == "spill":
+                # A spill file holds only the task's arguments; its function
+                # lived in the old process, so leftovers cannot be replayed
+                os.makedirs(AsyncTaskService._spill_dir, exist_ok=True)
+                leftovers = [name for name in os.listdir(AsyncTaskService._spill_dir) if name.endswith(".pkl")]
+                for name in leftovers:
+                    os.remove(os.path.join(AsyncTaskService._spill_dir, name))
+                if leftovers:
+                    print(f"[ASYNC TASK] Dropped {len(leftovers)} spilled task(s) left by a previous process in {AsyncTaskService._spill_dir}")
             atexit.register(AsyncTaskService.shutdown)
     
+    @staticmethod
+    def register_lane(name: str, max_workers: int):
+        with AsyncTaskService._lock:
+            if name not in AsyncTaskService._lanes:
+                AsyncTaskService._lanes[name] = TaskLane(name, max_workers)
+    
     @staticmethod
     def shutdown(wait: bool = True):
-        if AsyncTaskService._executor is not None:
-            AsyncTaskService._executor.shutdown(wait=wait)
-            AsyncTaskService._executor = None
+        with AsyncTaskService._lock:
+            lanes = list(AsyncTaskService._lanes.values())
+            AsyncTaskService._lanes = {}
+        for lane in lanes:
+            lane.executor.shutdown(wait=wait)
+    
+    @staticmethod
+    def _has_capacity(lane: TaskLane) -> bool:
+        in_flight = lane.pending + lane.running
+        return in_flight < lane.max_workers + AsyncTaskService._max_queue_size
     
     @staticmethod
     def submit_task(
@@ -42,136 +164,339 @@ class AsyncTaskService:
         *args,
         **kwargs
     ) -> str:
-        if AsyncTaskService._executor is None:
+        return AsyncTaskService.submit_task_to_lane(
+            AsyncTaskService.DEFAULT_LANE, task_func, task_name, *args, **kwargs
+        )
+    
+    @staticmethod
+    def submit_task_nowait(
+        task_func: Callable,
+        task_name: str,
+        *args,
+        **kwargs
+    ) -> str:
+        """submit_task for callers that must not wait, such as other tasks: a full
+        queue raises TaskQueueFullError at once even under the block policy"""
+        policy = AsyncTaskService._queue_policy
+        return AsyncTaskService._submit(
+            AsyncTaskService.DEFAULT_LANE, "reject" if policy == "block" else policy,
+            task_func, task_name, args, kwargs
+        )
+    
+    @staticmethod
+    def submit_task_to_lane(
+        lane_name: str,
+        task_func: Callable,
+        task_name: str,
+        *args,
+        **kwargs
+    ) -> str:
+        return AsyncTaskService._submit(
+            lane_name, AsyncTaskService._queue_policy, task_func, task_name, args, kwargs
+        )
+    
+    @staticmethod
+    def _submit(lane_name: str, policy: str, task_func: Callable, task_name: str, args: tuple, kwargs: dict) -> str:
+        if AsyncTaskService.DEFAULT_LANE not in AsyncTaskService._lanes:
             AsyncTaskService.initialize()
         
+        lane = AsyncTaskService._lanes.get(lane_name)
+        if lane is None:
+            raise ValueError(f"Unknown task lane: {lane_name}")
         now = datetime.now(TAIPEI_TZ)
         task_id = f"{task_name}_{now.strftime('%Y%m%d_%H%M%S_%f')}"
-        created_at = now.isoformat()
+        record = TaskRecord(task_id, task_name, now.isoformat())
+        spill = False
         
-        AsyncTaskService._task_metadata[task_id] = {
-            "task_id": task_id,
-            "name": task_name,
-            "status": "pending",
-            "created_at": created_at,
-            "started_at": None,
-            "completed_at": None,
-            "result": None,
-            "error": None
-        }
+        with AsyncTaskService._capacity_available:
+            if policy == "spill" and lane.spilled_tasks:
+                # Keep FIFO order behind tasks that are already on disk
+                spill = True
+            elif not AsyncTaskService._has_capacity(lane):
+                if policy == "block":
+                    AsyncTaskService._capacity_available.wait_for(
+                        lambda: AsyncTaskService._has_capacity(lane),
+                        timeout=AsyncTaskService._block_timeout_seconds
+                    )
+                    admitted = AsyncTaskService._has_capacity(lane)
+                elif policy == "spill":
+                    spill = admitted = True
+                else:
+                    admitted = False
+                
+                if not admitted:
+                    AsyncTaskService._counters["rejected"] += 1
+                    raise TaskQueueFullError(
+                        f"Background task queue '{lane.name}' is full, rejected task: {task_name}"
+                    )
+            
+            AsyncTaskService._active_tasks[task_id] = record
+            AsyncTaskService._publish_change(record)
+            AsyncTaskService._counters["submitted"] += 1
+            if not spill:
+                lane.pending += 1
+                AsyncTaskService._counters["pending"] += 1
         
+        if spill:
+            try:
+                path = AsyncTaskService._spill_to_disk(task_id, args, kwargs)
+            except Exception as e:
+                with AsyncTaskService._lock:
+                    AsyncTaskService._active_tasks.pop(task_id, None)
+                    AsyncTaskService._counters["submitted"] -= 1
+                    AsyncTaskService._counters["rejected"] += 1
+                raise TaskQueueFullError(f"Failed to spill task {task_name} to disk: {e}")
+            
+            with AsyncTaskService._lock:
+                lane.spilled_tasks.append((record, task_func, path))
+                AsyncTaskService._counters["spilled"] += 1
+            AsyncTaskService._drain_spilled(lane)
+        else:
+            try:
+                AsyncTaskService._dispatch(lane, record, task_func, args, kwargs)
+            except Exception:
+                with AsyncTaskService._capacity_available:
+                    AsyncTaskService._active_tasks.pop(task_id, None)
+                    AsyncTaskService._counters["submitted"] -= 1
+                    AsyncTaskService._counters["pending"] -= 1
+                    lane.pending -= 1
+                    AsyncTaskService._capacity_available.notify_all()
+                raise
+        
+        return task_id
+    
+    @staticmethod
+    def _dispatch(lane: TaskLane, record: TaskRecord, task_func: Callable, args: tuple, kwargs: dict):
+        # Caller has already counted the task as pending
         def task_wrapper():
             start_time = time.time()
-            started_at = datetime.now(TAIPEI_TZ).isoformat()
-            
-            if task_id in AsyncTaskService._task_metadata:
-                AsyncTaskService._task_metadata[task_id]["status"] = "running"
-                AsyncTaskService._task_metadata[task_id]["started_at"] = started_at
             
-            result = {
-                "task_id": task_id,
-                "task_name": task_name,
-                "status": "running",
-                "start_time": started_at,
-                "end_time": None,
-                "duration_ms": None,
-                "success": False,
-                "result": None,
-                "error": None
-            }
+            with AsyncTaskService._lock:
+                record.status = "running"
+                record.start_time = datetime.now(TAIPEI_TZ).isoformat()
+                AsyncTaskService._publish_change(record)
+                AsyncTaskService._counters["pending"] -= 1
+                AsyncTaskService._counters["running"] += 1
+                lane.pending -= 1
+                lane.running += 1
             
+            status = "failed"
+            task_result = None
+            error = None
             try:
                 task_result = task_func(*args, **kwargs)
-                
-                result["status"] = "completed"
-                result["success"] = True
-                result["result"] = task_result
-                
+                status = "completed"
             except Exception as e:
-                result["status"] = "failed"
-                result["success"] = False
-                result["error"] = str(e)
-                result["traceback"] = traceback.format_exc()
-                
+                error = str(e)
+                traceback.print_exc()
             finally:
-                end_time = time.time()
-                completed_at = datetime.now(TAIPEI_TZ).isoformat()
-                result["end_time"] = completed_at
-                result["duration_ms"] = int((end_time - start_time) * 1000)
-                
-                if task_id in AsyncTaskService._task_metadata:
-                    AsyncTaskService._task_metadata[task_id]["status"] = result["status"]
-                    AsyncTaskService._task_metadata[task_id]["completed_at"] = completed_at
-                    AsyncTaskService._task_metadata[task_id]["result"] = result.get("result")
-                    AsyncTaskService._task_metadata[task_id]["error"] = result.get("error")
-                
-                AsyncTaskService._store_result(task_id, result)
-                
-                if task_id in AsyncTaskService._active_tasks:
-                    del AsyncTaskService._active_tasks[task_id]
+                duration_ms = int((time.time() - start_time) * 1000)
+                AsyncTaskService._finish_task(lane, record, status, task_result, error, duration_ms)
+                AsyncTaskService._drain_spilled(lane)
             
-            return result
+            return record
         
-        future = AsyncTaskService._executor.submit(task_wrapper)
-        AsyncTaskService._active_tasks[task_id] = future
-        
-        return task_id
+        lane.executor.submit(task_wrapper)
     
     @staticmethod
-    def _store_result(task_id: str, result: Dict[str, Any]):
-        AsyncTaskService._task_results[task_id] = result
-        
-        if len(AsyncTaskService._task_results) > AsyncTaskService._max_results_history:
-            to_remove = len(AsyncTaskService._task_results) - AsyncTaskService._max_results_history
-            oldest_keys = sorted(AsyncTaskService._task_results.keys())[:to_remove]
-            for key in oldest_keys:
-                del AsyncTaskService._task_results[key]
+    def _spill_to_disk(task_id: str, args: tuple, kwargs: dict) -> str:
+        os.makedirs(AsyncTaskService._spill_dir, exist_ok=True)
+        path = os.path.join(AsyncTaskService._spill_dir, f"{task_id}.pkl")
+        with open(path, "wb") as f:
+            pickle.dump((args, kwargs), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
     
     @staticmethod
-    def get_task_status(task_id: str) -> Optional[Dict[str, Any]]:
-        if task_id in AsyncTaskService._task_metadata:
-            metadata = AsyncTaskService._task_metadata[task_id]
+    def _drain_spilled(lane: TaskLane):
+        while True:
+            with AsyncTaskService._lock:
+                if not lane.spilled_tasks or not AsyncTaskService._has_capacity(lane):
+                    return
+                record, task_func, path = lane.spilled_tasks.popleft()
+                AsyncTaskService._counters["spilled"] -= 1
+                AsyncTaskService._counters["pending"] += 1
+                lane.pending += 1
             
-            if task_id in AsyncTaskService._active_tasks:
-                future = AsyncTaskService._active_tasks[task_id]
-                if not future.done():
-                    return metadata
+            try:
+                with open(path, "rb") as f:
+                    args, kwargs = pickle.load(f)
+                os.remove(path)
+                AsyncTaskService._dispatch(lane, record, task_func, args, kwargs)
+            except Exception as e:
+                print(f"[ASYNC TASK] Failed to restore spilled task {record.task_id}: {e}")
+                with AsyncTaskService._lock:
+                    AsyncTaskService._counters["pending"] -= 1
+                    AsyncTaskService._counters["running"] += 1
+                    lane.pending -= 1
+                    lane.running += 1
+                AsyncTaskService._finish_task(lane, record, "failed", None, str(e), 0)
+    
+    @staticmethod
+    def _finish_task(
+        lane: TaskLane,
+        record: TaskRecord,
+        status: str,
+        task_result: Any,
+        error: Optional[str],
+        duration_ms: int
+    ):
+        with AsyncTaskService._lock:
+            record.status = status
+            record.end_time = datetime.now(TAIPEI_TZ).isoformat()
+            record.duration_ms = duration_ms
+            record.result = task_result
+            record.error = error
+            record.finished_at = time.monotonic()
+            AsyncTaskService._publish_change(record)
             
-            if task_id in AsyncTaskService._task_results:
-                return AsyncTaskService._task_results[task_id]
+            AsyncTaskService._active_tasks.pop(record.task_id, None)
+            AsyncTaskService._task_results[record.task_id] = record
             
-            return metadata
+            counters = AsyncTaskService._counters
+            counters["running"] -= 1
+            counters[status] += 1
+            counters["total_duration_ms"] += duration_ms
+            lane.running -= 1
+            
+            AsyncTaskService._evict_results(record.finished_at)
+            AsyncTaskService._capacity_available.notify_all()
+    
+    @staticmethod
+    def _publish_change(record: TaskRecord):
+        # Caller holds the lock
+        AsyncTaskService._event_seq += 1
+        record.version = AsyncTaskService._event_seq
+        AsyncTaskService._state_changed.notify_all()
+        for callback in AsyncTaskService._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[TASK] Update listener failed: {e}")
+    
+    @staticmethod
+    def add_listener(callback: Callable[[], None]):
+        """Call callback on every task state change; it runs under the task lock, so it must not block"""
+        with AsyncTaskService._lock:
+            AsyncTaskService._listeners = AsyncTaskService._listeners + [callback]
+    
+    @staticmethod
+    def remove_listener(callback: Callable[[], None]):
+        with AsyncTaskService._lock:
+            AsyncTaskService._listeners = [c for c in AsyncTaskService._listeners if c is not callback]
+    
+    @staticmethod
+    def _evict_results(now: float):
+        # Results are kept in completion order, so both the size cap and the
+        # TTL only ever need to pop from the front. Caller holds the lock.
+        results = AsyncTaskService._task_results
+        while results:
+            oldest = next(iter(results.values()))
+            if (len(results) > AsyncTaskService._max_results_history
+                    or now - oldest.finished_at > AsyncTaskService._results_ttl_seconds):
+                results.popitem(last=False)
+            else:
+                break
+    
+    @staticmethod
+    def get_task_status(task_id: str) -> Optional[Dict[str, Any]]:
+        with AsyncTaskService._lock:
+            AsyncTaskService._evict_results(time.monotonic())
+            record = (AsyncTaskService._active_tasks.get(task_id)
+                      or AsyncTaskService._task_results.get(task_id))
+            return record.to_dict() if record else None
+    
+    @staticmethod
+    def _collect_updates(task_ids: List[str], since: int) -> List[Dict[str, Any]]:
+        # Caller holds the lock
+        updates = []
+        for task_id in task_ids:
+            record = (AsyncTaskService._active_tasks.get(task_id)
+                      or AsyncTaskService._task_results.get(task_id))
+            if record is not None and record.version > since:
+                updates.append(record.to_dict())
+        return updates
+    
+    @staticmethod
+    def get_updates(task_ids: Iterable[str], since: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """wait_for_updates without the wait: the current sequence and tasks changed after since"""
+        with AsyncTaskService._lock:
+            return AsyncTaskService._event_seq, AsyncTaskService._collect_updates(list(task_ids), since)
+    
+    @staticmethod
+    def wait_for_updates(
+        task_ids: Iterable[str],
+        since: int = 0,
+        timeout: float = 15.0
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        # Blocks until any of task_ids changed after sequence `since`. Returns
+        # the current sequence (the next call's `since`) and the changed tasks,
+        # which is empty if the timeout expired first.
+        task_ids = list(task_ids)
+        deadline = time.monotonic() + timeout
         
-        return AsyncTaskService._task_results.get(task_id)
+        with AsyncTaskService._state_changed:
+            while True:
+                updates = AsyncTaskService._collect_updates(task_ids, since)
+                
+                remaining = deadline - time.monotonic()
+                if updates or remaining <= 0:
+                    return AsyncTaskService._event_seq, updates
+                AsyncTaskService._state_changed.wait(remaining)
+    
+    @staticmethod
+    def get_queue_status() -> Dict[str, Any]:
+        with AsyncTaskService._lock:
+            counters = AsyncTaskService._counters
+            oldest = next(iter(AsyncTaskService._active_tasks.values()), None)
+            oldest_age = time.monotonic() - oldest.submitted_at if oldest else 0.0
+            return {
+                "queue_depth": counters["pending"] + counters["spilled"],
+                "spilled_tasks": counters["spilled"],
+                "oldest_task_age_seconds": round(oldest_age, 3),
+                "max_queue_size": AsyncTaskService._max_queue_size,
+                "queue_policy": AsyncTaskService._queue_policy
+            }
     
     @staticmethod
     def get_stats() -> Dict[str, Any]:
-        total_tasks = len(AsyncTaskService._task_results)
-        pending_tasks = sum(1 for m in AsyncTaskService._task_metadata.values() if m.get("status") == "pending")
-        running_tasks = sum(1 for m in AsyncTaskService._task_metadata.values() if m.get("status") == "running")
-        
-        completed = sum(1 for r in AsyncTaskService._task_results.values() if r.get("status") == "completed")
-        failed = sum(1 for r in AsyncTaskService._task_results.values() if r.get("status") == "failed")
-        
-        durations = [r.get("duration_ms", 0) for r in AsyncTaskService._task_results.values() if r.get("duration_ms")]
-        avg_duration = sum(durations) / len(durations) if durations else 0
+        with AsyncTaskService._lock:
+            AsyncTaskService._evict_results(time.monotonic())
+            counters = dict(AsyncTaskService._counters)
+            retained_results = len(AsyncTaskService._task_results)
+            lanes = {
+                lane.name: {
+                    "max_workers": lane.max_workers,
+                    "pending": lane.pending,
+                    "running": lane.running,
+                    "spilled": len(lane.spilled_tasks)
+                }
+                for lane in AsyncTaskService._lanes.values()
+            }
+        queue_status = AsyncTaskService.get_queue_status()
         
-        active_workers = 0
-        if AsyncTaskService._executor:
-            active_workers = len(AsyncTaskService._active_tasks)
+        finished = counters["completed"] + counters["failed"]
+        avg_duration = counters["total_duration_ms"] / finished if finished else 0
+        active_tasks = counters["pending"] + counters["spilled"] + counters["running"]
         
         return {
-            "total_tasks": total_tasks,
-            "pending_tasks": pending_tasks,
-            "running_tasks": running_tasks,
-            "active_tasks": active_workers,
-            "completed_tasks": completed,
-            "failed_tasks": failed,
-            "success_rate": f"{(completed / total_tasks * 100):.1f}%" if total_tasks > 0 else "N/A",
+            "total_tasks": finished,
+            "submitted_tasks": counters["submitted"],
+            "pending_tasks": counters["pending"],
+            "running_tasks": counters["running"],
+            "active_tasks": active_tasks,
+            "completed_tasks": counters["completed"],
+            "failed_tasks": counters["failed"],
+            "rejected_tasks": counters["rejected"],
+            "success_rate": f"{(counters['completed'] / finished * 100):.1f}%" if finished > 0 else "N/A",
             "average_duration_ms": int(avg_duration),
+            "retained_results": retained_results,
+            "max_results_history": AsyncTaskService._max_results_history,
+            "results_ttl_seconds": AsyncTaskService._results_ttl_seconds,
             "max_workers": AsyncTaskService._max_workers,
-            "active_workers": active_workers,
-            "executor_status": "active" if AsyncTaskService._executor else "shutdown"
+            "active_workers": counters["running"],
+            "executor_status": "active" if AsyncTaskService._lanes else "shutdown",
+            "lanes": lanes,
+            **queue_status
         }
 
 def with_retry(max_retries: int = 3, initial_delay: float = 1.0, backoff_factor: float = 2.0):
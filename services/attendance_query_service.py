@@ -0,0 +1,123 @@
+import json
+import base64
+
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional, Tuple
+from flask import abort
+from models.database import get_db
+from services.storage_service import StorageService
+from utils.helpers import TAIPEI_TZ
+from config import Config
+
+
+class AttendanceQueryService:
+    @staticmethod
+    def _parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+        # Accepts a date (local midnight in Asia/Taipei) or an ISO datetime
+        if not value:
+            return None
+        try:
+            if len(value) == 10:
+                return datetime.combine(date.fromisoformat(value), datetime.min.time(), TAIPEI_TZ)
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            abort(400, f"{name} must be an ISO date or datetime")
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=TAIPEI_TZ)
+
+    @staticmethod
+    def parse_filters(args) -> Dict[str, Any]:
+        """Read ident, prefix, from and to (to is exclusive) from request args"""
+        filters = {
+            "ident": (args.get("ident") or "").strip() or None,
+            "prefix": (args.get("prefix") or "").strip() or None,
+            "start": AttendanceQueryService._parse_time(args.get("from"), "from"),
+            "end": AttendanceQueryService._parse_time(args.get("to"), "to"),
+        }
+        if filters["start"] and filters["end"] and filters["start"] >= filters["end"]:
+            abort(400, "from must be earlier than to")
+        return filters
+
+    @staticmethod
+    def build_where(filters: Dict[str, Any], alias: str = "a") -> Tuple[str, List[Any]]:
+        """Shared WHERE clause for attendance reads; returns (sql, params)"""
+        clauses = []
+        params: List[Any] = []
+        if filters.get("ident"):
+            clauses.append(f"{alias}.ident = %s")
+            params.append(filters["ident"])
+        elif filters.get("prefix"):
+            escaped = filters["prefix"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append(f"{alias}.ident LIKE %s")
+            params.append(escaped + "%")
+        if filters.get("start"):
+            clauses.append(f"{alias}.punch_time >= %s")
+            params.append(filters["start"])
+        if filters.get("end"):
+            clauses.append(f"{alias}.punch_time < %s")
+            params.append(filters["end"])
+        return (" AND ".join(clauses) if clauses else "TRUE"), params
+
+    @staticmethod
+    def encode_cursor(punch_time: datetime, attendance_id: int) -> str:
+        raw = json.dumps([punch_time.isoformat(), attendance_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            punch_time, attendance_id = json.loads(raw)
+            return datetime.fromisoformat(punch_time), int(attendance_id)
+        except (ValueError, TypeError):
+            abort(400, "Invalid cursor")
+
+    @staticmethod
+    def page_query(
+        filters: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[str, List[Any]]:
+        where, params = AttendanceQueryService.build_where(filters)
+        if cursor:
+            after_time, after_id = AttendanceQueryService.decode_cursor(cursor)
+            where += " AND (a.punch_time, a.id) < (%s, %s)"
+            params.extend([after_time, after_id])
+        sql = (
+            "SELECT a.id, a.ident, a.punch_time, a.image_url "
+            f"FROM attendance a WHERE {where} "
+            "ORDER BY a.punch_time DESC, a.id DESC LIMIT %s"
+        )
+        return sql, params + [limit]
+
+    @staticmethod
+    def list_page(
+        filters: Dict[str, Any],
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # Keyset pagination, newest first: each page seeks past the last
+        # (punch_time, id) instead of OFFSET, so deep pages cost the same
+        # as the first one
+        limit = max(1, min(limit, Config.ATTENDANCE_PAGE_MAX_SIZE))
+        sql, params = AttendanceQueryService.page_query(filters, limit + 1, cursor)
+        db = get_db()
+        rows = db.execute(sql, params).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        resolved = StorageService.resolve_image_urls(r["image_url"] for r in rows)
+        items = [
+            {
+                "id": r["id"],
+                "ident": r["ident"],
+                "punch_time": r["punch_time"].astimezone(TAIPEI_TZ).isoformat(),
+                "image_url": resolved.get(r["image_url"])
+            }
+            for r in rows
+        ]
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = AttendanceQueryService.encode_cursor(last["punch_time"], last["id"])
+        return {"items": items, "next_cursor": next_cursor}
@@ -1,106 +1,218 @@
 import numpy as np
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras
 
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 from flask import abort, current_app
 from models.database import get_db
-from utils.helpers import now_iso_seconds
+from utils.cache import TTLCache
+from utils.helpers import now_iso_seconds, TAIPEI_TZ
 from services.google_sheets_service import GoogleSheetsService
 from services.storage_service import StorageService
-from services.async_task_service import AsyncTaskService, with_retry
+from services.people_service import PeopleService
+from services.async_task_service import AsyncTaskService, TaskQueueFullError, with_retry
+from services.upload_service import UploadService
+from utils.image_processing import compress_image_to_bytes, is_decodable
 from config import Config
 
 class AttendanceService:
+    # ident -> latest punch in this process, expiring after the debounce window
+    _recent_punches = TTLCache(Config.IDENT_CACHE_SIZE, Config.PUNCH_DEBOUNCE_SECONDS)
+    
     @staticmethod
-    def punch(ident: str, face_image: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    def image_link(attendance_id: int, image_key: str) -> str:
+        # A stable app link survives signed-URL expiry; without a configured
+        # base URL fall back to a URL minted now
+        if Config.PUBLIC_BASE_URL:
+            return f"{Config.PUBLIC_BASE_URL}/api/attendance/{attendance_id}/image"
+        return StorageService.resolve_image_url(image_key)
+    
+    @staticmethod
+    def get_image_urls(attendance_ids: List[int]) -> Dict[int, Optional[str]]:
+        if not attendance_ids:
+            return {}
         db = get_db()
-        person = db.execute(
-            "SELECT ident FROM people WHERE ident = %s", 
-            (ident,)
-        ).fetchone()
-        if not person:
+        rows = db.execute(
+            "SELECT id, image_url FROM attendance WHERE id = ANY(%s)",
+            (list(attendance_ids),)
+        ).fetchall()
+        resolved = StorageService.resolve_image_urls(r["image_url"] for r in rows)
+        return {r["id"]: resolved.get(r["image_url"]) for r in rows}
+    
+    @staticmethod
+    def _append_sheets_record(ident: str, punch_time: str, image_url: Optional[str]):
+        @with_retry(max_retries=3, initial_delay=1.0, backoff_factor=2.0)
+        def sheets_upload():
+            return GoogleSheetsService.append_attendance_record(
+                ident=ident,
+                punch_time=punch_time,
+                image_url=image_url
+            )
+        
+        try:
+            sheets_result = sheets_upload()
+            print(f"[ATTENDANCE TASK] Google Sheets upload result: {sheets_result}")
+            return sheets_result
+        except Exception as e:
+            print(f"[ATTENDANCE TASK] Google Sheets upload failed after retries: {e}")
+            # Don't raise - the punch and image are already stored
+            return {"success": False, "error": str(e)}
+    
+    @staticmethod
+    def _duplicate_result(ident: str, attendance_id: int, punch_time: str) -> Dict[str, Any]:
+        # Repeat punches inside the debounce window return the first record
+        # and skip image upload and Sheets work
+        return {
+            "ident": ident,
+            "punch_time": punch_time,
+            "attendance_id": attendance_id,
+            "message": "Attendance already recorded",
+            "duplicate": True,
+            "background_task": None
+        }
+    
+    @staticmethod
+    def punch(
+        ident: str,
+        face_image: Optional[np.ndarray] = None,
+        image_bytes: Optional[bytes] = None,
+        face_box: Optional[Tuple[int, int, int, int]] = None
+    ) -> Dict[str, Any]:
+        # Idents that recently failed are rejected without touching the DB
+        if PeopleService.cached_exists(ident) is False:
             abort(404, "Person with this ident not found")
         
+        debounce_seconds = Config.PUNCH_DEBOUNCE_SECONDS
+        if debounce_seconds > 0:
+            recent = AttendanceService._recent_punches.get(ident)
+            if recent is not None:
+                return AttendanceService._duplicate_result(ident, recent["attendance_id"], recent["punch_time"])
+        
         punch_time = now_iso_seconds()
         
-        result = db.execute(
-            "INSERT INTO attendance (ident, punch_time, image_url, created_at) VALUES (%s, %s, %s, %s) RETURNING id",
-            (ident, punch_time, None, punch_time)
-        )
-        attendance_id = result.fetchone()['id']
-        db.commit()
+        # One statement: the attendance.ident foreign key reports unknown people
+        db = get_db()
+        try:
+            if debounce_seconds > 0:
+                # The advisory lock serialises punches per ident across workers,
+                # so the recent-punch check and the insert cannot race
+                row = db.execute_prepared(
+                    "insert_punch_debounced",
+                    (ident, punch_time, debounce_seconds),
+                    advisory_lock=f"punch:{ident}"
+                ).fetchone()
+            else:
+                row = db.execute_prepared("insert_punch", (ident, punch_time, None, punch_time)).fetchone()
+            db.commit()
+        except psycopg2.errors.ForeignKeyViolation:
+            db.rollback()
+            PeopleService.remember_exists(ident, False)
+            abort(404, "Person with this ident not found")
+        PeopleService.remember_exists(ident, True)
+        
+        attendance_id = row['id']
+        if debounce_seconds > 0:
+            if not row['inserted']:
+                existing_time = row['punch_time'].astimezone(TAIPEI_TZ)
+                remaining = debounce_seconds - (datetime.now(TAIPEI_TZ) - existing_time).total_seconds()
+                existing_time = existing_time.isoformat()
+                AttendanceService._recent_punches.put(
+                    ident, {"attendance_id": attendance_id, "punch_time": existing_time}, max(remaining, 0)
+                )
+                return AttendanceService._duplicate_result(ident, attendance_id, existing_time)
+            AttendanceService._recent_punches.put(
+                ident, {"attendance_id": attendance_id, "punch_time": punch_time}
+            )
         
         combined_task_id = None
         if face_image is not None:
             app = current_app._get_current_object()
             
             try:
-                def combined_upload_task():
+                # The image is passed as a task argument rather than captured,
+                # so the task queue can spill it to disk under backpressure
+                def combined_upload_task(image: np.ndarray, source_bytes: Optional[bytes]):
                     print(f"[ATTENDANCE TASK] Starting combined upload for {ident}")
                     
-                    # Upload to GCS with retry
+                    box = face_box
+                    if Config.ATTENDANCE_IMAGE_MODE in ("face", "face_context") and box is None:
+                        from services.face_service import FaceService
+                        box = FaceService.detect_face_box(image)
+                        if box is None:
+                            print("[ATTENDANCE TASK] No face found, storing full frame instead")
+                    
+                    # Upload to storage with retry
                     @with_retry(max_retries=3, initial_delay=1.0, backoff_factor=2.0)
-                    def gcs_upload():
-                        if Config.GCS_USE_PUBLIC_URLS:
-                            success, url, error = StorageService.upload_attendance_image(
-                                face_image, ident, punch_time
-                            )
-                        else:
-                            success, url, error = StorageService.upload_attendance_image_with_expiry(
-                                face_image, ident, punch_time, Config.GCS_SIGNED_URL_EXPIRY_HOURS
-                            )
-                        
+                    def storage_upload():
+                        success, key, error = StorageService.store_punch_image(
+                            image, ident, punch_time, source_bytes=source_bytes, face_box=box
+                        )
                         if not success:
-                            raise Exception(f"GCS upload failed: {error}")
-                        return url
-                    
-                    try:
-                        url = gcs_upload()
-                        print(f"[ATTENDANCE TASK] GCS upload successful: {url}")
-                    except Exception as e:
-                        print(f"[ATTENDANCE TASK] GCS upload failed after retries: {e}")
-                        raise
+                            raise Exception(f"Storage upload failed: {error}")
+                        return key
                     
-                    # Update database with image URL
+                    image_key = None
                     try:
-                        with app.app_context():
-                            db_local = get_db()
-                            db_local.execute(
-                                "UPDATE attendance SET image_url = %s WHERE id = %s",
-                                (url, attendance_id)
-                            )
-                            db_local.commit()
-                        print(f"[ATTENDANCE TASK] Database updated with image URL")
+                        image_key = storage_upload()
+                        print(f"[ATTENDANCE TASK] Storage upload successful: {image_key}")
                     except Exception as e:
-                        print(f"[ATTENDANCE TASK] Database update failed: {e}")
-                        raise
+                        # Keep the frame on disk; POST /api/storage/pending/flush
+                        # uploads it once the object store is back
+                        print(f"[ATTENDANCE TASK] Storage upload failed after retries: {e}")
+                        frame_bytes = source_bytes
+                        if frame_bytes is None:
+                            frame_bytes, _ = compress_image_to_bytes(image, quality=Config.IMAGE_JPEG_QUALITY)
+                        entry_id = UploadService.save_pending(attendance_id, ident, punch_time, frame_bytes, box)
+                        print(f"[ATTENDANCE TASK] Saved image for later upload: {entry_id}")
                     
-                    # Upload to Google Sheets with retry
-                    @with_retry(max_retries=3, initial_delay=1.0, backoff_factor=2.0)
-                    def sheets_upload():
-                        return GoogleSheetsService.append_attendance_record(
-                            ident=ident,
-                            punch_time=punch_time,
-                            image_url=url
-                        )
+                    # Store the object key; URLs are signed on demand when read
+                    url = None
+                    if image_key:
+                        try:
+                            with app.app_context():
+                                db_local = get_db()
+                                db_local.execute(
+                                    "UPDATE attendance SET image_url = %s WHERE id = %s",
+                                    (image_key, attendance_id)
+                                )
+                                db_local.commit()
+                            print("[ATTENDANCE TASK] Database updated with image key")
+                        except Exception as e:
+                            print(f"[ATTENDANCE TASK] Database update failed: {e}")
+                            raise
+                        
+                        url = AttendanceService.image_link(attendance_id, image_key)
                     
+                    # Sheets writes go to the default lane so they do not hold
+                    # an upload slot while waiting on the Sheets API. This runs
+                    # on an upload worker, so it must not wait for queue room:
+                    # when the lane is full the row is written here instead
+                    sheets_task_id = None
                     try:
-                        sheets_result = sheets_upload()
-                        print(f"[ATTENDANCE TASK] Google Sheets upload result: {sheets_result}")
-                        return {
-                            "image_url": url,
-                            "sheets_result": sheets_result
-                        }
-                    except Exception as e:
-                        print(f"[ATTENDANCE TASK] Google Sheets upload failed after retries: {e}")
-                        # Don't raise - GCS upload was successful, which is the primary goal
-                        return {
-                            "image_url": url,
-                            "sheets_result": {"success": False, "error": str(e)}
-                        }
+                        sheets_task_id = AsyncTaskService.submit_task_nowait(
+                            AttendanceService._append_sheets_record,
+                            f"attendance_sheets_{ident}",
+                            ident,
+                            punch_time,
+                            url,
+                        )
+                    except TaskQueueFullError:
+                        print("[ATTENDANCE TASK] Task queue full, writing Sheets row inline")
+                        AttendanceService._append_sheets_record(ident, punch_time, url)
+                    return {
+                        "image_key": image_key,
+                        "image_url": url,
+                        "sheets_task": sheets_task_id
+                    }
                 
-                combined_task_id = AsyncTaskService.submit_task(
+                combined_task_id = UploadService.submit(
                     combined_upload_task,
-                    task_name=f"attendance_upload_{ident}",
+                    f"attendance_upload_{ident}",
+                    face_image,
+                    image_bytes,
                 )
                 print(f"[ATTENDANCE] Submitted combined upload task: {combined_task_id}")
                 
@@ -152,3 +264,173 @@ class AttendanceService:
         
         return result
 
+    
+    @staticmethod
+    def _parse_client_time(value: Any) -> Optional[datetime]:
+        if not isinstance(value, str):
+            return None
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=TAIPEI_TZ)
+        return parsed.astimezone(TAIPEI_TZ).replace(microsecond=0)
+    
+    @staticmethod
+    def punch_batch(records: List[Dict[str, Any]], images: Dict[str, bytes]) -> Dict[str, Any]:
+        # Ingests punches queued offline by kiosks. client_key makes replays
+        # idempotent: a record already stored is reported as a duplicate
+        # with its existing attendance id.
+        if len(records) > Config.PUNCH_BATCH_MAX_SIZE:
+            abort(400, f"At most {Config.PUNCH_BATCH_MAX_SIZE} punches per batch")
+        
+        latest_allowed = datetime.now(TAIPEI_TZ).timestamp() + Config.PUNCH_BATCH_MAX_FUTURE_SECONDS
+        results: Dict[str, Dict[str, Any]] = {}
+        # Every record gets a result, in batch order; one without a usable
+        # client_key is reported by its index in the batch
+        ordered: List[Dict[str, Any]] = []
+        rows = []
+        for index, record in enumerate(records):
+            client_key = record.get("client_key") if isinstance(record, dict) else None
+            error = None
+            if not isinstance(record, dict):
+                error = "record must be an object"
+            elif not isinstance(client_key, str) or not client_key:
+                error = "client_key is required"
+            elif len(client_key) > 100:
+                error = "client_key is too long"
+            elif client_key in results:
+                error = "duplicate client_key in batch"
+            if error:
+                ordered.append({"client_key": client_key, "index": index, "status": "invalid", "error": error})
+                continue
+            
+            ident = record.get("ident")
+            punch_time = AttendanceService._parse_client_time(record.get("punch_time"))
+            if not isinstance(ident, str) or not ident.strip():
+                results[client_key] = {"client_key": client_key, "status": "invalid", "error": "ident is required"}
+            elif punch_time is None or punch_time.timestamp() > latest_allowed:
+                results[client_key] = {"client_key": client_key, "status": "invalid", "error": "invalid punch_time"}
+            else:
+                results[client_key] = {"client_key": client_key, "status": "pending"}
+                rows.append((client_key, ident.strip(), punch_time.isoformat()))
+                # The punch is kept without a bad image; queued as pending, it
+                # would fail every later flush
+                if client_key in images and not is_decodable(images[client_key]):
+                    del images[client_key]
+                    results[client_key]["image_error"] = "Image decoding failed"
+            ordered.append(results[client_key])
+        
+        inserted = []
+        if rows:
+            db = get_db()
+            # The join drops unknown idents instead of failing the whole batch
+            inserted = psycopg2.extras.execute_values(
+                db.cursor,
+                "INSERT INTO attendance (ident, punch_time, image_url, created_at, client_key) "
+                "SELECT v.ident, v.punch_time, NULL, NOW(), v.client_key "
+                "FROM (VALUES %s) AS v(client_key, ident, punch_time) "
+                "JOIN people p ON p.ident = v.ident "
+                "ON CONFLICT (client_key, punch_time) WHERE client_key IS NOT NULL DO NOTHING "
+                "RETURNING id, client_key",
+                rows,
+                template="(%s, %s::varchar, %s::timestamptz)",
+                page_size=len(rows),
+                fetch=True
+            )
+            
+            for row in inserted:
+                results[row["client_key"]].update(status="created", attendance_id=row["id"])
+            
+            leftover = [r for r in rows if results[r[0]]["status"] == "pending"]
+            if leftover:
+                existing = db.execute(
+                    "SELECT id, client_key FROM attendance WHERE client_key = ANY(%s)",
+                    ([r[0] for r in leftover],)
+                ).fetchall()
+                for row in existing:
+                    results[row["client_key"]].update(status="duplicate", attendance_id=row["id"])
+                for client_key, ident, _ in leftover:
+                    if results[client_key]["status"] == "pending":
+                        results[client_key].update(status="unknown_ident", error="Person with this ident not found")
+            db.commit()
+        
+        created = [r for r in rows if results[r[0]]["status"] == "created"]
+        background_task = None
+        if created:
+            app = current_app._get_current_object()
+            items = [
+                (results[client_key]["attendance_id"], ident, punch_time, images.get(client_key))
+                for client_key, ident, punch_time in created
+            ]
+            
+            def batch_sync_task(items: List[Tuple[int, str, str, Optional[bytes]]]):
+                print(f"[ATTENDANCE TASK] Syncing {len(items)} offline punches")
+                from utils.image_processing import decode_image
+                
+                def upload_one(item):
+                    attendance_id, ident, punch_time, image_bytes = item
+                    try:
+                        image = decode_image(image_bytes)
+                    except Exception as e:
+                        print(f"[ATTENDANCE TASK] Dropping undecodable image for attendance {attendance_id}: {e}")
+                        return attendance_id, None
+                    try:
+                        success, key, error = StorageService.store_punch_image(
+                            image, ident, punch_time, source_bytes=image_bytes
+                        )
+                        if success:
+                            return attendance_id, key
+                        print(f"[ATTENDANCE TASK] Upload for attendance {attendance_id} failed: {error}")
+                    except Exception as e:
+                        print(f"[ATTENDANCE TASK] Upload for attendance {attendance_id} failed: {e}")
+                    UploadService.save_pending(attendance_id, ident, punch_time, image_bytes)
+                    return attendance_id, None
+                
+                keys: Dict[int, str] = {}
+                with_images = [item for item in items if item[3]]
+                if with_images:
+                    with ThreadPoolExecutor(
+                        max_workers=min(Config.UPLOAD_MAX_WORKERS, len(with_images)),
+                        thread_name_prefix="upload-batch-"
+                    ) as pool:
+                        keys = {aid: key for aid, key in pool.map(upload_one, with_images) if key}
+                    with app.app_context():
+                        UploadService.record_image_keys(list(keys.items()))
+                
+                sheets_rows = [
+                    {
+                        "ident": ident,
+                        "punch_time": punch_time,
+                        "image_url": AttendanceService.image_link(aid, keys[aid]) if aid in keys else None
+                    }
+                    for aid, ident, punch_time, _ in items
+                ]
+                
+                @with_retry(max_retries=3, initial_delay=1.0, backoff_factor=2.0)
+                def sheets_upload():
+                    return GoogleSheetsService.append_attendance_records(sheets_rows)
+                
+                try:
+                    sheets_result = sheets_upload()
+                except Exception as e:
+                    sheets_result = {"success": False, "error": str(e)}
+                print(f"[ATTENDANCE TASK] Google Sheets batch result: {sheets_result}")
+                return {"punches": len(items), "images_uploaded": len(keys), "sheets_result": sheets_result}
+            
+            try:
+                background_task = UploadService.submit(batch_sync_task, "attendance_batch_sync", items)
+                print(f"[ATTENDANCE] Submitted batch sync task: {background_task}")
+            except Exception as e:
+                print(f"[ATTENDANCE] Failed to submit batch sync task: {e}")
+                import traceback
+                traceback.print_exc()
+        
+        return {
+            "results": ordered,
+            "created": sum(1 for r in ordered if r["status"] == "created"),
+            "duplicates": sum(1 for r in ordered if r["status"] == "duplicate"),
+            "rejected": sum(1 for r in ordered if r["status"] in ("invalid", "unknown_ident")),
+            "background_task": background_task
+        }
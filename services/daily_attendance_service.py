@@ -0,0 +1,154 @@
+import json
+import time
+import base64
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from flask import abort
+from models.database import get_db
+from utils.helpers import TAIPEI_TZ, zone_or_taipei
+from config import Config
+
+# Recomputing one local day: every UTC offset in use lies within -12h..+14h
+DAY_WINDOW_BEFORE = timedelta(hours=14)
+DAY_WINDOW_AFTER = timedelta(hours=12)
+
+
+class DailyAttendanceService:
+    """Reads and backfills daily_attendance, the per-person local-day rollup kept by a trigger"""
+
+    @staticmethod
+    def encode_cursor(local_date: date, ident: str) -> str:
+        raw = json.dumps([local_date.isoformat(), ident]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[date, str]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            local_date, ident = json.loads(raw)
+            return date.fromisoformat(local_date), str(ident)
+        except (ValueError, TypeError):
+            abort(400, "Invalid cursor")
+
+    @staticmethod
+    def list_days(
+        filters: Dict[str, Any],
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Keyset page of daily rows, newest day first; from/to select local dates"""
+        limit = max(1, min(limit, Config.ATTENDANCE_PAGE_MAX_SIZE))
+        clauses = []
+        params: List[Any] = []
+        if filters.get("ident"):
+            clauses.append("d.ident = %s")
+            params.append(filters["ident"])
+        elif filters.get("prefix"):
+            escaped = filters["prefix"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("d.ident LIKE %s")
+            params.append(escaped + "%")
+        if filters.get("start"):
+            clauses.append("d.local_date >= %s")
+            params.append(filters["start"].astimezone(TAIPEI_TZ).date())
+        if filters.get("end"):
+            clauses.append("d.local_date < %s")
+            params.append(filters["end"].astimezone(TAIPEI_TZ).date())
+        if cursor:
+            clauses.append("(d.local_date, d.ident) < (%s, %s)")
+            params.extend(DailyAttendanceService.decode_cursor(cursor))
+
+        where = " AND ".join(clauses) if clauses else "TRUE"
+        db = get_db()
+        rows = db.execute(
+            "SELECT d.ident, d.local_date, d.first_in, d.last_out, d.punch_count, p.time_zone "
+            f"FROM daily_attendance d JOIN people p ON p.ident = d.ident WHERE {where} "
+            "ORDER BY d.local_date DESC, d.ident DESC LIMIT %s",
+            params + [limit + 1]
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = []
+        for r in rows:
+            tz = zone_or_taipei(r["time_zone"])
+            items.append({
+                "ident": r["ident"],
+                "date": r["local_date"].isoformat(),
+                "first_in": r["first_in"].astimezone(tz).isoformat(),
+                "last_out": r["last_out"].astimezone(tz).isoformat(),
+                "punch_count": r["punch_count"]
+            })
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = DailyAttendanceService.encode_cursor(last["local_date"], last["ident"])
+        return {"items": items, "next_cursor": next_cursor}
+
+    @staticmethod
+    def backfill(start: date, end: date, ident: Optional[str] = None) -> Dict[str, Any]:
+        """Recompute daily rows for local dates in [start, end) from raw punches"""
+        started = time.monotonic()
+        db = get_db()
+        report = {"from": start.isoformat(), "to": end.isoformat(), "days": 0, "rows": 0}
+
+        day = start
+        while day < end:
+            window_start = datetime.combine(day, datetime.min.time(), timezone.utc) - DAY_WINDOW_BEFORE
+            window_end = datetime.combine(day + timedelta(days=1), datetime.min.time(), timezone.utc) + DAY_WINDOW_AFTER
+            ident_params = [ident] if ident else []
+
+            # The rollup trigger holds this day's lock shared; holding it
+            # exclusively waits out punches in flight and holds back later
+            # ones until this day commits, so punches already committed are
+            # in the recount and later ones add to it. Other days' punches
+            # are not held back
+            db.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('daily_attendance'), %s::date - DATE '2000-01-01')",
+                [day]
+            )
+            db.execute(
+                "DELETE FROM daily_attendance WHERE local_date = %s" + (" AND ident = %s" if ident else ""),
+                [day] + ident_params
+            )
+            cur = db.execute(
+                "INSERT INTO daily_attendance (ident, local_date, first_in, last_out, punch_count, updated_at) "
+                "SELECT a.ident, %s, MIN(a.punch_time), MAX(a.punch_time), COUNT(*), NOW() "
+                "FROM attendance a JOIN people p ON p.ident = a.ident "
+                "WHERE a.punch_time >= %s AND a.punch_time < %s "
+                "AND (a.punch_time AT TIME ZONE attendance_time_zone(p.time_zone))::date = %s "
+                + ("AND a.ident = %s " if ident else "")
+                + "GROUP BY a.ident",
+                [day, window_start, window_end, day] + ident_params
+            )
+            report["rows"] += cur.rowcount
+            db.commit()
+
+            report["days"] += 1
+            day += timedelta(days=1)
+
+        report["duration_seconds"] = round(time.monotonic() - started, 3)
+        print(f"[DAILY ATTENDANCE] Backfill finished: {report}")
+        return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from flask import Flask
+    from models.database import close_db
+
+    parser = argparse.ArgumentParser(description="Rebuild daily_attendance rows from raw punches")
+    parser.add_argument("--from", dest="start", required=True, help="first local date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", default=None, help="local date to stop before (default: tomorrow)")
+    parser.add_argument("--ident", default=None, help="only rebuild this person's rows")
+    args = parser.parse_args()
+
+    start = date.fromisoformat(args.start)
+    end = date.fromisoformat(args.end) if args.end else datetime.now(TAIPEI_TZ).date() + timedelta(days=1)
+
+    cli_app = Flask(__name__)
+    cli_app.config.from_object(Config)
+    cli_app.teardown_appcontext(close_db)
+    with cli_app.app_context():
+        print(json.dumps(DailyAttendanceService.backfill(start, end, args.ident), indent=2))
@@ -0,0 +1,183 @@
+import io
+import csv
+import uuid
+import psycopg2
+
+from typing import Any, Dict, Iterator, List, Optional
+from models.database import get_db
+from services.attendance_query_service import AttendanceQueryService
+from utils.helpers import zone_or_taipei
+from config import Config
+
+EXPORT_COLUMNS = ["id", "ident", "punch_time_utc", "local_time", "local_date", "time_zone", "image_key"]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ExportService:
+    @staticmethod
+    def parquet_available() -> bool:
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def _fetch_batches(filters: Dict[str, Any], batch_size: int) -> Iterator[List[tuple]]:
+        # A named cursor keeps the result on the server and FETCHes it
+        # batch_size rows at a time, so memory does not grow with the range.
+        # It runs on the primary: on a hot standby a long export can be
+        # cancelled by a recovery conflict partway through
+        db = get_db()
+        where, params = AttendanceQueryService.build_where(filters)
+        cursor = db.conn.cursor(name=f"attendance_export_{uuid.uuid4().hex[:12]}")
+        try:
+            cursor.execute(
+                "SELECT a.id, a.ident, a.punch_time, p.time_zone, a.image_url "
+                "FROM attendance a JOIN people p ON p.ident = a.ident "
+                f"WHERE {where} ORDER BY a.punch_time, a.id",
+                params
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+            db.rollback()
+
+    @staticmethod
+    def _records(rows: List[tuple]) -> Iterator[tuple]:
+        for attendance_id, ident, punch_time, time_zone, image_key in rows:
+            tz = zone_or_taipei(time_zone)
+            local = punch_time.astimezone(tz)
+            yield attendance_id, ident, punch_time, local.isoformat(), local.date(), tz.key, image_key
+
+    @staticmethod
+    def stream_csv(filters: Dict[str, Any], batch_size: Optional[int] = None) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        try:
+            for rows in ExportService._fetch_batches(filters, batch_size or Config.EXPORT_BATCH_SIZE):
+                for attendance_id, ident, punch_time, local_time, local_date, tz, image_key in ExportService._records(rows):
+                    writer.writerow([
+                        attendance_id, ident, punch_time.isoformat(), local_time,
+                        local_date.isoformat(), tz, image_key or ""
+                    ])
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        except psycopg2.Error as e:
+            # The 200 and the rows so far are already sent; mark the file as
+            # cut short, then fail the response so the client sees it broken
+            print(f"[EXPORT] CSV export failed: {e}")
+            buffer.write(f"# export incomplete: {str(e).strip()}\n")
+            yield buffer.getvalue().encode("utf-8")
+            raise
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def stream_parquet(filters: Dict[str, Any], batch_size: Optional[int] = None) -> Iterator[bytes]:
+        """One row group per fetched batch; needs pyarrow"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([
+            ("id", pa.int64()),
+            ("ident", pa.string()),
+            ("punch_time_utc", pa.timestamp("us", tz="UTC")),
+            ("local_time", pa.string()),
+            ("local_date", pa.date32()),
+            ("time_zone", pa.string()),
+            ("image_key", pa.string()),
+        ])
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            for rows in ExportService._fetch_batches(filters, batch_size or Config.EXPORT_BATCH_SIZE):
+                columns = list(zip(*ExportService._records(rows)))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                ))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    @staticmethod
+    def stream(filters: Dict[str, Any], fmt: str = "csv", batch_size: Optional[int] = None) -> Iterator[bytes]:
+        if fmt == "parquet":
+            return ExportService.stream_parquet(filters, batch_size)
+        return ExportService.stream_csv(filters, batch_size)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    from flask import Flask
+    from models.database import close_db
+
+    parser = argparse.ArgumentParser(description="Stream attendance rows to CSV or Parquet")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--from", dest="start", default=None, help="ISO date or datetime (inclusive)")
+    parser.add_argument("--to", dest="end", default=None, help="ISO date or datetime (exclusive)")
+    parser.add_argument("--ident", default=None)
+    parser.add_argument("--prefix", default=None, help="ident prefix, e.g. a cohort")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--output", default="-", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not ExportService.parquet_available():
+        sys.exit("Parquet export needs pyarrow: pip install pyarrow")
+
+    cli_app = Flask(__name__)
+    cli_app.config.from_object(Config)
+    cli_app.teardown_appcontext(close_db)
+    with cli_app.app_context():
+        filters = AttendanceQueryService.parse_filters({
+            "ident": args.ident, "prefix": args.prefix, "from": args.start, "to": args.end
+        })
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in ExportService.stream(filters, args.format, args.batch_size):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
@@ -19,6 +19,11 @@ class FaceService:
     
     @staticmethod
     def extract_embedding(img: np.ndarray) -> np.ndarray:
+        emb, face_count, _ = FaceService._represent(img)
+        return emb, face_count
+    
+    @staticmethod
+    def _represent(img: np.ndarray):
         try:
             model = FaceService.get_model()
             reps = DeepFace.represent(
@@ -35,7 +40,25 @@ class FaceService:
             abort(400, "No face detected")
         
         emb = np.array(reps[0]["embedding"], dtype="float32")
-        return l2_normalize(emb), len(reps)
+        return l2_normalize(emb), len(reps), reps[0].get("facial_area")
+    
+    @staticmethod
+    def detect_face_box(img: np.ndarray) -> Optional[tuple]:
+        try:
+            faces = DeepFace.extract_faces(
+                img_path=img,
+                detector_backend=Config.FACE_DETECTOR,
+                enforce_detection=True,
+                align=False
+            )
+        except Exception:
+            return None
+        
+        if not faces:
+            return None
+        
+        area = faces[0]["facial_area"]
+        return (area["x"], area["y"], area["w"], area["h"])
     
     @staticmethod
     def verify(img: np.ndarray, threshold: Optional[float] = None,
@@ -44,7 +67,7 @@ class FaceService:
         threshold = threshold or Config.FACE_THRESHOLD
         top_k = top_k or Config.FACE_TOP_K
         
-        emb, face_count = FaceService.extract_embedding(img)
+        emb, face_count, facial_area = FaceService._represent(img)
         
         from services.faiss_index_service import FaissIndexService
         
@@ -55,6 +78,7 @@ class FaceService:
                 "match": None,
                 "top_matches": [],
                 "face_count": face_count,
+                "facial_area": facial_area,
                 "used_model": f"DeepFace-{Config.FACE_MODEL} + FAISS"
             }
         
@@ -65,16 +89,17 @@ class FaceService:
             "match": match,
             "top_matches": candidates,
             "face_count": face_count,
+            "facial_area": facial_area,
             "used_model": f"DeepFace-{Config.FACE_MODEL} + FAISS"
         }
     
     @staticmethod
     def enroll(img: np.ndarray, ident: str, overwrite: bool = True) -> Dict[str, Any]:
-        row = PeopleService.get_by_ident(ident)
+        row = PeopleService.get_metadata(ident)
         if not row:
             abort(404, "Person with this ident not found")
         
-        if (not overwrite) and row["face_embedding"] is not None:
+        if (not overwrite) and row["has_embedding"]:
             abort(409, "This person already has face vector, and overwrite=false")
         
         try:
@@ -103,9 +128,10 @@ class FaceService:
             (emb_bytes, ident)
         )
         db.commit()
+        PeopleService.invalidate(ident)
         
         from services.faiss_index_service import FaissIndexService
-        if row["face_embedding"] is None:
+        if not row["has_embedding"]:
             FaissIndexService.add_embedding(ident, emb)
         else:
             FaissIndexService.update_embedding(ident, emb)
@@ -113,7 +139,7 @@ class FaceService:
         return {
             "ident": ident,
             "face_count": 1,
-            "overwritten": row["face_embedding"] is not None,
+            "overwritten": row["has_embedding"],
             "used_model": f"DeepFace-{Config.FACE_MODEL}"
         }
 
@@ -4,7 +4,7 @@ import threading
 
 from typing import Dict, List, Optional
 from datetime import datetime
-from models.database import get_db
+from models.database import get_read_db
 
 class FaissIndexService:
     _index: Optional[faiss.Index] = None
@@ -19,8 +19,8 @@ class FaissIndexService:
             if FaissIndexService._index is not None and not force_rebuild:
                 return
             
-            db = get_db()
-            rows = db.execute(
+            db = get_read_db()
+            rows = db.execute_tuples(
                 "SELECT ident, face_embedding FROM people WHERE face_embedding IS NOT NULL"
             ).fetchall()
             
@@ -33,9 +33,7 @@ class FaissIndexService:
             embeddings = []
             id_mapping = []
             
-            for row in rows:
-                ident = row["ident"]
-                blob = row["face_embedding"]
+            for ident, blob in rows:
                 try:
                     vec = np.frombuffer(blob, dtype="float32")
                     embeddings.append(vec)
@@ -8,6 +8,7 @@ from google.oauth2 import service_account
 from google.auth import default
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from utils.helpers import parse_ident
 
 class GoogleSheetsService:
     _service = None
@@ -111,64 +112,80 @@ class GoogleSheetsService:
                 'error': error_msg
             }
     
+    @staticmethod
+    def append_attendance_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Appends many attendance rows with a single API call; each record
+        # has ident, punch_time and optional image_url
+        try:
+            service = GoogleSheetsService.get_service()
+            spreadsheet_id = Config.GOOGLE_SHEETS_ID
+            
+            if not spreadsheet_id:
+                raise ValueError("GOOGLE_SHEETS_ID is not configured")
+            
+            rows = [
+                [
+                    GoogleSheetsService._format_timestamp(record['punch_time']),
+                    record['ident'],
+                    record.get('image_url') or ''
+                ]
+                for record in records
+            ]
+            if not rows:
+                return {'success': True, 'rows': 0}
+            
+            print(f"[ATTENDANCE] Uploading {len(rows)} rows to Google Sheets")
+            
+            range_name = f"{Config.GOOGLE_SHEETS_ATTENDANCE_TAB}!A:C"
+            result = service.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id,
+                range=range_name,
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': rows}
+            ).execute()
+            
+            print(f"✓ {len(rows)} attendance records uploaded to Google Sheets")
+            
+            return {
+                'success': True,
+                'rows': len(rows),
+                'spreadsheet_id': spreadsheet_id,
+                'updated_range': result.get('updates', {}).get('updatedRange')
+            }
+            
+        except HttpError as e:
+            error_msg = f"Google Sheets API error: {e}"
+            print(f"✗ {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+        except Exception as e:
+            error_msg = f"Failed to append attendance records: {e}"
+            print(f"✗ {error_msg}")
+            return {
+                'success': False,
+                'error': error_msg
+            }
+    
     @staticmethod
     def append_personnel_record(
         ident: str,
         time_zone: str
     ) -> Dict[str, Any]:
         try:
-            import re
-            
             print(f"[PERSONNEL] Parsing ident: '{ident}', time_zone: '{time_zone}'")
             
-            # Check if it's a TEACHER or STAFF identifier
-            teacher_match = re.match(r'^TEACHER\s+(.+)$', ident)
-            staff_match = re.match(r'^STAFF\s+(.+)$', ident)
-            
-            if teacher_match:
-                # Format: TEACHER {name}
-                prefix = 'TEACHER'
-                name = teacher_match.group(1).strip()
-                row_data = [
-                    prefix,
-                    name,
-                    '',
-                    '',
-                    time_zone or 'Asia/Taipei'
-                ]
-            elif staff_match:
-                # Format: STAFF {name}
-                prefix = 'STAFF'
-                name = staff_match.group(1).strip()
-                row_data = [
-                    prefix,
-                    name,
-                    '',
-                    '',
-                    time_zone or 'Asia/Taipei'
-                ]
-            else:
-                # Student format: {School}{Year} {FirstName} {LastName}
-                # Example: NTU2025 Vincent Cheng
-                match = re.match(r'^([A-Z]+)(\d{4})\s+(.+)$', ident)
-                
-                if match:
-                    school = match.group(1)
-                    year = match.group(2)
-                    full_name = match.group(3).strip()
-                    school_year = f"{school}{year}"
-                else:
-                    # Fallback if pattern doesn't match
-                    school_year = ident
-                    full_name = ident
-                
-                row_data = [
-                    school_year,
-                    full_name,
-                    '',
-                    '',
-                    time_zone or 'Asia/Taipei'
-                ]
+            # TEACHER {name}, STAFF {name}, or a student's {School}{Year} {name}
+            cohort, name = parse_ident(ident)
+            row_data = [
+                cohort,
+                name,
+                '',
+                '',
+                time_zone or 'Asia/Taipei'
+            ]
             
             service = GoogleSheetsService.get_service()
             spreadsheet_id = Config.GOOGLE_SHEETS_ID
@@ -1,14 +1,153 @@
+import os
+import json
+import time
+import base64
+import select
+import threading
 import psycopg2
 import numpy as np
 
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from flask import abort, request
-from models.database import get_db
-from utils.helpers import row_to_dict, now_iso_seconds
+from models.database import PEOPLE_CHANGED_CHANNEL, get_db
+from utils.helpers import now_iso_seconds
 from services.async_task_service import AsyncTaskService, with_retry
+from utils.cache import TTLCache
 from config import Config
 
+_NOT_CACHED = object()
+
 class PeopleService:
+    # Shared with AsyncPeopleService, which serves the same reads in asgi mode
+    LIST_COLUMNS = "ident, time_zone, created_at, updated_at"
+    LIST_ALL_QUERY = f"SELECT {LIST_COLUMNS} FROM people ORDER BY updated_at DESC, ident DESC"
+    
+    # ident -> whether the person exists. "Unknown" entries expire quickly
+    # because another worker may create the person in the meantime.
+    _ident_cache = TTLCache(Config.IDENT_CACHE_SIZE, Config.IDENT_CACHE_TTL_SECONDS)
+    
+    # ident -> get_metadata() row, or None if there is no such person. Both
+    # caches are cleared per ident by people_changed notifications, which a
+    # listener thread in each worker process receives
+    _metadata_cache = TTLCache(Config.PEOPLE_CACHE_SIZE, Config.PEOPLE_CACHE_TTL_SECONDS)
+    # Bumped by every invalidation, per ident and for everyone, so a read
+    # that raced a notification does not cache the row it replaced
+    _generations: Dict[str, int] = {}
+    _generation = 0
+    _generation_lock = threading.Lock()
+    _listener_pid: Optional[int] = None
+    _listener_lock = threading.Lock()
+    _listening = False
+    
+    @staticmethod
+    def cached_exists(ident: str) -> Optional[bool]:
+        return PeopleService._ident_cache.get(ident)
+    
+    @staticmethod
+    def remember_exists(ident: str, exists: bool) -> None:
+        ttl = None if exists else Config.IDENT_NEGATIVE_CACHE_TTL_SECONDS
+        PeopleService._ident_cache.put(ident, exists, ttl)
+    
+    @staticmethod
+    def invalidate(ident: str) -> None:
+        """Drop cached metadata and existence for ident; an empty ident drops everyone"""
+        with PeopleService._generation_lock:
+            if ident:
+                PeopleService._generations[ident] = PeopleService._generations.get(ident, 0) + 1
+                PeopleService._metadata_cache.pop(ident)
+                PeopleService._ident_cache.pop(ident)
+            else:
+                PeopleService._generation += 1
+                PeopleService._generations.clear()
+                PeopleService._metadata_cache.clear()
+                PeopleService._ident_cache.clear()
+    
+    @staticmethod
+    def _generation_of(ident: str) -> Tuple[int, int]:
+        return PeopleService._generation, PeopleService._generations.get(ident, 0)
+    
+    @staticmethod
+    def _ensure_listener() -> None:
+        # Started lazily so each forked worker gets its own thread
+        if not Config.PEOPLE_CACHE_LISTEN or PeopleService._listener_pid == os.getpid():
+            return
+        with PeopleService._listener_lock:
+            if PeopleService._listener_pid == os.getpid():
+                return
+            PeopleService._listener_pid = os.getpid()
+            threading.Thread(target=PeopleService._listen, name="people-cache-listener", daemon=True).start()
+    
+    @staticmethod
+    def _listen() -> None:
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(Config.DATABASE_URL)
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {PEOPLE_CHANGED_CHANNEL}")
+                # Changes made while nobody was listening are unknown
+                PeopleService.invalidate("")
+                PeopleService._listening = True
+                delay = 1
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        # Quiet for a while: make sure the connection is still alive
+                        cursor.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        PeopleService.invalidate(conn.notifies.pop(0).payload)
+            except Exception as e:
+                PeopleService._listening = False
+                print(f"[PEOPLE CACHE] Change listener failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+            finally:
+                if conn is not None:
+                    conn.close()
+    
+    @staticmethod
+    def get_metadata(ident: str) -> Optional[Dict[str, Any]]:
+        """ident, time_zone, created_at, updated_at and has_embedding (cached; never the embedding)"""
+        PeopleService._ensure_listener()
+        cached = PeopleService._metadata_cache.get(ident, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            return dict(cached) if cached is not None else None
+        
+        with PeopleService._generation_lock:
+            generation = PeopleService._generation_of(ident)
+        db = get_db()
+        row = db.execute_prepared("get_person_metadata", (ident,)).fetchone()
+        row = dict(row) if row is not None else None
+        ttl = None if row is not None else Config.IDENT_NEGATIVE_CACHE_TTL_SECONDS
+        with PeopleService._generation_lock:
+            # Invalidated while reading: the row may predate the change
+            if PeopleService._generation_of(ident) == generation:
+                PeopleService._metadata_cache.put(ident, row, ttl)
+                PeopleService.remember_exists(ident, row is not None)
+        return dict(row) if row is not None else None
+    
+    @staticmethod
+    def exists(ident: str) -> bool:
+        return PeopleService.get_metadata(ident) is not None
+    
+    @staticmethod
+    def get_time_zone(ident: str) -> Optional[str]:
+        row = PeopleService.get_metadata(ident)
+        return row["time_zone"] if row is not None else None
+    
+    @staticmethod
+    def get_cache_stats() -> Dict[str, Any]:
+        return {
+            "metadata": PeopleService._metadata_cache.stats(),
+            "ident": PeopleService._ident_cache.stats(),
+            "listener_started": PeopleService._listener_pid == os.getpid(),
+            "listening": PeopleService._listening,
+        }
+    
     @staticmethod
     def parse_people_payload(files, form_json) -> Dict[str, Any]:
         data = {}
@@ -70,14 +209,78 @@ class PeopleService:
         
         return data
     
+    @staticmethod
+    def list_version() -> int:
+        """The people_version counter, bumped by every write to people"""
+        db = get_db()
+        row = db.execute("SELECT version FROM people_version").fetchone()
+        return row["version"] if row else 0
+    
     @staticmethod
     def list_all() -> List[Dict[str, Any]]:
+        # No bytes columns are selected, so rows need no conversion
         db = get_db()
-        rows = db.execute(
-            "SELECT ident, time_zone, created_at, updated_at "
-            "FROM people ORDER BY updated_at DESC"
-        ).fetchall()
-        return [row_to_dict(r) for r in rows]
+        return db.execute(PeopleService.LIST_ALL_QUERY).fetchall()
+    
+    @staticmethod
+    def encode_cursor(updated_at: datetime, ident: str) -> str:
+        raw = json.dumps([updated_at.isoformat(), ident]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            updated_at, ident = json.loads(raw)
+            return datetime.fromisoformat(updated_at), str(ident)
+        except (ValueError, TypeError):
+            abort(400, "Invalid cursor")
+    
+    @staticmethod
+    def page_limit(limit: int) -> int:
+        return max(1, min(limit, Config.PEOPLE_PAGE_MAX_SIZE))
+    
+    @staticmethod
+    def page_query(prefix: Optional[str], limit: int, cursor: Optional[str],
+                   placeholder: str = "%s") -> Tuple[str, List[Any]]:
+        """list_page's SQL and parameters; placeholder "${}" numbers them for asyncpg"""
+        params: List[Any] = []
+        
+        def param(value) -> str:
+            params.append(value)
+            return placeholder.format(len(params))
+        
+        clauses = []
+        if prefix:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append(f"ident LIKE {param(escaped + '%')}")
+        if cursor:
+            updated_at, ident = PeopleService.decode_cursor(cursor)
+            clauses.append(f"(updated_at, ident) < ({param(updated_at)}, {param(ident)})")
+        
+        where = " AND ".join(clauses) if clauses else "TRUE"
+        sql = (
+            f"SELECT {PeopleService.LIST_COLUMNS} FROM people WHERE {where} "
+            f"ORDER BY updated_at DESC, ident DESC LIMIT {param(limit + 1)}"
+        )
+        return sql, params
+    
+    @staticmethod
+    def page_result(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+        """The page of a page_query result, which fetches one row past it"""
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = PeopleService.encode_cursor(rows[-1]["updated_at"], rows[-1]["ident"])
+        return {"items": rows, "next_cursor": next_cursor}
+    
+    @staticmethod
+    def list_page(prefix: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Keyset page of people, most recently updated first, optionally by ident prefix"""
+        limit = PeopleService.page_limit(limit)
+        sql, params = PeopleService.page_query(prefix, limit, cursor)
+        db = get_db()
+        return PeopleService.page_result(db.execute(sql, params).fetchall(), limit)
     
     @staticmethod
     def create(data: Dict[str, Any]) -> None:
@@ -109,6 +312,8 @@ class PeopleService:
         try:
             db.execute(sql, vals)
             db.commit()
+            PeopleService.invalidate(ident)
+            PeopleService.remember_exists(ident, True)
             
             if "face_embedding" in data:
                 try:
@@ -187,6 +392,7 @@ class PeopleService:
         db = get_db()
         cur = db.execute(sql, vals)
         db.commit()
+        PeopleService.invalidate(ident)
         if cur.rowcount == 0:
             abort(404, "Person not found")
         
@@ -202,6 +408,8 @@ class PeopleService:
         db = get_db()
         cur = db.execute("DELETE FROM people WHERE ident = %s", (ident,))
         db.commit()
+        PeopleService.invalidate(ident)
+        PeopleService.remember_exists(ident, False)
         if cur.rowcount == 0:
             abort(404, "Person not found")
         
@@ -213,11 +421,9 @@ class PeopleService:
     
     @staticmethod
     def get_by_ident(ident: str) -> Optional[Dict]:
+        """The full row, embedding included; use get_metadata when that is not needed"""
         db = get_db()
-        return db.execute(
-            "SELECT * FROM people WHERE ident = %s", 
-            (ident,)
-        ).fetchone()
+        return db.execute_prepared("get_person", (ident,)).fetchone()
     
     @staticmethod
     def get_all_with_embeddings() -> List[Dict]:
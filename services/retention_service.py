@@ -0,0 +1,208 @@
+import re
+import time
+import psycopg2
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from models.database import (
+    detach_attendance_partitions,
+    ensure_attendance_partitions,
+    get_db,
+)
+from services.storage_service import StorageService
+from utils.helpers import TAIPEI_TZ
+from config import Config
+
+# Object keys look like attendance/YYYYMMDD/<ident>_<time>_<id>.<ext>
+DATE_PREFIX_PATTERN = re.compile(r"^attendance/(\d{8})/$")
+
+
+class RetentionService:
+    JOB_NAME = "attendance_images"
+
+    @staticmethod
+    def _get_checkpoint() -> Optional[date]:
+        db = get_db()
+        row = db.execute(
+            "SELECT swept_through FROM storage_retention_checkpoints WHERE job_name = %s",
+            (RetentionService.JOB_NAME,)
+        ).fetchone()
+        return row["swept_through"] if row else None
+
+    @staticmethod
+    def _save_checkpoint(swept_through: date):
+        db = get_db()
+        db.execute(
+            "INSERT INTO storage_retention_checkpoints (job_name, swept_through, updated_at) "
+            "VALUES (%s, %s, NOW()) "
+            "ON CONFLICT (job_name) DO UPDATE SET swept_through = EXCLUDED.swept_through, updated_at = NOW()",
+            (RetentionService.JOB_NAME, swept_through)
+        )
+        db.commit()
+
+    @staticmethod
+    def _expired_prefixes(cutoff: date, checkpoint: Optional[date]) -> List[tuple]:
+        expired = []
+        for prefix in StorageService.get_backend().list_prefixes("attendance/"):
+            match = DATE_PREFIX_PATTERN.match(prefix)
+            if not match:
+                continue
+            prefix_date = datetime.strptime(match.group(1), "%Y%m%d").date()
+            if prefix_date < cutoff and (checkpoint is None or prefix_date > checkpoint):
+                expired.append((prefix_date, prefix))
+        return sorted(expired)
+
+    @staticmethod
+    def _clear_image_urls(prefix_date: date, keys: List[str]) -> int:
+        # The date in the key is the punch's local date, so a +/- 1 day window
+        # on punch_time lets the punch_time index narrow the update
+        db = get_db()
+        start = datetime.combine(prefix_date - timedelta(days=1), datetime.min.time(), TAIPEI_TZ)
+        end = datetime.combine(prefix_date + timedelta(days=2), datetime.min.time(), TAIPEI_TZ)
+        cur = db.execute(
+            "UPDATE attendance SET image_url = NULL "
+            "WHERE punch_time >= %s AND punch_time < %s AND image_url = ANY(%s)",
+            (start, end, keys)
+        )
+        db.commit()
+        return cur.rowcount
+
+    @staticmethod
+    def maintain_partitions() -> Dict[str, Any]:
+        """Create upcoming attendance partitions and expire old ones"""
+        if not Config.ATTENDANCE_PARTITIONING:
+            return {}
+        db = get_db()
+        try:
+            return RetentionService._maintain_partitions(db, RetentionService._get_checkpoint())
+        except psycopg2.Error as e:
+            db.rollback()
+            print(f"[RETENTION] Partition upkeep failed: {e}")
+            return {"error": str(e)}
+
+    @staticmethod
+    def _maintain_partitions(db, checkpoint: Optional[date]) -> Dict[str, Any]:
+        db.commit()
+        report: Dict[str, Any] = {"created": ensure_attendance_partitions(db.conn), "expired": []}
+
+        months = Config.ATTENDANCE_RETENTION_MONTHS
+        if months <= 0 or checkpoint is None:
+            return report
+
+        # Rows go only after the sweeper has removed their images, so a
+        # partition expires once it is both past the attendance retention
+        # period and fully behind the image checkpoint
+        before = datetime.now(TAIPEI_TZ).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for _ in range(months):
+            before = (before - timedelta(days=1)).replace(day=1)
+        swept_until = datetime.combine(checkpoint + timedelta(days=1), datetime.min.time(), TAIPEI_TZ)
+        report["expired"] = detach_attendance_partitions(
+            db.conn,
+            min(before, swept_until),
+            drop=Config.ATTENDANCE_RETENTION_ACTION == "drop"
+        )
+        if report["expired"]:
+            print(f"[RETENTION] {Config.ATTENDANCE_RETENTION_ACTION} attendance partitions: {report['expired']}")
+        return report
+
+    @staticmethod
+    def sweep(
+        days_old: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        days_old = Config.IMAGE_RETENTION_DAYS if days_old is None else days_old
+        max_workers = max_workers or Config.RETENTION_MAX_WORKERS
+        batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+
+        started = time.monotonic()
+        cutoff = datetime.now(TAIPEI_TZ).date() - timedelta(days=days_old)
+        report: Dict[str, Any] = {
+            "cutoff_date": cutoff.isoformat(),
+            "previous_checkpoint": None,
+            "prefixes_found": 0,
+            "prefixes_swept": 0,
+            "deleted": 0,
+            "errors": 0,
+            "rows_cleared": 0,
+        }
+        try:
+            RetentionService._sweep_images(report, cutoff, max_workers, batch_size)
+        except Exception as e:
+            # Partition upkeep does not depend on the image store, so a
+            # storage outage must not hold it back
+            print(f"[RETENTION] Image sweep failed: {e}")
+            report["error"] = str(e)
+            get_db().rollback()
+
+        report["partitions"] = RetentionService.maintain_partitions()
+
+        duration = time.monotonic() - started
+        report["duration_seconds"] = round(duration, 3)
+        report["objects_per_second"] = round(report["deleted"] / duration, 1) if duration > 0 else 0.0
+        print(f"[RETENTION] Sweep finished: {report}")
+        return report
+
+    @staticmethod
+    def _sweep_images(report: Dict[str, Any], cutoff: date, max_workers: int, batch_size: int):
+        backend = StorageService.get_backend()
+        checkpoint = RetentionService._get_checkpoint()
+        prefixes = RetentionService._expired_prefixes(cutoff, checkpoint)
+        report["previous_checkpoint"] = checkpoint.isoformat() if checkpoint else None
+        report["prefixes_found"] = len(prefixes)
+        checkpoint_blocked = False
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retention-") as pool:
+            for prefix_date, prefix in prefixes:
+                keys = [key for key, _ in backend.list(prefix)]
+                batches = [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+
+                deleted_keys = []
+                failed = 0
+                for batch, (deleted, failed_keys) in zip(batches, pool.map(backend.delete_many, batches)):
+                    failed_set = set(failed_keys)
+                    deleted_keys.extend(k for k in batch if k not in failed_set)
+                    failed += len(failed_keys)
+
+                report["deleted"] += len(deleted_keys)
+                report["errors"] += failed
+                for i in range(0, len(deleted_keys), batch_size * 10):
+                    report["rows_cleared"] += RetentionService._clear_image_urls(
+                        prefix_date, deleted_keys[i:i + batch_size * 10]
+                    )
+
+                if failed:
+                    print(f"[RETENTION] {failed} objects under {prefix} could not be deleted")
+                    checkpoint_blocked = True
+                else:
+                    report["prefixes_swept"] += 1
+                    # Only advance past contiguous, fully swept days
+                    if not checkpoint_blocked:
+                        RetentionService._save_checkpoint(prefix_date)
+                        report["checkpoint"] = prefix_date.isoformat()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from flask import Flask
+    from models.database import close_db
+
+    parser = argparse.ArgumentParser(description="Delete attendance images older than the retention period")
+    parser.add_argument("--days", type=int, default=None, help="retention in days (default: IMAGE_RETENTION_DAYS)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument(
+        "--partitions-only", action="store_true",
+        help="only create upcoming attendance partitions and expire old ones, without touching storage"
+    )
+    args = parser.parse_args()
+
+    cli_app = Flask(__name__)
+    cli_app.config.from_object(Config)
+    cli_app.teardown_appcontext(close_db)
+    with cli_app.app_context():
+        if args.partitions_only:
+            print(json.dumps(RetentionService.maintain_partitions(), indent=2))
+        else:
+            print(json.dumps(RetentionService.sweep(args.days, args.workers, args.batch_size), indent=2))
@@ -0,0 +1,368 @@
+import os
+import uuid
+import hashlib
+import mimetypes
+import threading
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from config import Config
+
+# Not in the mimetypes table on every Python version
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+class StorageBackend(ABC):
+    """Object store used for attendance images, addressed by string keys"""
+    name = "base"
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime]]:
+        """Yield (key, created_at) for every object under prefix"""
+        ...
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        """Return the immediate 'directories' under prefix, each ending in '/'"""
+        children = set()
+        for key, _ in self.list(prefix):
+            rest = key[len(prefix):]
+            if "/" in rest:
+                children.add(prefix + rest.split("/", 1)[0] + "/")
+        return sorted(children)
+
+    def delete_many(self, keys: List[str]) -> Tuple[int, List[str]]:
+        """Delete keys, returning (deleted count, keys that failed)"""
+        deleted = 0
+        failed = []
+        for key in keys:
+            try:
+                if self.delete(key):
+                    deleted += 1
+            except Exception:
+                failed.append(key)
+        return deleted, failed
+
+    @abstractmethod
+    def url(self, key: str, expiry_hours: Optional[int] = None) -> str:
+        ...
+
+    def signed_url(self, key: str, expires_at: datetime) -> str:
+        return self.url(key)
+
+    @abstractmethod
+    def test_connection(self) -> Tuple[bool, str]:
+        ...
+
+
+def _app_object_url(key: str) -> str:
+    # Local and in-memory objects are served by the storage blueprint
+    return f"/api/storage/objects/{quote(key)}"
+
+
+def _pooled_session(credentials):
+    # One keep-alive session shared by all upload threads; the default
+    # adapter only keeps 10 connections, fewer than a busy upload lane uses
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(
+        pool_connections=Config.UPLOAD_HTTP_POOL_SIZE,
+        pool_maxsize=Config.UPLOAD_HTTP_POOL_SIZE
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+class GCSStorageBackend(StorageBackend):
+    name = "gcs"
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._client = None
+        self._bucket = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _create_client(self):
+        from google.cloud import storage
+        from google.oauth2 import service_account
+        from google.auth import default
+
+        try:
+            # 如果有設定憑證路徑且檔案存在，使用服務帳戶檔案
+            if Config.GCS_CREDENTIALS_PATH and os.path.exists(Config.GCS_CREDENTIALS_PATH):
+                credentials = service_account.Credentials.from_service_account_file(
+                    Config.GCS_CREDENTIALS_PATH,
+                    scopes=['https://www.googleapis.com/auth/devstorage.read_write']
+                )
+                return storage.Client(
+                    credentials=credentials,
+                    project=credentials.project_id,
+                    _http=_pooled_session(credentials)
+                )
+            # 否則使用 Application Default Credentials (ADC)
+            # 這會自動使用 Cloud Run 的服務帳戶
+            credentials, project = default(scopes=['https://www.googleapis.com/auth/devstorage.read_write'])
+            return storage.Client(
+                credentials=credentials,
+                project=project,
+                _http=_pooled_session(credentials)
+            )
+        except Exception as e:
+            raise RuntimeError(f"Failed to initialize Google Cloud Storage client: {e}")
+
+    def get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client()
+            return self._client
+
+    def _thread_client(self):
+        # A client has one batch stack for all threads and routes every call
+        # into the batch on top, so batches are only opened on a client owned
+        # by the calling thread, never on the shared one
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self._create_client()
+        return client
+
+    def get_bucket(self):
+        if self._bucket is None:
+            self._bucket = self.get_client().bucket(self.bucket_name)
+        return self._bucket
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        blob = self.get_bucket().blob(key)
+        blob.upload_from_string(data, content_type=content_type)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        blob = self.get_bucket().get_blob(key)
+        if blob is None:
+            return None
+        return blob.download_as_bytes(), blob.content_type
+
+    def delete(self, key: str) -> bool:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.get_bucket().blob(key).delete()
+            return True
+        except NotFound:
+            return False
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime]]:
+        for blob in self.get_bucket().list_blobs(prefix=prefix):
+            yield blob.name, blob.time_created
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        # Delimiter listing returns one entry per date directory, not per object
+        iterator = self.get_bucket().list_blobs(prefix=prefix, delimiter="/")
+        prefixes = set()
+        for page in iterator.pages:
+            prefixes.update(page.prefixes)
+        return sorted(prefixes)
+
+    def delete_many(self, keys: List[str]) -> Tuple[int, List[str]]:
+        # One batched HTTP request per call; on failure, retry key by key to
+        # find out which deletes did not go through
+        client = self._thread_client()
+        bucket = client.bucket(self.bucket_name)
+        try:
+            with client.batch():
+                for key in keys:
+                    bucket.delete_blob(key)
+            return len(keys), []
+        except Exception:
+            return super().delete_many(keys)
+
+    def url(self, key: str, expiry_hours: Optional[int] = None) -> str:
+        blob = self.get_bucket().blob(key)
+        if expiry_hours is None:
+            return blob.public_url
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(hours=expiry_hours),
+            method="GET"
+        )
+
+    def signed_url(self, key: str, expires_at: datetime) -> str:
+        return self.get_bucket().blob(key).generate_signed_url(
+            version="v4",
+            expiration=expires_at,
+            method="GET"
+        )
+
+    def test_connection(self) -> Tuple[bool, str]:
+        bucket = self.get_bucket()
+        bucket.reload()
+        return True, f"Successfully connected to bucket: {bucket.name}"
+
+
+class LocalStorageBackend(StorageBackend):
+    """Content-addressed filesystem store.
+
+    Object bytes live once under objects/<aa>/<bb>/<sha256>; each key is a
+    hard link to its object under refs/<key>. Writes go through a temp file
+    and an atomic rename, so readers never see a partial object.
+    """
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.refs_dir = os.path.join(self.root, "refs")
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        for path in (self.objects_dir, self.refs_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], digest)
+
+    def _ref_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.refs_dir, key))
+        if not path.startswith(self.refs_dir + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        ref_path = self._ref_path(key)
+
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, object_path)
+
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        tmp_ref = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        os.link(object_path, tmp_ref)
+        os.replace(tmp_ref, ref_path)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        try:
+            with open(self._ref_path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data, mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def delete(self, key: str) -> bool:
+        ref_path = self._ref_path(key)
+        try:
+            with open(ref_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            os.unlink(ref_path)
+        except FileNotFoundError:
+            return False
+
+        # Prune emptied key directories so prefix listings stay short
+        parent = os.path.dirname(ref_path)
+        while parent != self.refs_dir:
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+        # Drop the object once no other key links to it
+        object_path = self._object_path(digest)
+        try:
+            if os.stat(object_path).st_nlink <= 1:
+                os.unlink(object_path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime]]:
+        # Walk only the deepest directory fully covered by the prefix
+        base = os.path.join(self.refs_dir, os.path.dirname(prefix))
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.refs_dir).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    created = datetime.fromtimestamp(os.stat(path).st_mtime, tz=timezone.utc)
+                    yield key, created
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        base = os.path.join(self.refs_dir, os.path.dirname(prefix))
+        try:
+            entries = os.listdir(base)
+        except FileNotFoundError:
+            return []
+        parent = os.path.dirname(prefix)
+        children = (f"{parent}/{name}/" if parent else f"{name}/" for name in entries
+                    if os.path.isdir(os.path.join(base, name)))
+        return sorted(child for child in children if child.startswith(prefix))
+
+    def url(self, key: str, expiry_hours: Optional[int] = None) -> str:
+        return _app_object_url(key)
+
+    def test_connection(self) -> Tuple[bool, str]:
+        if not os.access(self.root, os.W_OK):
+            return False, f"Storage root is not writable: {self.root}"
+        return True, f"Using local storage at: {self.root}"
+
+
+class MemoryStorageBackend(StorageBackend):
+    name = "memory"
+
+    def __init__(self):
+        self._objects: Dict[str, Tuple[bytes, str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        with self._lock:
+            self._objects[key] = (data, content_type, datetime.now(timezone.utc))
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._objects.get(key)
+        return (entry[0], entry[1]) if entry else None
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._objects.pop(key, None) is not None
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime]]:
+        with self._lock:
+            items = [(k, v[2]) for k, v in self._objects.items() if k.startswith(prefix)]
+        return iter(items)
+
+    def url(self, key: str, expiry_hours: Optional[int] = None) -> str:
+        return _app_object_url(key)
+
+    def test_connection(self) -> Tuple[bool, str]:
+        return True, f"Using in-memory storage ({len(self._objects)} objects)"
+
+
+def create_storage_backend(name: str) -> StorageBackend:
+    name = (name or "gcs").lower()
+    if name == "gcs":
+        return GCSStorageBackend(Config.GCS_BUCKET_NAME)
+    if name == "local":
+        return LocalStorageBackend(Config.STORAGE_LOCAL_ROOT)
+    if name == "memory":
+        return MemoryStorageBackend()
+    raise ValueError(f"Unknown storage backend: {name}")
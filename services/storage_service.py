@@ -1,140 +1,309 @@
+import time
 import uuid
 import numpy as np
-import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
-from typing import Optional, Tuple
-from datetime import datetime, timedelta
-from google.cloud import storage
-from google.oauth2 import service_account
-from google.auth import default
-from utils.image_processing import optimize_image, compress_image_to_bytes
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from services.storage_backends import StorageBackend, create_storage_backend
+from services.upload_service import UploadService
+from utils.image_processing import (
+    prepare_image_for_upload,
+    crop_face_thumbnail,
+    resize_to_fit,
+    encode_image,
+    resolve_codec,
+    codec_extension,
+    codec_content_type,
+)
+
+class SignedUrlCache:
+    """LRU of signed URLs keyed by (object key, expiry bucket)"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, cache_key: Tuple[str, int]) -> Optional[str]:
+        with self._lock:
+            url = self._entries.get(cache_key)
+            if url is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return url
+    
+    def put(self, cache_key: Tuple[str, int], url: str):
+        with self._lock:
+            self._entries[cache_key] = url
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
 
 class StorageService:
-    _client = None
-    _bucket = None
-    
-    @staticmethod
-    def get_client():
-        if StorageService._client is None:
-            try:
-                # 如果有設定憑證路徑且檔案存在，使用服務帳戶檔案
-                if Config.GCS_CREDENTIALS_PATH and os.path.exists(Config.GCS_CREDENTIALS_PATH):
-                    credentials = service_account.Credentials.from_service_account_file(
-                        Config.GCS_CREDENTIALS_PATH,
-                        scopes=['https://www.googleapis.com/auth/devstorage.read_write']
-                    )
-                    StorageService._client = storage.Client(
-                        credentials=credentials,
-                        project=credentials.project_id
-                    )
+    _backend: Optional[StorageBackend] = None
+    _backend_lock = threading.Lock()
+    _url_cache = SignedUrlCache(Config.SIGNED_URL_CACHE_SIZE)
+    _image_codec: Optional[str] = None
+    
+    _stats_lock = threading.Lock()
+    _stats = {
+        "uploads": 0,
+        "reused_source": 0,
+        "reencoded": 0,
+        "resized": 0,
+        "face_thumbnails": 0,
+        "context_frames": 0,
+        "source_bytes": 0,
+        "uploaded_bytes": 0
+    }
+    
+    @staticmethod
+    def get_backend() -> StorageBackend:
+        if StorageService._backend is None:
+            with StorageService._backend_lock:
+                if StorageService._backend is None:
+                    StorageService._backend = create_storage_backend(Config.STORAGE_BACKEND)
+        return StorageService._backend
+    
+    @staticmethod
+    def get_image_codec() -> str:
+        if StorageService._image_codec is None:
+            StorageService._image_codec = resolve_codec(Config.IMAGE_CODEC)
+        return StorageService._image_codec
+    
+    @staticmethod
+    def _codec_quality(codec: str) -> int:
+        return {
+            "jpeg": Config.IMAGE_JPEG_QUALITY,
+            "webp": Config.IMAGE_WEBP_QUALITY,
+            "avif": Config.IMAGE_AVIF_QUALITY,
+        }[codec]
+    
+    @staticmethod
+    def _record_upload(stats: dict, original_size: int):
+        with StorageService._stats_lock:
+            counters = StorageService._stats
+            counters["uploads"] += 1
+            counters["reused_source"] += 1 if stats["reused_source"] else 0
+            counters["reencoded"] += 0 if stats["reused_source"] else 1
+            counters["resized"] += 1 if stats["resized"] else 0
+            counters["source_bytes"] += original_size
+            counters["uploaded_bytes"] += stats["size_bytes"]
+    
+    @staticmethod
+    def get_stats() -> dict:
+        with StorageService._stats_lock:
+            stats = dict(StorageService._stats)
+        stats["codec"] = StorageService.get_image_codec()
+        stats["signed_url_cache"] = StorageService._url_cache.stats()
+        stats["upload_lane"] = UploadService.get_stats()
+        return stats
+    
+    @staticmethod
+    def is_object_key(value: Optional[str]) -> bool:
+        # Rows written before keys were stored hold absolute or app-relative URLs
+        return bool(value) and "://" not in value and not value.startswith("/")
+    
+    @staticmethod
+    def _expiry_bucket(now: float) -> Tuple[int, datetime]:
+        # URLs minted in bucket n expire at the end of bucket n + 1, so a cached
+        # URL always has at least half of GCS_SIGNED_URL_EXPIRY_HOURS left
+        bucket_seconds = max(Config.GCS_SIGNED_URL_EXPIRY_HOURS * 3600 // 2, 60)
+        bucket = int(now // bucket_seconds)
+        expires_at = datetime.fromtimestamp((bucket + 2) * bucket_seconds, tz=timezone.utc)
+        return bucket, expires_at
+    
+    @staticmethod
+    def resolve_image_urls(values: Iterable[Optional[str]]) -> Dict[str, str]:
+        """Map stored image_url values (object keys or legacy URLs) to fetchable URLs"""
+        backend = StorageService.get_backend()
+        resolved: Dict[str, str] = {}
+        to_sign: List[str] = []
+        bucket, expires_at = StorageService._expiry_bucket(time.time())
+        
+        for value in set(v for v in values if v):
+            if not StorageService.is_object_key(value):
+                resolved[value] = value
+            elif Config.GCS_USE_PUBLIC_URLS:
+                resolved[value] = backend.url(value)
+            else:
+                cached = StorageService._url_cache.get((value, bucket))
+                if cached:
+                    resolved[value] = cached
                 else:
-                    # 否則使用 Application Default Credentials (ADC)
-                    # 這會自動使用 Cloud Run 的服務帳戶
-                    credentials, project = default(scopes=['https://www.googleapis.com/auth/devstorage.read_write'])
-                    StorageService._client = storage.Client(
-                        credentials=credentials,
-                        project=project
-                    )
-            except Exception as e:
-                raise RuntimeError(f"Failed to initialize Google Cloud Storage client: {e}")
-        return StorageService._client
-    
-    @staticmethod
-    def get_bucket():
-        if StorageService._bucket is None:
-            client = StorageService.get_client()
-            StorageService._bucket = client.bucket(Config.GCS_BUCKET_NAME)
-        return StorageService._bucket
-    
-    @staticmethod
-    def upload_attendance_image(
+                    to_sign.append(value)
+        
+        if to_sign:
+            def sign(key: str) -> Tuple[str, str]:
+                return key, backend.signed_url(key, expires_at)
+            
+            if len(to_sign) == 1:
+                signed = [sign(to_sign[0])]
+            else:
+                # Signing may call the IAM API on Cloud Run, so sign listings in parallel
+                with ThreadPoolExecutor(max_workers=min(8, len(to_sign))) as pool:
+                    signed = list(pool.map(sign, to_sign))
+            
+            for key, url in signed:
+                StorageService._url_cache.put((key, bucket), url)
+                resolved[key] = url
+        
+        return resolved
+    
+    @staticmethod
+    def resolve_image_url(value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        return StorageService.resolve_image_urls([value]).get(value)
+    
+    @staticmethod
+    def _upload_attendance_blob(
         image: np.ndarray,
         student_id: str,
-        timestamp: str
+        timestamp: str,
+        source_bytes: Optional[bytes] = None
+    ):
+        codec = StorageService.get_image_codec()
+        image_bytes, stats = prepare_image_for_upload(
+            image,
+            source_bytes,
+            max_width=Config.IMAGE_MAX_DIMENSION,
+            max_height=Config.IMAGE_MAX_DIMENSION,
+            quality=StorageService._codec_quality(codec),
+            max_source_bytes=Config.IMAGE_REUSE_MAX_BYTES,
+            codec=codec
+        )
+        
+        key = f"{StorageService._object_base_name(student_id, timestamp)}{codec_extension(codec)}"
+        UploadService.put(key, image_bytes, codec_content_type(codec))
+        
+        StorageService._record_upload(stats, len(source_bytes) if source_bytes else image.nbytes)
+        return key
+    
+    @staticmethod
+    def _object_base_name(student_id: str, timestamp: str) -> str:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        date_str = dt.strftime('%Y%m%d')
+        time_str = dt.strftime('%H%M%S')
+        
+        unique_id = str(uuid.uuid4())[:8]
+        return f"attendance/{date_str}/{student_id}_{time_str}_{unique_id}"
+    
+    @staticmethod
+    def store_attendance_image(
+        image: np.ndarray,
+        student_id: str,
+        timestamp: str,
+        source_bytes: Optional[bytes] = None
     ) -> Tuple[bool, Optional[str], Optional[str]]:
+        # Returns the object key; URLs are minted on read via resolve_image_urls
         try:
-            optimized_image, stats = optimize_image(image, max_width=1024, max_height=1024, quality=85)
-            
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            date_str = dt.strftime('%Y%m%d')
-            time_str = dt.strftime('%H%M%S')
-            
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"attendance/{date_str}/{student_id}_{time_str}_{unique_id}.jpg"
-            
-            image_bytes, size = compress_image_to_bytes(optimized_image, quality=85)
-            bucket = StorageService.get_bucket()
-
-            blob = bucket.blob(filename)
-            blob.content_type = 'image/jpeg'
-            blob.upload_from_string(image_bytes, content_type='image/jpeg')
-            
-            public_url = blob.public_url
-            
-            return True, public_url, None
+            key = StorageService._upload_attendance_blob(image, student_id, timestamp, source_bytes)
+            return True, key, None
             
         except Exception as e:
             return False, None, f"Failed to upload image: {str(e)}"
     
     @staticmethod
-    def upload_attendance_image_with_expiry(
+    def upload_attendance_face_thumbnail(
         image: np.ndarray,
+        face_box: Tuple[int, int, int, int],
         student_id: str,
         timestamp: str,
-        expiry_hours: int = 24
+        include_context: bool = False
     ) -> Tuple[bool, Optional[str], Optional[str]]:
-        
+        # Stores a fixed-size face crop as the attendance evidence, plus an
+        # optional small low-quality frame at <base>_context.<ext>, and returns
+        # the crop's object key
         try:
-            optimized_image, stats = optimize_image(image, max_width=1024, max_height=1024, quality=85)
-            
-            print(f"Image optimization: {stats['original_dimensions']} → {stats['optimized_dimensions']}, "
-                  f"size: {stats['original_size_bytes']} → {stats['compressed_size_bytes']} bytes "
-                  f"({stats['compression_ratio']} reduction)")
-            
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            date_str = dt.strftime('%Y%m%d')
-            time_str = dt.strftime('%H%M%S')
+            codec = StorageService.get_image_codec()
+            extension = codec_extension(codec)
+            content_type = codec_content_type(codec)
+            base_name = StorageService._object_base_name(student_id, timestamp)
             
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"attendance/{date_str}/{student_id}_{time_str}_{unique_id}.jpg"
+            thumbnail = crop_face_thumbnail(
+                image,
+                face_box,
+                size=Config.FACE_THUMBNAIL_SIZE,
+                margin=Config.FACE_THUMBNAIL_MARGIN
+            )
+            thumbnail_bytes, thumbnail_size = encode_image(
+                thumbnail, codec=codec, quality=Config.FACE_THUMBNAIL_QUALITY
+            )
+            key = f"{base_name}_face{extension}"
+            UploadService.put(key, thumbnail_bytes, content_type)
+            uploaded_bytes = thumbnail_size
             
-            image_bytes, size = compress_image_to_bytes(optimized_image, quality=85)
+            if include_context:
+                context = resize_to_fit(
+                    image, Config.CONTEXT_FRAME_MAX_DIMENSION, Config.CONTEXT_FRAME_MAX_DIMENSION
+                )
+                context_bytes, context_size = encode_image(
+                    context, codec=codec, quality=Config.CONTEXT_FRAME_QUALITY
+                )
+                UploadService.put(f"{base_name}_context{extension}", context_bytes, content_type)
+                uploaded_bytes += context_size
             
-            bucket = StorageService.get_bucket()
-            blob = bucket.blob(filename)
-            blob.content_type = 'image/jpeg'
-            blob.upload_from_string(image_bytes, content_type='image/jpeg')
-
-            expiration = timedelta(hours=expiry_hours)
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=expiration,
-                method="GET"
-            )
+            with StorageService._stats_lock:
+                counters = StorageService._stats
+                counters["uploads"] += 1
+                counters["face_thumbnails"] += 1
+                counters["context_frames"] += 1 if include_context else 0
+                counters["source_bytes"] += image.nbytes
+                counters["uploaded_bytes"] += uploaded_bytes
             
-            return True, signed_url, None
+            return True, key, None
             
         except Exception as e:
-            return False, None, f"Failed to upload image with expiry: {str(e)}"
+            return False, None, f"Failed to upload face thumbnail: {str(e)}"
+    
+    @staticmethod
+    def store_punch_image(
+        image: np.ndarray,
+        student_id: str,
+        timestamp: str,
+        source_bytes: Optional[bytes] = None,
+        face_box: Optional[Tuple[int, int, int, int]] = None
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
+        # Applies ATTENDANCE_IMAGE_MODE; callers detect the face box beforehand
+        image_mode = Config.ATTENDANCE_IMAGE_MODE
+        if image_mode in ("face", "face_context") and face_box is not None:
+            return StorageService.upload_attendance_face_thumbnail(
+                image, face_box, student_id, timestamp,
+                include_context=(image_mode == "face_context")
+            )
+        return StorageService.store_attendance_image(
+            image, student_id, timestamp, source_bytes=source_bytes
+        )
     
     @staticmethod
     def delete_old_images(days_old: int = 30) -> Tuple[int, int]:
         try:
-            bucket = StorageService.get_bucket()
-            cutoff_date = datetime.now() - timedelta(days=days_old)
+            backend = StorageService.get_backend()
+            cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_old)
             
             deleted_count = 0
             error_count = 0
             
-            blobs = bucket.list_blobs(prefix='attendance/')
-            
-            for blob in blobs:
+            for key, created_at in backend.list('attendance/'):
                 try:
-                    if blob.time_created and blob.time_created.replace(tzinfo=None) < cutoff_date:
-                        blob.delete()
+                    if created_at and created_at < cutoff_date:
+                        backend.delete(key)
                         deleted_count += 1
                 except Exception as e:
-                    print(f"Error deleting blob {blob.name}: {e}")
+                    print(f"Error deleting object {key}: {e}")
                     error_count += 1
             
             return deleted_count, error_count
@@ -146,11 +315,8 @@ class StorageService:
     @staticmethod
     def test_connection() -> Tuple[bool, str]:
         try:
-            bucket = StorageService.get_bucket()
-            bucket.reload()
-            message = f"Successfully connected to bucket: {bucket.name}"
-            return True, message
+            return StorageService.get_backend().test_connection()
             
         except Exception as e:
-            message = f"Failed to connect to GCS: {str(e)}"
+            message = f"Failed to connect to storage backend: {str(e)}"
             return False, message
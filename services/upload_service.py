@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from services.async_task_service import AsyncTaskService
+from utils.metrics import LatencyHistogram, RateMeter
+from config import Config
+
+
+class UploadService:
+    # Image uploads run on their own task lane so a slow object store cannot
+    # starve Sheets writes and other background work of executor threads
+    LANE = "upload"
+
+    _lock = threading.Lock()
+    _latency = LatencyHistogram()
+    _image_rate = RateMeter(60)
+    _byte_rate = RateMeter(60)
+    _counters = {
+        "uploads": 0,
+        "failed": 0,
+        "bytes": 0,
+        "in_flight": 0,
+        "pending_saved": 0,
+        "pending_flushed": 0
+    }
+
+    @staticmethod
+    def initialize(max_workers: Optional[int] = None):
+        AsyncTaskService.register_lane(UploadService.LANE, max_workers or Config.UPLOAD_MAX_WORKERS)
+
+    @staticmethod
+    def submit(task_func: Callable, task_name: str, *args, **kwargs) -> str:
+        UploadService.initialize()
+        return AsyncTaskService.submit_task_to_lane(UploadService.LANE, task_func, task_name, *args, **kwargs)
+
+    @staticmethod
+    def put(key: str, data: bytes, content_type: str):
+        from services.storage_service import StorageService
+
+        backend = StorageService.get_backend()
+        with UploadService._lock:
+            UploadService._counters["in_flight"] += 1
+
+        start = time.perf_counter()
+        try:
+            backend.put(key, data, content_type)
+        except Exception:
+            with UploadService._lock:
+                UploadService._counters["failed"] += 1
+            raise
+        finally:
+            with UploadService._lock:
+                UploadService._counters["in_flight"] -= 1
+
+        UploadService._latency.observe((time.perf_counter() - start) * 1000)
+        UploadService._image_rate.record(1)
+        UploadService._byte_rate.record(len(data))
+        with UploadService._lock:
+            UploadService._counters["uploads"] += 1
+            UploadService._counters["bytes"] += len(data)
+
+    @staticmethod
+    def save_pending(
+        attendance_id: int,
+        ident: str,
+        punch_time: str,
+        image_bytes: bytes,
+        face_box: Optional[Tuple[int, int, int, int]] = None
+    ) -> str:
+        # Keeps the encoded frame of a punch whose upload failed, so it can be
+        # uploaded in bulk once the object store is reachable again
+        os.makedirs(Config.UPLOAD_PENDING_DIR, exist_ok=True)
+        entry_id = uuid.uuid4().hex
+        base = os.path.join(Config.UPLOAD_PENDING_DIR, entry_id)
+
+        with open(f"{base}.jpg.tmp", "wb") as f:
+            f.write(image_bytes)
+        os.replace(f"{base}.jpg.tmp", f"{base}.jpg")
+
+        meta = {
+            "attendance_id": attendance_id,
+            "ident": ident,
+            "punch_time": punch_time,
+            "face_box": list(face_box) if face_box else None
+        }
+        with open(f"{base}.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{base}.json.tmp", f"{base}.json")
+
+        with UploadService._lock:
+            UploadService._counters["pending_saved"] += 1
+        return entry_id
+
+    @staticmethod
+    def list_pending() -> List[str]:
+        try:
+            names = os.listdir(Config.UPLOAD_PENDING_DIR)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    @staticmethod
+    def _upload_pending_entry(entry_id: str) -> Tuple[str, Optional[int], Optional[str], Optional[str]]:
+        from services.storage_service import StorageService
+        from utils.image_processing import decode_image
+
+        base = os.path.join(Config.UPLOAD_PENDING_DIR, entry_id)
+        try:
+            with open(f"{base}.json") as f:
+                meta = json.load(f)
+            with open(f"{base}.jpg", "rb") as f:
+                image_bytes = f.read()
+
+            image = decode_image(image_bytes)
+            face_box = tuple(meta["face_box"]) if meta.get("face_box") else None
+            success, key, error = StorageService.store_punch_image(
+                image, meta["ident"], meta["punch_time"],
+                source_bytes=image_bytes, face_box=face_box
+            )
+            if not success:
+                return entry_id, None, None, error
+            return entry_id, meta["attendance_id"], key, None
+        except Exception as e:
+            return entry_id, None, None, str(e)
+
+    @staticmethod
+    def record_image_keys(pairs: List[Tuple[int, str]]):
+        """Set image_url for many attendance rows in one statement; needs an app context"""
+        import psycopg2.extras
+        from models.database import get_db
+
+        if not pairs:
+            return
+        db = get_db()
+        psycopg2.extras.execute_values(
+            db.cursor,
+            "UPDATE attendance AS a SET image_url = v.image_key "
+            "FROM (VALUES %s) AS v(id, image_key) WHERE a.id = v.id",
+            pairs,
+            template="(%s::integer, %s)"
+        )
+        db.commit()
+
+    @staticmethod
+    def flush_pending(max_workers: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Upload saved punch images concurrently and record their keys in one statement"""
+        started = time.monotonic()
+        entries = UploadService.list_pending()
+        if limit:
+            entries = entries[:limit]
+
+        max_workers = max_workers or Config.UPLOAD_MAX_WORKERS
+        uploaded: List[Tuple[str, int, str]] = []
+        errors = 0
+        if entries:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload-flush-") as pool:
+                for entry_id, attendance_id, key, error in pool.map(UploadService._upload_pending_entry, entries):
+                    if error:
+                        errors += 1
+                        print(f"[UPLOAD] Pending upload {entry_id} failed: {error}")
+                    else:
+                        uploaded.append((entry_id, attendance_id, key))
+
+        if uploaded:
+            UploadService.record_image_keys([(attendance_id, key) for _, attendance_id, key in uploaded])
+
+            for entry_id, _, _ in uploaded:
+                base = os.path.join(Config.UPLOAD_PENDING_DIR, entry_id)
+                for suffix in (".json", ".jpg"):
+                    try:
+                        os.remove(base + suffix)
+                    except FileNotFoundError:
+                        pass
+
+            with UploadService._lock:
+                UploadService._counters["pending_flushed"] += len(uploaded)
+
+        duration = time.monotonic() - started
+        report = {
+            "pending": len(entries),
+            "uploaded": len(uploaded),
+            "errors": errors,
+            "duration_seconds": round(duration, 3),
+            "images_per_second": round(len(uploaded) / duration, 1) if duration > 0 else 0.0
+        }
+        print(f"[UPLOAD] Pending flush finished: {report}")
+        return report
+
+    @staticmethod
+    def get_stats() -> Dict[str, Any]:
+        with UploadService._lock:
+            stats = dict(UploadService._counters)
+        stats["images_per_second"] = UploadService._image_rate.rate()
+        stats["bytes_per_second"] = UploadService._byte_rate.rate()
+        stats["latency_ms"] = UploadService._latency.to_dict()
+        stats["pending_on_disk"] = len(UploadService.list_pending())
+        stats["max_workers"] = Config.UPLOAD_MAX_WORKERS
+        return stats
@@ -77,6 +77,7 @@ document.addEventListener('DOMContentLoaded', () => {
     setupFormHandlers();
     showSection('people');
     initializeEnrollmentCamera();
+    initializeOfflineQueue();
 });
 function showSection(section) {
     document.querySelectorAll('.section-content').forEach(el => {
@@ -269,25 +270,15 @@ function retakePhoto(prefix) {
     showElement(overlay);
     updateEnrollButtonState();
 }
-async function loadPeople() {
-    const tableBody = document.getElementById('students-table-body');
-    const countDiv = document.getElementById('students-count');
-    
-    tableBody.innerHTML = '<tr><td colspan="4" style="text-align: center; padding: 2rem;"><span class="loading"></span> Loading people...</td></tr>';
-    
-    try {
-        const response = await fetch('/api/people');
-        const people = await response.json();
-        
-        if (people.length === 0) {
-            tableBody.innerHTML = '<tr><td colspan="4" style="text-align: center; padding: 2rem; color: var(--muted-color);">No people enrolled yet. Add someone above!</td></tr>';
-            countDiv.textContent = 'Total: 0 people';
-            return;
-        }
-        
-        people.sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at));
-        
-        tableBody.innerHTML = people.map(person => `
+// The people list is paged by the server; "Load more" appends the next page
+const PEOPLE_PAGE_SIZE = 100;
+let peopleCursor = null;
+let peopleShown = 0;
+let peopleRequest = 0;
+let peopleSearchTimer = null;
+
+function renderPersonRow(person) {
+    return `
             <tr data-student-id="${person.ident.toLowerCase()}">
                 <td class="student-id-cell">${person.ident}</td>
                 <td>${person.time_zone || 'Not set'}</td>
@@ -301,45 +292,73 @@ async function loadPeople() {
                     <a onclick="deletePerson('${person.ident.replace(/'/g, "\\'")}')">Delete</a>
                 </td>
             </tr>
-        `).join('');
+        `;
+}
+
+async function loadPeople(append = false) {
+    const tableBody = document.getElementById('students-table-body');
+    const countDiv = document.getElementById('students-count');
+    const loadMoreBtn = document.getElementById('students-load-more');
+    const prefix = document.getElementById('student-search').value.trim();
+    // A newer search supersedes a request still in flight
+    const requestId = ++peopleRequest;
+    
+    if (!append) {
+        peopleCursor = null;
+        peopleShown = 0;
+        tableBody.innerHTML = '<tr><td colspan="4" style="text-align: center; padding: 2rem;"><span class="loading"></span> Loading people...</td></tr>';
+    }
+    loadMoreBtn.disabled = true;
+    
+    const params = new URLSearchParams({ limit: PEOPLE_PAGE_SIZE });
+    if (prefix) params.set('prefix', prefix);
+    if (append && peopleCursor) params.set('cursor', peopleCursor);
+    
+    try {
+        // Unchanged pages are revalidated with the ETag and answered with 304
+        const response = await fetch(`/api/people?${params}`);
+        if (!response.ok) {
+            throw new Error(await response.text());
+        }
+        const page = await response.json();
+        if (requestId !== peopleRequest) return;
         
-        countDiv.textContent = `Total: ${people.length} ${people.length !== 1 ? 'people' : 'person'}`;
+        const rows = page.items.map(renderPersonRow).join('');
+        if (append) {
+            tableBody.insertAdjacentHTML('beforeend', rows);
+        } else if (page.items.length === 0) {
+            const message = prefix ? 'No people match this ID prefix.' : 'No people enrolled yet. Add someone above!';
+            tableBody.innerHTML = `<tr><td colspan="4" style="text-align: center; padding: 2rem; color: var(--muted-color);">${message}</td></tr>`;
+        } else {
+            tableBody.innerHTML = rows;
+        }
+        
+        peopleShown += page.items.length;
+        peopleCursor = page.next_cursor;
+        const pluralLabel = peopleShown !== 1 ? 'people' : 'person';
+        countDiv.textContent = peopleCursor
+            ? `Showing: ${peopleShown} ${pluralLabel}, more available`
+            : `Total: ${peopleShown} ${pluralLabel}`;
+        if (peopleCursor) {
+            showElement(loadMoreBtn);
+        } else {
+            hideElement(loadMoreBtn);
+        }
         
     } catch (error) {
+        if (requestId !== peopleRequest) return;
         tableBody.innerHTML = `<tr><td colspan="4"><div class="result-message error">Error loading people: ${error.message}</div></td></tr>`;
         countDiv.textContent = '';
+        hideElement(loadMoreBtn);
+    } finally {
+        loadMoreBtn.disabled = false;
     }
 }
 
 function filterStudents() {
-    const searchInput = document.getElementById('student-search');
-    const filter = searchInput.value.toLowerCase();
-    const table = document.getElementById('students-table');
-    const rows = table.getElementsByTagName('tr');
-    let visibleCount = 0;
-    
-    for (let i = 1; i < rows.length; i++) {
-        const row = rows[i];
-        const studentId = row.getAttribute('data-student-id');
-        
-        if (studentId) {
-            if (studentId.includes(filter)) {
-                row.style.display = '';
-                visibleCount++;
-            } else {
-                row.style.display = 'none';
-            }
-        }
-    }
-    
-    const countDiv = document.getElementById('students-count');
-    const totalCount = rows.length - 1;
-    const pluralLabel = totalCount !== 1 ? 'people' : 'person';
-    if (filter) {
-        countDiv.textContent = `Showing: ${visibleCount} of ${totalCount} ${pluralLabel}`;
-    } else {
-        countDiv.textContent = `Total: ${totalCount} ${pluralLabel}`;
-    }
+    // Search runs on the server by ident prefix, once typing pauses
+    clearTimeout(peopleSearchTimer);
+    peopleSearchTimer = setTimeout(() => loadPeople(), 250);
 }
 
 async function handlePersonSubmit(event) {
@@ -567,11 +586,23 @@ async function handleFacialPunch() {
             const punchFormData = new FormData();
             punchFormData.append('ident', verifyResult.ident);
             punchFormData.append('image', blob, 'attendance.jpg');
+            if (verifyResult.facial_area) {
+                punchFormData.append('face_box', JSON.stringify(verifyResult.facial_area));
+            }
             
-            const punchResponse = await fetch('/api/punch', {
-                method: 'POST',
-                body: punchFormData
-            });
+            let punchResponse;
+            try {
+                punchResponse = await fetch('/api/punch', {
+                    method: 'POST',
+                    body: punchFormData
+                });
+            } catch (networkError) {
+                // Face was verified but the punch could not be sent: keep it for later
+                await queueOfflinePunch(verifyResult.ident, blob);
+                showAttendanceResult(true, verifyResult.ident);
+                speakFeedback('Attendance saved offline.', true);
+                return;
+            }
             
             if (punchResponse.ok) {
                 const punchResult = await punchResponse.json();
@@ -695,10 +726,25 @@ async function handleManualAttendance(event) {
     resultDiv.innerHTML = '<p>Recording attendance... <span class="loading"></span></p>';
     
     try {
-        const response = await fetch('/api/punch', {
-            method: 'POST',
-            body: formData
-        });
+        let response;
+        try {
+            response = await fetch('/api/punch', {
+                method: 'POST',
+                body: formData
+            });
+        } catch (networkError) {
+            const ident = formData.get('ident');
+            await queueOfflinePunch(ident, null);
+            resultDiv.innerHTML = `
+                <div class="result-message success">
+                    <h4>Saved Offline</h4>
+                    <p><strong>ID:</strong> ${ident}</p>
+                    <p>It will be sent automatically when the connection is back.</p>
+                </div>
+            `;
+            form.reset();
+            return;
+        }
         
         if (response.ok) {
             const result = await response.json();
@@ -722,3 +768,142 @@ async function handleManualAttendance(event) {
         resultDiv.innerHTML = `<div class="result-message error">Error: ${error.message}</div>`;
     }
 }
+
+// Offline punch queue: punches that cannot reach the server are kept in
+// IndexedDB and sent in chunks to /api/punch/batch once back online.
+const OFFLINE_DB_NAME = 'attendance-offline';
+const OFFLINE_STORE = 'punches';
+const OFFLINE_BATCH_SIZE = 100;
+const OFFLINE_RETRY_BASE_MS = 5000;
+const OFFLINE_RETRY_MAX_MS = 5 * 60 * 1000;
+let offlineDbPromise = null;
+let offlineFlushTimer = null;
+let offlineRetryDelay = OFFLINE_RETRY_BASE_MS;
+let offlineFlushing = false;
+
+function openOfflineDb() {
+    if (!offlineDbPromise) {
+        offlineDbPromise = new Promise((resolve, reject) => {
+            const request = indexedDB.open(OFFLINE_DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                const store = request.result.createObjectStore(OFFLINE_STORE, { keyPath: 'client_key' });
+                store.createIndex('queued_at', 'queued_at');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+    return offlineDbPromise;
+}
+
+function offlineStoreRequest(mode, operation) {
+    return openOfflineDb().then(db => new Promise((resolve, reject) => {
+        const tx = db.transaction(OFFLINE_STORE, mode);
+        const result = operation(tx.objectStore(OFFLINE_STORE));
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+async function queueOfflinePunch(ident, imageBlob) {
+    const clientKey = (crypto.randomUUID && crypto.randomUUID()) ||
+        `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    await offlineStoreRequest('readwrite', store => store.put({
+        client_key: clientKey,
+        ident: ident,
+        punch_time: new Date().toISOString(),
+        image: imageBlob || null,
+        queued_at: Date.now()
+    }));
+    updateOfflineQueueStatus();
+    scheduleOfflineFlush(offlineRetryDelay);
+}
+
+function readOfflinePunches(limit) {
+    return offlineStoreRequest('readonly', store => store.index('queued_at').getAll(null, limit));
+}
+
+function deleteOfflinePunches(clientKeys) {
+    return offlineStoreRequest('readwrite', store => {
+        clientKeys.forEach(key => store.delete(key));
+    });
+}
+
+async function updateOfflineQueueStatus() {
+    const statusEl = document.getElementById('offline-queue-status');
+    if (!statusEl) return;
+    try {
+        const count = await offlineStoreRequest('readonly', store => store.count());
+        statusEl.textContent = count ? `${count} punch(es) waiting to sync` : '';
+    } catch (error) {
+        statusEl.textContent = '';
+    }
+}
+
+function scheduleOfflineFlush(delayMs) {
+    if (offlineFlushTimer) return;
+    // Jitter spreads kiosks out so a network recovery is not a thundering herd
+    const jittered = delayMs / 2 + Math.random() * delayMs;
+    offlineFlushTimer = setTimeout(() => {
+        offlineFlushTimer = null;
+        flushOfflinePunches();
+    }, jittered);
+}
+
+async function flushOfflinePunches() {
+    if (offlineFlushing || !navigator.onLine) return;
+    offlineFlushing = true;
+    
+    try {
+        while (true) {
+            const batch = await readOfflinePunches(OFFLINE_BATCH_SIZE);
+            if (!batch.length) break;
+            
+            const formData = new FormData();
+            formData.append('punches', JSON.stringify(batch.map(p => ({
+                client_key: p.client_key,
+                ident: p.ident,
+                punch_time: p.punch_time
+            }))));
+            batch.forEach(p => {
+                if (p.image) {
+                    formData.append(`image:${p.client_key}`, p.image, `${p.client_key}.jpg`);
+                }
+            });
+            
+            const response = await fetch('/api/punch/batch', {
+                method: 'POST',
+                body: formData
+            });
+            if (!response.ok) {
+                throw new Error(await response.text());
+            }
+            
+            // Every record the server answered for is settled, including
+            // duplicates and rejections; retrying those would not help.
+            // A rejection without a client_key has nothing to delete
+            const result = await response.json();
+            await deleteOfflinePunches(result.results
+                .map(r => r.client_key)
+                .filter(key => typeof key === 'string'));
+            await updateOfflineQueueStatus();
+            
+            if (result.results.length === 0) break;
+        }
+        offlineRetryDelay = OFFLINE_RETRY_BASE_MS;
+    } catch (error) {
+        console.warn('Offline punch sync failed, will retry:', error);
+        offlineRetryDelay = Math.min(offlineRetryDelay * 2, OFFLINE_RETRY_MAX_MS);
+        scheduleOfflineFlush(offlineRetryDelay);
+    } finally {
+        offlineFlushing = false;
+        updateOfflineQueueStatus();
+    }
+}
+
+function initializeOfflineQueue() {
+    if (!('indexedDB' in window)) return;
+    window.addEventListener('online', () => scheduleOfflineFlush(OFFLINE_RETRY_BASE_MS));
+    updateOfflineQueueStatus();
+    scheduleOfflineFlush(OFFLINE_RETRY_BASE_MS);
+}
@@ -1,9 +1,11 @@
+import re
 import base64
 
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 from datetime import datetime
 from flask import jsonify
-from zoneinfo import ZoneInfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 def row_to_dict(row: Dict[str, Any]) -> Dict[str, Any]:
     """Convert database row to dictionary with base64 encoded bytes"""
@@ -22,6 +24,31 @@ def ok(data: Any = None, status: int = 200):
 
 TAIPEI_TZ = ZoneInfo("Asia/Taipei")
 
+STAFF_IDENT_PATTERN = re.compile(r'^(TEACHER|STAFF)\s+(.+)$')
+# Student format: {School}{Year} {FirstName} {LastName}, e.g. NTU2025 Vincent Cheng
+STUDENT_IDENT_PATTERN = re.compile(r'^([A-Z]+)(\d{4})\s+(.+)$')
+
+def parse_ident(ident: str) -> Tuple[str, str]:
+    """Split an ident into (cohort, name): TEACHER / STAFF, or school+year for students"""
+    staff_match = STAFF_IDENT_PATTERN.match(ident)
+    if staff_match:
+        return staff_match.group(1), staff_match.group(2).strip()
+    
+    student_match = STUDENT_IDENT_PATTERN.match(ident)
+    if student_match:
+        return f"{student_match.group(1)}{student_match.group(2)}", student_match.group(3).strip()
+    
+    # Fallback if pattern doesn't match
+    return ident, ident
+
+@lru_cache(maxsize=512)
+def zone_or_taipei(tz_name: Optional[str]) -> ZoneInfo:
+    """A person's time zone, or Asia/Taipei if it is missing or unknown (cached)"""
+    try:
+        return ZoneInfo(tz_name) if tz_name else TAIPEI_TZ
+    except (ZoneInfoNotFoundError, ValueError):
+        return TAIPEI_TZ
+
 def now_iso_seconds() -> str:
     return datetime.now(TAIPEI_TZ).replace(microsecond=0).isoformat()
 
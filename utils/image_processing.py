@@ -3,19 +3,30 @@ import numpy as np
 import cv2
 
 from flask import abort
-from typing import Tuple
+from typing import Dict, Tuple
 
+# codec name -> (file extension, content type, OpenCV quality flag)
+IMAGE_CODECS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "avif": (".avif", "image/avif", getattr(cv2, "IMWRITE_AVIF_QUALITY", None)),
+}
 
-def read_image_from_request(image_file, image_b64: str | None):
+_codec_support: Dict[str, bool] = {}
+
+
+def read_image_bytes_from_request(image_file, image_b64: str | None) -> bytes:
     if image_file and image_file.filename:
-        bytes_data = image_file.read()
+        return image_file.read()
     elif image_b64:
         if "," in image_b64:
             image_b64 = image_b64.split(",", 1)[1]
-        bytes_data = base64.b64decode(image_b64)
+        return base64.b64decode(image_b64)
     else:
         abort(400, "Please provide image file or image_base64")
 
+
+def decode_image(bytes_data: bytes) -> np.ndarray:
     arr = np.frombuffer(bytes_data, np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if img is None:
@@ -23,59 +34,173 @@ def read_image_from_request(image_file, image_b64: str | None):
     return img
 
 
-def optimize_image(
-    image: np.ndarray, max_width: int = 1024, max_height: int = 1024, quality: int = 85
-) -> Tuple[np.ndarray, dict]:
-    original_height, original_width = image.shape[:2]
-    original_size = image.nbytes
-
-    if original_width <= max_width and original_height <= max_height:
-        resized = image
-        resize_ratio = 1.0
-    else:
-        width_ratio = max_width / original_width
-        height_ratio = max_height / original_height
-        scale = min(width_ratio, height_ratio)
-
-        new_width = int(original_width * scale)
-        new_height = int(original_height * scale)
+def is_decodable(bytes_data: bytes) -> bool:
+    """Cheap check that decode_image will succeed: JPEGs decode at 1/8 scale"""
+    arr = np.frombuffer(bytes_data, np.uint8)
+    return arr.size > 0 and cv2.imdecode(arr, cv2.IMREAD_REDUCED_GRAYSCALE_8) is not None
 
-        resized = cv2.resize(
-            image, (new_width, new_height), interpolation=cv2.INTER_AREA
-        )
-        resize_ratio = scale
 
-    encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
-    is_success, buffer = cv2.imencode(".jpg", resized, encode_params)
+def read_image_from_request(image_file, image_b64: str | None):
+    return decode_image(read_image_bytes_from_request(image_file, image_b64))
+
+
+def resize_to_fit(image: np.ndarray, max_width: int, max_height: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    if width <= max_width and height <= max_height:
+        return image
+
+    scale = min(max_width / width, max_height / height)
+    return cv2.resize(
+        image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA
+    )
+
+
+def crop_face_thumbnail(
+    image: np.ndarray, face_box: Tuple[int, int, int, int], size: int = 160, margin: float = 0.3
+) -> np.ndarray:
+    """Square crop around an (x, y, w, h) face box, padded by margin and scaled to size x size"""
+    x, y, w, h = face_box
+    img_h, img_w = image.shape[:2]
+
+    side = min(int(max(w, h) * (1 + 2 * margin)), img_w, img_h)
+    center_x, center_y = x + w / 2, y + h / 2
+    left = int(round(min(max(center_x - side / 2, 0), img_w - side)))
+    top = int(round(min(max(center_y - side / 2, 0), img_h - side)))
+
+    crop = image[top:top + side, left:left + side]
+    interpolation = cv2.INTER_AREA if side > size else cv2.INTER_CUBIC
+    return cv2.resize(crop, (size, size), interpolation=interpolation)
+
+
+def is_jpeg(data: bytes | None) -> bool:
+    return bool(data) and data[:3] == b"\xff\xd8\xff"
+
+
+def _exif_orientation(exif: bytes) -> int:
+    # exif is an APP1 payload: "Exif\0\0" then a TIFF header; tag 0x0112 of IFD0
+    tiff = exif[6:]
+    order = "little" if tiff[:2] == b"II" else "big"
+    try:
+        ifd = int.from_bytes(tiff[4:8], order)
+        for i in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+            entry = ifd + 2 + i * 12
+            if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+                return int.from_bytes(tiff[entry + 8:entry + 10], order)
+    except (IndexError, ValueError):
+        pass
+    return 1
+
+
+def strip_jpeg_metadata(data: bytes) -> bytes | None:
+    """The JPEG without EXIF, XMP, IPTC and comment segments, losslessly
+
+    None when its EXIF orientation is not the default: the decoded image is
+    already rotated, so it has to be re-encoded instead.
+    """
+    out = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        segment = data[pos:pos + 2 + length]
+        if marker == 0xDA:
+            # Start of scan: the compressed data runs to the end
+            out.append(data[pos:])
+            return b"".join(out)
+        payload = segment[4:]
+        if marker == 0xE1 and payload.startswith(b"Exif\0\0") and _exif_orientation(payload) != 1:
+            return None
+        # APP1 (EXIF, XMP), APP13 (IPTC) and COM carry location, device and
+        # timestamps; JFIF, ICC profile and Adobe segments are kept
+        if marker not in (0xE1, 0xED, 0xFE):
+            out.append(segment)
+        pos += 2 + length
+    return None
+
+
+def codec_supported(codec: str) -> bool:
+    # OpenCV builds differ in which encoders they ship, so probe once
+    if codec not in _codec_support:
+        supported = False
+        if codec in IMAGE_CODECS and IMAGE_CODECS[codec][2] is not None:
+            try:
+                supported, _ = cv2.imencode(IMAGE_CODECS[codec][0], np.zeros((8, 8, 3), np.uint8))
+            except cv2.error:
+                supported = False
+        _codec_support[codec] = bool(supported)
+    return _codec_support[codec]
+
+
+def resolve_codec(codec: str) -> str:
+    codec = (codec or "jpeg").lower()
+    if codec == "jpg":
+        codec = "jpeg"
+    if codec != "jpeg" and not codec_supported(codec):
+        print(f"Image codec '{codec}' is not supported by this OpenCV build, using jpeg")
+        return "jpeg"
+    return codec
+
+
+def codec_extension(codec: str) -> str:
+    return IMAGE_CODECS[codec][0]
+
+
+def codec_content_type(codec: str) -> str:
+    return IMAGE_CODECS[codec][1]
+
+
+def encode_image(image: np.ndarray, codec: str = "jpeg", quality: int = 85) -> Tuple[bytes, int]:
+    extension, _, quality_flag = IMAGE_CODECS[codec]
+    is_success, buffer = cv2.imencode(extension, image, [quality_flag, quality])
 
     if not is_success:
-        raise Exception("Failed to encode optimized image")
-
-    optimized = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
-    compressed_size = buffer.nbytes
-
-    stats = {
-        "original_dimensions": (original_width, original_height),
-        "optimized_dimensions": (resized.shape[1], resized.shape[0]),
-        "original_size_bytes": original_size,
-        "compressed_size_bytes": compressed_size,
-        "compression_ratio": f"{(1 - compressed_size / original_size) * 100:.1f}%",
-        "size_reduction": original_size - compressed_size,
-        "resize_ratio": f"{resize_ratio:.2f}x",
-    }
+        raise Exception(f"Failed to encode image as {codec}")
 
-    return optimized, stats
+    image_bytes = buffer.tobytes()
+    return image_bytes, len(image_bytes)
 
 
-def compress_image_to_bytes(image: np.ndarray, quality: int = 85) -> Tuple[bytes, int]:
-    encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
-    is_success, buffer = cv2.imencode(".jpg", image, encode_params)
+def prepare_image_for_upload(
+    image: np.ndarray,
+    source_bytes: bytes | None = None,
+    max_width: int = 1024,
+    max_height: int = 1024,
+    quality: int = 85,
+    max_source_bytes: int = 250_000,
+    codec: str = "jpeg",
+) -> Tuple[bytes, dict]:
+    """Encode for upload with at most one resize and one encode, reusing a source JPEG that fits
+
+    A reused source is stripped of its metadata (GPS, device, orientation).
+    """
+    height, width = image.shape[:2]
+    within_dimensions = width <= max_width and height <= max_height
+
+    if (codec == "jpeg" and within_dimensions and is_jpeg(source_bytes)
+            and len(source_bytes) <= max_source_bytes):
+        stripped = strip_jpeg_metadata(source_bytes)
+        if stripped is not None:
+            return stripped, {
+                "codec": codec,
+                "reused_source": True,
+                "resized": False,
+                "dimensions": (width, height),
+                "size_bytes": len(stripped),
+            }
+
+    resized = resize_to_fit(image, max_width, max_height)
+    image_bytes, size = encode_image(resized, codec=codec, quality=quality)
+    return image_bytes, {
+        "codec": codec,
+        "reused_source": False,
+        "resized": not within_dimensions,
+        "dimensions": (resized.shape[1], resized.shape[0]),
+        "size_bytes": size,
+    }
 
-    if not is_success:
-        raise Exception("Failed to compress image")
 
-    image_bytes = buffer.tobytes()
-    return image_bytes, len(image_bytes)
+def compress_image_to_bytes(image: np.ndarray, quality: int = 85) -> Tuple[bytes, int]:
+    return encode_image(image, codec="jpeg", quality=quality)
 
 
 def l2_normalize(v: np.ndarray, eps: float = 1e-12) -> np.ndarray:
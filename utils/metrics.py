@@ -0,0 +1,76 @@
+import time
+import threading
+
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Sequence, Tuple
+
+DEFAULT_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed millisecond buckets"""
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, duration_ms: float):
+        index = bisect_left(self.buckets_ms, duration_ms)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum_ms += duration_ms
+            self._max_ms = max(self._max_ms, duration_ms)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            sum_ms = self._sum_ms
+            max_ms = self._max_ms
+
+        total = sum(counts)
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.buckets_ms, counts):
+            running += count
+            buckets[f"le_{bound}"] = running
+        buckets["le_inf"] = total
+
+        return {
+            "count": total,
+            "sum_ms": round(sum_ms, 1),
+            "avg_ms": round(sum_ms / total, 1) if total else 0.0,
+            "max_ms": round(max_ms, 1),
+            "buckets": buckets
+        }
+
+
+class RateMeter:
+    """Per-second rate over a sliding window, kept as one slot per second"""
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self._slots: Deque[Tuple[int, float]] = deque()
+        self._lock = threading.Lock()
+
+    def _expire(self, now_second: int):
+        while self._slots and self._slots[0][0] <= now_second - self.window_seconds:
+            self._slots.popleft()
+
+    def record(self, amount: float = 1):
+        now_second = int(time.monotonic())
+        with self._lock:
+            if self._slots and self._slots[-1][0] == now_second:
+                self._slots[-1] = (now_second, self._slots[-1][1] + amount)
+            else:
+                self._slots.append((now_second, amount))
+            self._expire(now_second)
+
+    def rate(self) -> float:
+        with self._lock:
+            self._expire(int(time.monotonic()))
+            total = sum(amount for _, amount in self._slots)
+        return round(total / self.window_seconds, 3)